@@ -13,9 +13,27 @@ import logging
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, List, Tuple, Optional
 import json
 import os
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from kline_store import KlineBuffer, KlineHistory
+from indicators import IndicatorState, atr_latest, ema_series, macd_series, rsi_series
+from batch_engine import BatchSignalEngine, a_point_range, stack_universe
+from range_index import RangeExtrema
+from notification_outbox import SignalDigest, TelegramOutbox
+from signal_journal import SignalJournal
+from signal_store import SignalStore
+from chart_renderer import CHART_KLINES, PATTERN_POINT_KEYS, ChartRenderPool, render_signal_chart
+from rate_limiter import RequestScheduler
+from http_client import HttpClient
+from exchange_adapters import BinanceAdapter, ExchangeError, ExchangeRouter, OkxAdapter
+from latency_slo import LatencySLO
+from kline_stream import BinanceKlineStream, KlineEvent
+from resampler import TIMEFRAME_MS, KlineResampler
 
 # 配置管理类 - 集成自config.py
 class Config:
@@ -32,6 +50,10 @@ class Config:
     # Telegram配置
     TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '8079021434:AAGcoQXZOxaBgkXPd6L9TKARegltWzTP3DU')
     TELEGRAM_CHANNEL_ID = os.getenv('TELEGRAM_CHANNEL_ID', '-1002434065698')
+    # 同时接收通知的其他频道（逗号分隔），图片只上传到 TELEGRAM_CHANNEL_ID 一次，其余频道按 file_id 转发
+    TELEGRAM_EXTRA_CHANNEL_IDS = [
+        channel.strip() for channel in os.getenv('TELEGRAM_EXTRA_CHANNEL_IDS', '').split(',') if channel.strip()
+    ]
     
     # 监控配置
     SYMBOLS = [
@@ -55,27 +77,105 @@ class Config:
     CACHE_A_POINT_START = 13  # A点范围开始（从最新收盘K线往左数）
     CACHE_A_POINT_END = 34    # A点范围结束
     CACHE_KLINES_COUNT = 200  # 缓存K线数量
+    INDICATOR_WARMUP_KLINES = 1000  # 指标预热K线数量（缓冲区容量）
     CHART_KLINES_COUNT = 55   # 图表显示K线数量
+    CHART_BARS_AFTER_SIGNAL = 5  # 补检信号的图表在B点之后多显示的K线数（窗口不超过最新K线）
     
     # API请求配置
     REQUEST_TIMEOUT = 10  # 请求超时时间（秒）
-    REQUEST_INTERVAL = 3  # 请求间隔时间（秒）
+    MAX_KLINES_PER_REQUEST = 1000  # 单次请求最多K线数量（币安上限）
+    FETCH_WORKERS = 16    # 获取K线的线程数（实际并发由请求调度器按剩余权重调整）
+    RATE_LIMIT_WEIGHT_PER_MINUTE = 6000  # 币安每分钟请求权重上限（按 X-MBX-USED-WEIGHT-1M 校正已用权重）
+    RATE_LIMIT_SAFETY = 0.8  # 最多使用权重上限的比例，超过时等待下一分钟，避免被限流
+    RATE_LIMIT_MIN_CONCURRENCY = 2  # 初始和最小并发请求数
+    OKX_RATE_LIMIT_PER_2S = 20  # OKX每2秒K线请求上限（历史K线接口为20次，近期接口为40次）
+    UPLOAD_TIMEOUT = 60   # 图片上传超时时间（秒）
     MAX_RETRIES = 2       # 最大重试次数
+    HTTP_POOL_SIZE = 16   # 每个主机的HTTP连接池大小（不小于 FETCH_WORKERS 才能全部复用连接）
+    HTTP_KEEP_ALIVE = True  # 是否复用长连接
     UPDATE_INTERVAL = 300 # 检测间隔时间（秒，默认5分钟）
     
+    # 收盘对齐调度：按交易所服务器时间在每根1小时K线收盘后 CANDLE_CLOSE_GUARD 秒开始一轮检测
+    CANDLE_CLOSE_GUARD = 1.0          # 收盘后的保护时间（秒），等交易所生成收盘K线
+    CANDLE_CLOSE_RETRIES = 3          # 收盘K线尚未生成的交易对在同一轮内的重试次数
+    CANDLE_CLOSE_RETRY_DELAY = 1.0    # 重试间隔（秒）
+    CLOCK_SYNC_SAMPLES = 3            # 每次时间同步的采样次数（取往返最快的一次）
+    NEAR_MISS_MARGIN = 0.1            # 形态距离不超过 1+该值 的交易对（差一点形成双顶/双底）下一轮优先获取和检测
+    LATENCY_SLO_SECONDS = 30          # 收盘到检测完成/信号发出的延迟目标（秒）
+    LATENCY_SLO_PERCENTILE = 95       # 按该百分位判断是否达标
+    LATENCY_SLO_WINDOW = 500          # 参与统计的最近样本数
+    
+    # 交易所路由：每次K线请求发往延迟最低的健康交易所，失败时依次切换（列表顺序为延迟相同时的优先级）
+    EXCHANGE_PRIORITY = [
+        exchange.strip() for exchange in os.getenv('EXCHANGE_PRIORITY', 'binance,okx').split(',') if exchange.strip()
+    ]
+    EXCHANGE_TIMEOUT = 5              # 单次K线请求超时时间（秒）
+    EXCHANGE_LATENCY_PRIOR = 1.0      # 尚未测量或长时间未使用的交易所按该延迟（秒）参与排序
+    EXCHANGE_FAILURE_THRESHOLD = 2    # 连续失败该次数后暂停使用该交易所
+    EXCHANGE_COOLDOWN = 30            # 首次暂停秒数，连续暂停时翻倍
+    EXCHANGE_MAX_COOLDOWN = 600       # 最长暂停秒数
+    EXCHANGE_PROBE_INTERVAL = 300     # 超过该秒数未使用的交易所重新参与排序
+    EXCHANGE_SWITCH_MARGIN = 0.5      # 其他交易所的延迟低于当前交易所的 1/(1+该值) 时才切换
+    
+    # K线获取方式：polling（每小时轮询REST）或 stream（WebSocket推送收盘K线）
+    INGESTION_MODE = os.getenv('INGESTION_MODE', 'polling')
+    STREAM_URL = os.getenv('STREAM_URL', 'wss://stream.binance.com:9443/stream')
+    STREAM_IDLE_TIMEOUT = 3900  # 推送静默超过该时间（秒）时执行一轮REST轮询兜底
+    STREAM_RECORD_PATH = os.getenv('STREAM_RECORD_PATH', '')  # 录制收盘K线推送，供回放使用
+    
+    # 漏检补查：停机或单轮超时后，补检上次检测之后收盘的K线
+    CATCH_UP_MAX_KLINES = 168  # 每个交易对最多补检的K线数量（只补检最近的部分）
+    # 由1小时K线在本地重采样并同样检测信号的高周期（逗号分隔，可选 4h/12h/1d，留空关闭）
+    # 冷启动时按其中最大的周期回填 (CACHE_KLINES_COUNT+1)*周期小时数 根1小时K线（日线约4800根，分页请求）；
+    # 从较短的旧历史热启动时，K线不足 CACHE_KLINES_COUNT 根的周期会告警并暂不检测
+    RESAMPLE_TIMEFRAMES = [
+        timeframe.strip() for timeframe in os.getenv('RESAMPLE_TIMEFRAMES', '4h,12h,1d').split(',') if timeframe.strip()
+    ]
+    
+    # 图表渲染进程池：检测和文字通知不等待绘图
+    CHART_WORKERS = 2      # 渲染进程数
+    CHART_QUEUE_SIZE = 16  # 排队和正在渲染的图表上限，超出时丢弃新图表
+    CHART_PROFILE = os.getenv('CHART_PROFILE', 'telegram')  # 发送用的输出配置（见 chart_renderer.OUTPUT_PROFILES）
+    CHART_ARCHIVE_PROFILE = os.getenv('CHART_ARCHIVE_PROFILE', '')  # 另存到 CHART_DIR 的输出配置，留空不存盘
+    
+    # Telegram发件箱：频道和群组每分钟最多20条，全部聊天合计每秒最多30条
+    TELEGRAM_SEND_WORKERS = 2             # 发送线程数
+    TELEGRAM_CHAT_RATE_PER_MINUTE = 20    # 每个聊天每分钟发送的消息数
+    TELEGRAM_CHAT_BURST = 3               # 每个聊天允许的突发消息数
+    TELEGRAM_GLOBAL_RATE_PER_SECOND = 30  # 全部聊天合计每秒发送的消息数
+    TELEGRAM_MAX_ATTEMPTS = 8             # 5xx或网络错误时的最多尝试次数
+    
+    # 通知模式：single 每个信号单独发送文字和图表；digest 把同一轮收盘的信号合并为汇总消息和媒体组
+    TELEGRAM_NOTIFY_MODE = os.getenv('TELEGRAM_NOTIFY_MODE', 'single')
+    DIGEST_WINDOW = 5          # 从第一个信号起收集同一批信号的秒数
+    DIGEST_MAX_WAIT = 30       # 等待图表渲染的最长秒数
+    DIGEST_GROUP_SIZE = 10     # 每个媒体组的图片数（Telegram上限10）
+    DIGEST_MAX_SIGNALS = 50    # 一批达到该信号数时不等窗口结束立即发送
+    
     # 文件路径配置
     LOG_DIR = os.getenv('LOG_DIR', "logs")
     CHART_DIR = os.getenv('CHART_DIR', "charts")
     DATA_DIR = os.getenv('DATA_DIR', "data")
+    KLINE_HISTORY_DIR = os.getenv('KLINE_HISTORY_DIR', os.path.join(DATA_DIR, "klines"))  # 磁盘K线历史目录
+    EVALUATION_STATE_FILE = os.getenv('EVALUATION_STATE_FILE', os.path.join(DATA_DIR, "last_evaluated.json"))  # 各交易对最后检测的K线
+    METRICS_FILE = os.getenv('METRICS_FILE', os.path.join(DATA_DIR, "metrics.json"))  # 每轮更新的运行指标（请求权重、交易所路由等）
+    OUTBOX_FILE = os.getenv('OUTBOX_FILE', os.path.join(DATA_DIR, "outbox.db"))  # 待发送的Telegram通知
+    SIGNAL_DB_FILE = os.getenv('SIGNAL_DB_FILE', os.path.join(DATA_DIR, "signals.db"))  # 历史信号库
+    SIGNAL_HISTORY_LIMIT = 200      # 每个交易对在内存中保留的最近信号数
+    SIGNAL_FSYNC_INTERVAL = 60      # 信号日志两次fsync之间的最长秒数
+    SIGNAL_FSYNC_BATCH = 100        # 未fsync的信号达到该条数时立即fsync
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')  # 日志级别配置
     
     # 交易所API端点
     EXCHANGE_ENDPOINTS = {
         "binance": {
-            "klines": "https://api.binance.com/api/v3/klines"
+            "klines": "https://api.binance.com/api/v3/klines",
+            "time": "https://api.binance.com/api/v3/time"
         },
         "okx": {
-            "klines": "https://www.okx.com/api/v5/market/candles"
+            "klines": "https://www.okx.com/api/v5/market/candles",
+            "history_klines": "https://www.okx.com/api/v5/market/history-candles",
+            "time": "https://www.okx.com/api/v5/public/time"
         }
     }
     
@@ -106,15 +206,16 @@ class Config:
         return True
     
     @classmethod
-    def get_symbol_mapping(cls, exchange: str) -> Dict[str, str]:
-        """获取交易对映射"""
+    def get_symbol_mapping(cls, exchange: str, symbols: List[str] = None) -> Dict[str, str]:
+        """获取交易对映射（默认为 SYMBOLS）"""
+        symbols = symbols or cls.SYMBOLS
         if exchange == "binance":
             # 币安不需要转换
-            return {symbol: symbol for symbol in cls.SYMBOLS}
+            return {symbol: symbol for symbol in symbols}
         elif exchange == "okx":
             # OKX使用不同的交易对格式
             mapping = {}
-            for symbol in cls.SYMBOLS:
+            for symbol in symbols:
                 if symbol.endswith("USDT"):
                     # BTCUSDT -> BTC-USDT
                     base = symbol[:-4]
@@ -123,7 +224,7 @@ class Config:
                     mapping[symbol] = symbol
             return mapping
         else:
-            return {symbol: symbol for symbol in cls.SYMBOLS}
+            return {symbol: symbol for symbol in symbols}
     
     @classmethod
     def create_directories(cls):
@@ -134,22 +235,42 @@ class Config:
                 os.makedirs(directory)
                 print(f"创建目录: {directory}")
 
+def create_http_client() -> HttpClient:
+    """按配置创建HTTP连接池客户端"""
+    return HttpClient(
+        pool_size=Config.HTTP_POOL_SIZE,
+        timeout=Config.REQUEST_TIMEOUT,
+        keep_alive=Config.HTTP_KEEP_ALIVE
+    )
+
 # TelegramBot类 - 集成自telegram_bot.py
 class TelegramBot:
     """Telegram Bot功能类"""
     
-    def __init__(self):
-        """初始化Telegram Bot"""
+    # 信号类型映射
+    SIGNAL_NAMES = {
+        'double_top': '双顶信号',
+        'double_bottom': '双底信号',
+        'uptrend': 'EMA上升趋势',
+        'downtrend': 'EMA下降趋势'
+    }
+    
+    def __init__(self, http_client: HttpClient = None):
+        """初始化Telegram Bot，http_client 为共享的连接池客户端"""
         self.bot_token = Config.TELEGRAM_BOT_TOKEN
         self.channel_id = Config.TELEGRAM_CHANNEL_ID
+        self.channel_ids = [self.channel_id] + [
+            channel for channel in Config.TELEGRAM_EXTRA_CHANNEL_IDS if channel != self.channel_id
+        ]
         self.base_url = f"https://api.telegram.org/bot{self.bot_token}"
         self.logger = logging.getLogger("TelegramBot")
+        self.http = http_client or create_http_client()
     
     def test_connection(self) -> bool:
         """测试Bot连接"""
         try:
             url = f"{self.base_url}/getMe"
-            response = requests.get(url, timeout=10)
+            response = self.http.get(url)
             
             if response.status_code == 200:
                 result = response.json()
@@ -178,7 +299,7 @@ class TelegramBot:
             if parse_mode:
                 payload['parse_mode'] = parse_mode
             
-            response = requests.post(url, json=payload, timeout=30)
+            response = self.http.post(url, json=payload)
             
             if response.status_code == 200:
                 result = response.json()
@@ -196,32 +317,32 @@ class TelegramBot:
             self.logger.error(f"发送消息异常: {str(e)}")
             return False
     
-    def send_photo(self, photo_path: str, caption: str = "", parse_mode: str = None) -> bool:
-        """发送图片"""
+    def send_photo(self, photo, caption: str = "", parse_mode: str = None, filename: str = "chart.png") -> bool:
+        """发送图片，photo 为文件路径或内存中的图片数据（bytes，文件名取 filename）"""
         try:
-            if not os.path.exists(photo_path):
-                self.logger.error(f"图片文件不存在: {photo_path}")
-                return False
+            if isinstance(photo, str):
+                if not os.path.exists(photo):
+                    self.logger.error(f"图片文件不存在: {photo}")
+                    return False
+                filename = os.path.basename(photo)
+                with open(photo, 'rb') as photo_file:
+                    photo = photo_file.read()
             
-            # 获取文件大小
-            file_size = os.path.getsize(photo_path)
-            self.logger.info(f"发送图片: {photo_path}, 大小: {file_size} bytes")
+            self.logger.info(f"发送图片: {filename}, 大小: {len(photo)} bytes")
             
             url = f"{self.base_url}/sendPhoto"
+            files = {'photo': (filename, photo)}
             
-            with open(photo_path, 'rb') as photo_file:
-                files = {'photo': photo_file}
-                
-                data = {
-                    'chat_id': self.channel_id,
-                    'caption': caption
-                }
-                
-                # 只在明确指定时添加parse_mode
-                if parse_mode:
-                    data['parse_mode'] = parse_mode
-                
-                response = requests.post(url, files=files, data=data, timeout=60)
+            data = {
+                'chat_id': self.channel_id,
+                'caption': caption
+            }
+            
+            # 只在明确指定时添加parse_mode
+            if parse_mode:
+                data['parse_mode'] = parse_mode
+            
+            response = self.http.post(url, files=files, data=data, timeout=Config.UPLOAD_TIMEOUT)
             
             if response.status_code == 200:
                 result = response.json()
@@ -243,16 +364,15 @@ class TelegramBot:
         """发送信号提醒"""
         try:
             # 格式化消息
-            message = self._format_signal_message(signal_info)
+            message = self.format_signal_message(signal_info)
             
             # 先发送文本消息
             if not self.send_message(message):
                 return False
             
             # 如果有图表，发送图片
-            if chart_path and os.path.exists(chart_path):
-                caption = f"{signal_info['symbol']} {signal_info['type']} 信号图表"
-                return self.send_photo(chart_path, caption)
+            if chart_path:
+                return self.send_signal_chart(signal_info, chart_path)
             
             return True
             
@@ -260,6 +380,32 @@ class TelegramBot:
             self.logger.error(f"发送信号提醒异常: {str(e)}")
             return False
     
+    def send_signal_chart(self, signal_info: Dict, chart, filename: str = "chart.png") -> bool:
+        """发送信号图表（图表异步渲染完成后单独发送），chart 为文件路径或图片数据"""
+        return self.send_photo(chart, self.format_chart_caption(signal_info), filename=filename)
+    
+    def format_chart_caption(self, signal_info: Dict) -> str:
+        """信号图表的说明文字"""
+        return f"{signal_info['symbol']} {signal_info.get('timeframe', '1h')} {signal_info['type']} 信号图表"
+    
+    def api_request(self, method: str, data: Dict, files: Dict = None) -> Tuple[int, Dict]:
+        """
+        调用一次Bot API（供发件箱使用，不做重试）
+        
+        Returns:
+            Tuple[int, Dict]: (HTTP状态码, 响应JSON)；网络异常直接抛出
+        """
+        url = f"{self.base_url}/{method}"
+        if files:
+            response = self.http.post(url, data=data, files=files, timeout=Config.UPLOAD_TIMEOUT)
+        else:
+            response = self.http.post(url, json=data)
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        return response.status_code, body
+    
     def send_system_status(self, status: str, message: str = "") -> bool:
         """发送系统状态"""
         try:
@@ -267,7 +413,9 @@ class TelegramBot:
                 "started": "🟢",
                 "stopped": "🔴", 
                 "error": "❌",
-                "warning": "⚠️"
+                "warning": "⚠️",
+                "recovered": "✅",
+                "info": "ℹ️"
             }
             
             icon = status_icons.get(status, "ℹ️")
@@ -284,7 +432,7 @@ class TelegramBot:
             self.logger.error(f"发送系统状态异常: {str(e)}")
             return False
     
-    def _format_signal_message(self, signal_info: Dict) -> str:
+    def format_signal_message(self, signal_info: Dict) -> str:
         """格式化信号消息"""
         try:
             symbol = signal_info['symbol']
@@ -292,29 +440,26 @@ class TelegramBot:
             price = signal_info['price']
             timestamp = signal_info['timestamp']
             
-            # 信号类型映射
-            type_mapping = {
-                'double_top': '双顶信号',
-                'double_bottom': '双底信号',
-                'uptrend': 'EMA上升趋势',
-                'downtrend': 'EMA下降趋势'
-            }
-            
-            signal_name = type_mapping.get(signal_type, signal_type)
+            signal_name = self.SIGNAL_NAMES.get(signal_type, signal_type)
             
             # 使用纯文本格式，避免特殊字符和Markdown解析错误
             message = f"[信号] {signal_name}\n"
             message += f"交易对: {symbol}\n"
+            if signal_info.get('timeframe', '1h') != '1h':
+                message += f"周期: {signal_info['timeframe']}\n"
             message += f"价格: {price:.4f}\n"
             
+            # 指标取信号所在周期的K线，高周期信号注明周期以免与1小时指标混淆
+            timeframe = signal_info.get('timeframe', '1h')
+            suffix = f"({timeframe})" if timeframe != '1h' else ""
             if 'ema21' in signal_info and signal_info['ema21']:
-                message += f"EMA21: {signal_info['ema21']:.4f}\n"
+                message += f"EMA21{suffix}: {signal_info['ema21']:.4f}\n"
             
             if 'ema55' in signal_info and signal_info['ema55']:
-                message += f"EMA55: {signal_info['ema55']:.4f}\n"
+                message += f"EMA55{suffix}: {signal_info['ema55']:.4f}\n"
             
             if 'atr' in signal_info and signal_info['atr']:
-                message += f"ATR: {signal_info['atr']:.4f}\n"
+                message += f"ATR{suffix}: {signal_info['atr']:.4f}\n"
             
             # 解析时间戳
             try:
@@ -323,11 +468,64 @@ class TelegramBot:
             except:
                 message += f"时间: {timestamp}"
             
+            if signal_info.get('late'):
+                message += f"\n补检信号，K线时间: {signal_info['kline_time'].replace('T', ' ')}"
+            
             return message
             
         except Exception as e:
             self.logger.error(f"格式化信号消息失败: {str(e)}")
             return f"信号提醒: {signal_info.get('symbol', 'Unknown')} - {signal_info.get('type', 'Unknown')}"
+    
+    def format_signal_line(self, signal_info: Dict) -> str:
+        """单行信号摘要，用于汇总消息和媒体组图片说明"""
+        symbol = signal_info['symbol']
+        if signal_info.get('timeframe', '1h') != '1h':
+            symbol += f" {signal_info['timeframe']}"
+        line = (f"{symbol} {self.SIGNAL_NAMES.get(signal_info['type'], signal_info['type'])} "
+                f"价格 {signal_info['price']:.4f}")
+        if signal_info.get('late'):
+            line += f"（补检，K线时间 {signal_info['kline_time'].replace('T', ' ')}）"
+        return line
+    
+    def format_digest_summary(self, signal_infos: List[Dict], limit: int = 4096) -> List[str]:
+        """把一批信号格式化为汇总消息，超过 limit 个字符时拆成多条"""
+        header = f"[信号汇总] {len(signal_infos)} 个信号，时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        messages = []
+        text = header
+        for signal_info in signal_infos:
+            line = f"• {self.format_signal_line(signal_info)}"
+            if len(text) + 1 + len(line) > limit:
+                messages.append(text)
+                text = f"[信号汇总 续]\n{line}"
+            else:
+                text += f"\n{line}"
+        messages.append(text)
+        return messages
+    
+    def send_media_group(self, photos: List[Tuple[bytes, str, str]]) -> bool:
+        """一次发送2到10张图片，photos 为 (图片数据, 文件名, 说明文字) 列表"""
+        try:
+            media = []
+            files = {}
+            for index, (image, filename, caption) in enumerate(photos):
+                field = f"photo{index}"
+                media.append({'type': 'photo', 'media': f"attach://{field}", 'caption': caption[:1024]})
+                files[field] = (filename, image)
+            
+            status, result = self.api_request('sendMediaGroup', {
+                'chat_id': self.channel_id,
+                'media': json.dumps(media, ensure_ascii=False)
+            }, files)
+            if status == 200 and result.get("ok"):
+                self.logger.info(f"媒体组发送成功: {len(photos)} 张图片")
+                return True
+            self.logger.error(f"媒体组发送失败: HTTP {status}, {result.get('description')}")
+            return False
+            
+        except Exception as e:
+            self.logger.error(f"发送媒体组异常: {str(e)}")
+            return False
 
 # 配置matplotlib支持中文显示
 plt.rcParams['font.sans-serif'] = ['SimHei', 'Arial Unicode MS', 'DejaVu Sans']
@@ -357,43 +555,180 @@ class KlineMonitor:
     主监控类，负责协调所有功能模块
     """
     
-    def __init__(self, symbols: List[str]):
+    def __init__(self, symbols: List[str], http_client: HttpClient = None):
         """
-        初始化监控器
+        初始化监控器，交易所和Telegram请求共享同一个连接池客户端
         """
         self.symbols = symbols
         self.data_cache = {}
-        self.signals = {}
+        self.signals = {}  # 每个交易对最近 SIGNAL_HISTORY_LIMIT 个信号，完整记录见信号日志
         self.logger = setup_logging()
+        self.journal = SignalJournal(
+            Config.DATA_DIR,
+            fsync_interval=Config.SIGNAL_FSYNC_INTERVAL,
+            fsync_batch=Config.SIGNAL_FSYNC_BATCH
+        )
+        
+        # 全部历史信号的SQLite信号库；首次启动时导入已有的信号日志和旧版每日JSON文件
+        self.signal_store = SignalStore(Config.SIGNAL_DB_FILE)
+        if not self.signal_store.count():
+            imported = self.signal_store.import_directory(Config.DATA_DIR)
+            if imported:
+                self.logger.info(f"已从 {Config.DATA_DIR} 导入 {imported} 条历史信号")
+        self.http = http_client or create_http_client()
         
         # 初始化Telegram Bot
         try:
-            self.telegram_bot = TelegramBot()
+            self.telegram_bot = TelegramBot(http_client=self.http)
             self.logger.info("Telegram Bot初始化成功")
         except Exception as e:
             self.logger.warning(f"Telegram Bot初始化失败: {str(e)}")
             self.telegram_bot = None
         
-        # 交易所API配置
-        self.exchanges = {
-            "binance": "https://api.binance.com/api/v3/klines",
-            "okx": "https://www.okx.com/api/v5/market/candles"
+        # 信号通知先写入持久化发件箱，由后台线程按Telegram限流规则发送（每个频道至少一个发送线程）
+        self.outbox = None
+        if self.telegram_bot:
+            self.outbox = TelegramOutbox(
+                self.telegram_bot,
+                Config.OUTBOX_FILE,
+                workers=max(Config.TELEGRAM_SEND_WORKERS, len(self.telegram_bot.channel_ids)),
+                chat_rate_per_minute=Config.TELEGRAM_CHAT_RATE_PER_MINUTE,
+                chat_burst=Config.TELEGRAM_CHAT_BURST,
+                global_rate_per_second=Config.TELEGRAM_GLOBAL_RATE_PER_SECOND,
+                max_attempts=Config.TELEGRAM_MAX_ATTEMPTS
+            )
+            self.outbox.start()
+        
+        # 汇总模式：同一轮收盘的信号合并为一条汇总消息和若干媒体组
+        self.digest = None
+        if self.outbox and Config.TELEGRAM_NOTIFY_MODE == "digest":
+            self.digest = SignalDigest(
+                self.outbox,
+                window=Config.DIGEST_WINDOW,
+                max_wait=Config.DIGEST_MAX_WAIT,
+                group_size=Config.DIGEST_GROUP_SIZE,
+                max_signals=Config.DIGEST_MAX_SIGNALS
+            )
+            self.digest.start()
+        
+        # 所有线程共享的请求调度器：按响应头中的已用权重调整并发，预算不足时等待下一个窗口
+        # 窗口按交易所服务器时间对齐（路由在下面创建，调度器只在请求时读取时间）
+        self.rate_limiter = RequestScheduler(
+            Config.RATE_LIMIT_WEIGHT_PER_MINUTE,
+            window=60,
+            safety=Config.RATE_LIMIT_SAFETY,
+            max_concurrency=Config.FETCH_WORKERS,
+            min_concurrency=Config.RATE_LIMIT_MIN_CONCURRENCY,
+            used_header="X-MBX-USED-WEIGHT-1M",
+            clock=self._exchange_time
+        )
+        # OKX公开行情接口不返回已用额度，只按本地计数和429退避
+        self.okx_rate_limiter = RequestScheduler(
+            Config.OKX_RATE_LIMIT_PER_2S,
+            window=2,
+            safety=Config.RATE_LIMIT_SAFETY,
+            max_concurrency=Config.FETCH_WORKERS,
+            min_concurrency=Config.RATE_LIMIT_MIN_CONCURRENCY,
+            clock=self._exchange_time
+        )
+        
+        # 交易所适配器：每次K线请求发往延迟最低的健康交易所，失败时自动切换
+        adapters = {
+            "binance": BinanceAdapter(
+                self.http, Config.EXCHANGE_ENDPOINTS["binance"], self.rate_limiter,
+                timeout=Config.EXCHANGE_TIMEOUT,
+                symbol_map=Config.get_symbol_mapping("binance", symbols)
+            ),
+            "okx": OkxAdapter(
+                self.http, Config.EXCHANGE_ENDPOINTS["okx"],
+                self.okx_rate_limiter,
+                timeout=Config.EXCHANGE_TIMEOUT,
+                symbol_map=Config.get_symbol_mapping("okx", symbols)
+            )
         }
-        self.current_exchange = "binance"
+        self.exchange_router = ExchangeRouter(
+            [adapters[name] for name in Config.EXCHANGE_PRIORITY if name in adapters],
+            latency_prior=Config.EXCHANGE_LATENCY_PRIOR,
+            failure_threshold=Config.EXCHANGE_FAILURE_THRESHOLD,
+            cooldown=Config.EXCHANGE_COOLDOWN,
+            max_cooldown=Config.EXCHANGE_MAX_COOLDOWN,
+            probe_interval=Config.EXCHANGE_PROBE_INTERVAL,
+            switch_margin=Config.EXCHANGE_SWITCH_MARGIN
+        )
+        # 收盘到检测完成、到信号发出的延迟统计（按交易所服务器时间）
+        self.started_ms = time.time() * 1000
+        self.latency_slo = LatencySLO(
+            Config.LATENCY_SLO_SECONDS,
+            percentile=Config.LATENCY_SLO_PERCENTILE,
+            window=Config.LATENCY_SLO_WINDOW
+        )
+        self.fetch_executor = ThreadPoolExecutor(
+            max_workers=Config.FETCH_WORKERS,
+            thread_name_prefix="kline-fetch"
+        )
+        
+        # 图表在独立进程中渲染，渲染完成后加入发件箱
+        self.chart_pool = ChartRenderPool(Config.CHART_WORKERS, Config.CHART_QUEUE_SIZE)
+        
+        # 全市场批量信号引擎
+        self.batch_engine = BatchSignalEngine(
+            a_point_start=Config.CACHE_A_POINT_START,
+            a_point_end=Config.CACHE_A_POINT_END,
+            atr_period=Config.ATR_PERIOD,
+            atr_threshold=Config.DOUBLE_PATTERN_ATR_THRESHOLD,
+            depth_threshold=Config.DOUBLE_PATTERN_DEPTH_THRESHOLD,
+            convergence_threshold=Config.EMA_CONVERGENCE_THRESHOLD,
+            convergence_lookback=Config.EMA_CONVERGENCE_LOOKBACK,
+            rsi_period=Config.RSI_PERIOD,
+            macd_params=(Config.MACD_FAST, Config.MACD_SLOW, Config.MACD_SIGNAL)
+        )
         
         # 初始化数据结构
         for symbol in symbols:
-            self.data_cache[symbol] = {
-                'klines': [],
-                'A_top': None,
-                'A_bottom': None,
-                'A_top_index': None,
-                'A_bottom_index': None,
-                'ema21': None,
-                'ema55': None,
-                'atr': None,
-                'last_update': None
-            }
+            self.data_cache[symbol] = self._new_cache_entry(symbol)
+        self._load_evaluation_state()
+    
+    def _new_cache_entry(self, symbol: str) -> Dict:
+        """创建交易对的缓存结构"""
+        # 缓冲区保留足够的历史K线用于指标预热
+        capacity = max(Config.CACHE_KLINES_COUNT, Config.INDICATOR_WARMUP_KLINES)
+        return {
+            'klines': KlineBuffer(capacity),
+            'A_top': None,
+            'A_bottom': None,
+            'A_top_index': None,
+            'A_bottom_index': None,
+            'ema21': None,
+            'ema55': None,
+            'ema144': None,
+            'atr': None,
+            'indicators': self._new_indicator_state(),
+            'extrema': RangeExtrema(capacity),
+            'history': self._open_history(symbol),
+            'timeframes': {timeframe: KlineResampler(timeframe, capacity) for timeframe in Config.RESAMPLE_TIMEFRAMES},
+            'last_evaluated': None,
+            'evaluated_close': None,    # 本轮计入延迟统计的收盘时间（毫秒）
+            'near_miss': float('inf'),  # 上次检测的形态距离，见 BatchSignalEngine.evaluate
+            'last_update': None
+        }
+    
+    def _open_history(self, symbol: str) -> Optional[KlineHistory]:
+        """打开交易对的磁盘K线历史，目录不可写时退化为只用内存缓存"""
+        try:
+            return KlineHistory(Config.KLINE_HISTORY_DIR, symbol, "1h")
+        except OSError as e:
+            self.logger.warning(f"{symbol} 无法打开K线历史: {str(e)}")
+            return None
+    
+    def _new_indicator_state(self) -> IndicatorState:
+        """创建交易对的增量指标状态"""
+        return IndicatorState(
+            ema_periods=(21, 55, 144),
+            atr_period=Config.ATR_PERIOD,
+            rsi_period=Config.RSI_PERIOD,
+            macd_params=(Config.MACD_FAST, Config.MACD_SLOW, Config.MACD_SIGNAL),
+            lookback=Config.EMA_CONVERGENCE_LOOKBACK
+        )
     
     def run(self):
         """主运行循环"""
@@ -411,156 +746,483 @@ class KlineMonitor:
             except Exception as e:
                 self.logger.error(f"发送启动通知失败: {str(e)}")
         
-        # 步骤1：初始化所有交易对
-        for symbol in self.symbols:
-            self.logger.info(f"初始化交易对: {symbol}")
-            if not self.initialize_symbol(symbol):
+        # 按交易所服务器时间判断K线是否收盘和安排每轮检测
+        self.sync_clock()
+        
+        # 步骤1：并发初始化所有交易对（请求速率由请求调度器控制）
+        self.logger.info(f"初始化交易对: {len(self.symbols)} 个")
+        results = self.fetch_all(self.initialize_symbol, self.symbols)
+        for symbol, success in results.items():
+            if not success:
                 self.logger.error(f"初始化失败: {symbol}")
-                continue
-            time.sleep(2)  # 避免API限制
         
         # 步骤2：开始实时监控循环
+        if Config.INGESTION_MODE == "stream":
+            self.run_streaming()
+            return
+        
         while True:
             try:
-                for symbol in self.symbols:
-                    self.logger.info(f"检查交易对: {symbol}")
-                    
-                    # 步骤3：更新数据
-                    if not self.update_symbol_data(symbol):
-                        self.logger.error(f"数据更新失败: {symbol}")
-                        continue
-                    
-                    # 步骤4：检查双顶/双底形态
-                    pattern_signal = self.check_double_pattern(symbol)
-                    if pattern_signal:
-                        self.handle_signal(symbol, pattern_signal)
-                    
-                    # 步骤5：检查EMA趋势
-                    trend_signal = self.check_ema_trend(symbol)
-                    if trend_signal:
-                        self.handle_signal(symbol, trend_signal)
-                    
-                    time.sleep(3)  # 每个交易对间隔3秒
-                
-                # 保存信号数据
-                self.save_signals_to_file()
-                
-                # 等待下一个小时的05秒
-                self.wait_for_next_hour()
+                self.poll_once()
                 
+                # 等待下一根K线收盘（交易所服务器时间）后 CANDLE_CLOSE_GUARD 秒
+                self.wait_for_next_close()
+            
             except Exception as e:
                 self.logger.error(f"监控循环异常: {str(e)}")
                 time.sleep(60)  # 出错后等待1分钟
     
-    def wait_for_next_hour(self):
-        """等待到下一个小时的05秒"""
-        from datetime import datetime, timedelta
+    def poll_once(self):
+        """
+        轮询一轮：通过REST更新所有交易对并批量检测信号
         
-        now = datetime.now()
-        # 计算下一个小时的05秒
-        next_hour = now.replace(minute=0, second=5, microsecond=0) + timedelta(hours=1)
+        上一轮差一点形成双顶/双底的交易对（形态距离不超过 1 + NEAR_MISS_MARGIN）先单独获取、
+        检测并发出信号，其余交易对随后处理；收盘K线尚未生成的交易对在本轮内重试。
+        """
+        limit = 1 + Config.NEAR_MISS_MARGIN
+        priority = sorted((symbol for symbol in self.symbols if self.data_cache[symbol]['near_miss'] <= limit),
+                          key=lambda symbol: self.data_cache[symbol]['near_miss'])
+        waves = [priority, [symbol for symbol in self.symbols if symbol not in priority]]
+        if priority:
+            self.logger.info(f"优先检测接近形成形态的交易对: {', '.join(priority)}")
         
-        # 如果当前时间已经过了本小时的05秒，则等待到下一个小时的05秒
-        if now.second >= 5 and now.minute == 0:
-            # 如果当前正好是某小时的05秒之后，等待到下一个小时
-            pass
-        elif now.minute == 0 and now.second < 5:
-            # 如果当前是某小时的00-04秒，等待到本小时的05秒
-            next_hour = now.replace(second=5, microsecond=0)
+        started = time.monotonic()
+        updated = 0
+        for wave in waves:
+            if not wave:
+                continue
+            # 步骤3：并发更新本批交易对数据
+            updated_symbols = self._update_symbols(wave)
+            updated += len(updated_symbols)
+            
+            # 步骤4/5：批量检查双顶/双底形态和EMA趋势（含上次检测之后漏掉的K线）
+            for symbol, signal_type, late in self.detect_pending_signals(updated_symbols):
+                self.handle_signal(symbol, signal_type, late)
         
-        wait_seconds = (next_hour - now).total_seconds()
+        self.logger.info(f"数据更新完成: {updated}/{len(self.symbols)}，"
+                         f"耗时 {time.monotonic() - started:.2f} 秒")
+        self.logger.info(f"HTTP连接统计: {self.http.format_stats()}")
+        self.logger.info(f"交易所路由: {self.exchange_router.format_stats()}")
+        self.logger.info(f"请求权重: binance {self.rate_limiter.format_stats()}；okx {self.okx_rate_limiter.format_stats()}")
+        self.logger.info(f"图表渲染统计: {self.chart_pool.format_stats()}")
+        if self.outbox:
+            self.logger.info(f"通知发件箱: {self.outbox.format_stats()}")
+        if self.digest:
+            self.logger.info(f"信号汇总: {self.digest.format_stats()}")
+        self.logger.info(f"收盘延迟: {self.latency_slo.format_stats()}")
         
-        self.logger.info(f"本轮检测完成，等待到 {next_hour.strftime('%H:%M:%S')} 开始下一轮检测...")
-        self.logger.info(f"等待时间: {wait_seconds:.1f} 秒")
+        # 保存信号数据
+        self.save_signals_to_file()
+        self._check_latency_slo()
+        self.export_metrics()
+    
+    def _update_symbols(self, symbols: List[str]) -> List[str]:
+        """
+        并发更新一批交易对，返回更新成功的交易对（保持原顺序）
         
-        time.sleep(wait_seconds)
+        交易所在收盘后可能稍晚才生成收盘K线，这类交易对间隔 CANDLE_CLOSE_RETRY_DELAY 秒
+        重试，最多 CANDLE_CLOSE_RETRIES 次
+        """
+        results = self.fetch_all(self.update_symbol_data, symbols)
+        for _ in range(Config.CANDLE_CLOSE_RETRIES):
+            failed = [symbol for symbol in symbols if not results[symbol]]
+            if not failed:
+                break
+            time.sleep(Config.CANDLE_CLOSE_RETRY_DELAY)
+            results.update(self.fetch_all(self.update_symbol_data, failed))
+        
+        updated_symbols = []
+        for symbol in symbols:
+            if results[symbol]:
+                updated_symbols.append(symbol)
+            else:
+                self.logger.error(f"数据更新失败: {symbol}")
+        return updated_symbols
     
-    def switch_exchange(self):
-        """切换交易所"""
-        if self.current_exchange == "binance":
-            self.current_exchange = "okx"
+    def _check_latency_slo(self):
+        """收盘延迟超过或恢复到目标时记录日志并发送系统状态通知"""
+        message = self.latency_slo.check()
+        if not message:
+            return
+        breached = self.latency_slo.stats()['breached']
+        if breached:
+            self.logger.warning(message)
         else:
-            self.current_exchange = "binance"
-        self.logger.info(f"切换到交易所: {self.current_exchange}")
+            self.logger.info(message)
+        if self.telegram_bot:
+            try:
+                self.telegram_bot.send_system_status("warning" if breached else "recovered", message)
+            except Exception as e:
+                self.logger.error(f"发送延迟告警失败: {str(e)}")
     
-    def fetch_klines(self, symbol: str, interval: str = "1h", limit: int = 300) -> Optional[List]:
-        """获取K线数据"""
+    def export_metrics(self):
+        """把请求权重使用情况、交易所路由、时钟偏差和收盘延迟写入 METRICS_FILE（JSON，先写临时文件再替换）"""
+        metrics = {
+            'updated_at': datetime.now().isoformat(),
+            'rate_limits': {
+                'binance': self.rate_limiter.stats(),
+                'okx': self.okx_rate_limiter.stats()
+            },
+            'exchanges': self.exchange_router.stats(),
+            'clock': {
+                'offset_ms': round(self.exchange_router.clock_offset_ms, 1),
+                'rtt_ms': None if self.exchange_router.clock_rtt_ms is None else round(self.exchange_router.clock_rtt_ms, 1)
+            },
+            'latency': self.latency_slo.stats()
+        }
+        try:
+            directory = os.path.dirname(Config.METRICS_FILE)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = Config.METRICS_FILE + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(metrics, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, Config.METRICS_FILE)
+        except OSError as e:
+            self.logger.warning(f"保存运行指标失败: {str(e)}")
+    
+    def run_streaming(self):
+        """
+        推送模式主循环
+        
+        WebSocket连接线程只负责把已收盘K线放入队列，所有缓存更新和信号
+        检测都在当前线程中按到达顺序执行，每条K线只检测对应的交易对。
+        REST仅用于补齐缺口；推送长时间静默时执行一轮完整轮询兜底。
+        """
+        events = queue.Queue()
+        stream = BinanceKlineStream(
+            self.symbols, "1h",
+            on_closed_kline=events.put,
+            url=Config.STREAM_URL,
+            on_reconnect=events.put,
+            record_path=Config.STREAM_RECORD_PATH or None
+        )
+        stream.start()
+        self.logger.info(f"推送模式已启动: {Config.STREAM_URL}")
+        
         try:
-            if self.current_exchange == "binance":
-                url = self.exchanges["binance"]
-                params = {
-                    'symbol': symbol,
-                    'interval': interval,
-                    'limit': limit
-                }
-                response = requests.get(url, params=params, timeout=10)
+            while True:
+                try:
+                    item = events.get(timeout=Config.STREAM_IDLE_TIMEOUT)
+                except queue.Empty:
+                    item = None
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    return [{
-                        'timestamp': int(item[0]),
-                        'open': float(item[1]),
-                        'high': float(item[2]),
-                        'low': float(item[3]),
-                        'close': float(item[4]),
-                        'volume': float(item[5])
-                    } for item in data]
+                # 兜底轮询出错时与事件处理一样只记录日志，推送和主循环继续运行
+                try:
+                    if item is None:
+                        self.logger.warning(f"超过 {Config.STREAM_IDLE_TIMEOUT} 秒未收到收盘K线，执行一轮REST轮询")
+                        self.poll_once()
+                        continue
+                    
+                    if isinstance(item, KlineEvent):
+                        signals = self.process_closed_kline(item)
+                    else:
+                        # 断线重连：补齐该连接下所有交易对可能漏掉的K线
+                        results = self.fetch_all(self.update_symbol_data, item)
+                        signals = self.detect_pending_signals([symbol for symbol in item if results[symbol]])
+                    
+                    for symbol, signal_type, late in signals:
+                        self.handle_signal(symbol, signal_type, late)
+                    if signals:
+                        self.save_signals_to_file()
+                    self._check_latency_slo()
+                    self.export_metrics()
+                except Exception as e:
+                    self.logger.error(f"推送事件处理异常: {str(e)}")
+        finally:
+            stream.stop()
+    
+    def process_closed_kline(self, event: KlineEvent) -> List[Tuple[str, str, Optional[Dict]]]:
+        """
+        处理一根推送的已收盘K线并只检测该交易对
+        
+        Returns:
+            List[Tuple[str, str, Optional[Dict]]]: (交易对, 信号类型, 补检信息)，见 detect_pending_signals
+        """
+        symbol = event.symbol
+        if symbol not in self.data_cache:
+            return []
+        
+        buffer = self.data_cache[symbol]['klines']
+        last_timestamp = buffer.last_timestamp
+        if last_timestamp is not None and event.row[0] <= last_timestamp:
+            return []  # 重复推送
+        
+        interval_ms = TIMEFRAME_MS['1h']
+        if last_timestamp is None:
+            success = self.initialize_symbol(symbol)
+        elif event.row[0] - last_timestamp == interval_ms:
+            success = self.apply_klines(symbol, event.row[None, :])
+        else:
+            missing = int((event.row[0] - last_timestamp) // interval_ms) - 1
+            self.logger.warning(f"{symbol} 推送K线存在缺口（{missing} 根），通过REST补齐")
+            klines = self.fetch_klines_range(symbol, last_timestamp + interval_ms, int(event.row[0]) - interval_ms)
+            success = klines is not None and self.apply_klines(symbol, np.vstack([klines, event.row]))
+        
+        if not success:
+            self.logger.error(f"数据更新失败: {symbol}")
+            return []
+        
+        signals = self.detect_pending_signals([symbol])
+        latency_ms = self.exchange_router.now_ms() - event.close_time
+        self.logger.info(f"{symbol} 收盘K线处理完成，距收盘 {latency_ms:.0f}ms")
+        return signals
+    
+    def fetch_all(self, func: Callable[[str], bool], symbols: List[str]) -> Dict[str, bool]:
+        """
+        在线程池中对所有交易对并发执行获取任务
+        
+        Args:
+            func: 以交易对为参数、返回是否成功的函数
+            symbols: 交易对列表
             
-            return None
+        Returns:
+            Dict[str, bool]: 每个交易对的执行结果
+        """
+        futures = {symbol: self.fetch_executor.submit(func, symbol) for symbol in symbols}
+        results = {}
+        for symbol, future in futures.items():
+            try:
+                results[symbol] = bool(future.result())
+            except Exception as e:
+                self.logger.error(f"{symbol} 获取任务异常: {str(e)}")
+                results[symbol] = False
+        return results
+    
+    def sync_clock(self):
+        """与交易所服务器时间同步，记录本地时钟偏差"""
+        offset = self.exchange_router.sync_clock(Config.CLOCK_SYNC_SAMPLES)
+        rtt = self.exchange_router.clock_rtt_ms
+        self.logger.info(f"交易所时间同步: 偏差 {offset:+.0f}ms" + (f"，往返 {rtt:.0f}ms" if rtt is not None else ""))
+    
+    def wait_for_next_close(self):
+        """
+        等待到下一根1小时K线收盘后 CANDLE_CLOSE_GUARD 秒（按交易所服务器时间）
+        
+        先睡到收盘前约30秒，重新同步时间后再睡剩余部分，长时间等待中的时钟漂移不影响触发时间
+        """
+        while True:
+            now_ms = self.exchange_router.now_ms()
+            next_close = (int(now_ms) // 3600000 + 1) * 3600000
+            wait_seconds = (next_close - now_ms) / 1000 + Config.CANDLE_CLOSE_GUARD
+            if wait_seconds <= 60:
+                break
+            self.logger.info(f"本轮检测完成，下一根K线收盘于 "
+                             f"{datetime.fromtimestamp(next_close / 1000).strftime('%H:%M:%S')}，等待 {wait_seconds:.1f} 秒")
+            time.sleep(wait_seconds - 30)
+            self.sync_clock()
+        
+        time.sleep(max(0.0, wait_seconds))
+    
+    @property
+    def current_exchange(self) -> str:
+        """下一次K线请求首先尝试的交易所"""
+        return self.exchange_router.preferred
+    
+    def switch_exchange(self):
+        """切换交易所：暂停当前首选的交易所，之后的请求由路由发往其他交易所"""
+        self.exchange_router.suspend(self.current_exchange)
+        self.logger.info(f"切换到交易所: {self.current_exchange}")
+    
+    def fetch_klines(self, symbol: str, interval: str = "1h", limit: int = 300,
+                     start_time: int = None, end_time: int = None) -> Optional[np.ndarray]:
+        """
+        获取已收盘K线数据，返回 (n, 6) 数组，列顺序为 timestamp/open/high/low/close/volume
+        
+        指定 start_time/end_time（开盘时间，毫秒，含）时返回该范围内最早的 limit 根，
+        否则返回最新的 limit 根。请求由 exchange_router 发往延迟最低的健康交易所，
+        失败时自动切换到其他交易所，全部失败时返回None
+        """
+        try:
+            klines, _ = self.exchange_router.fetch_klines(symbol, interval, limit, start_time, end_time)
+            return klines
             
+        except ExchangeError as e:
+            self.logger.error(f"获取K线数据失败 {symbol}: {str(e)}")
+            return None
         except Exception as e:
             self.logger.error(f"获取K线数据失败 {symbol}: {str(e)}")
             return None
     
+    def fetch_klines_range(self, symbol: str, start_time: int, end_time: int = None) -> Optional[np.ndarray]:
+        """
+        分页获取开盘时间在 [start_time, end_time] 内的已收盘K线
+        
+        Args:
+            symbol: 交易对
+            start_time: 起始开盘时间（毫秒）
+            end_time: 结束开盘时间（毫秒），None表示到最新一根已收盘K线
+            
+        Returns:
+            np.ndarray: (n, 6) 数组，任一页请求失败时返回None
+        """
+        if end_time is None:
+            end_time = self._latest_closed_time()
+        
+        pages = []
+        cursor = int(start_time)
+        while cursor <= end_time:
+            # 只请求缺少的数量，缺口超过单次上限时分页
+            remaining = (end_time - cursor) // 3600000 + 1
+            limit = int(min(remaining, Config.MAX_KLINES_PER_REQUEST))
+            klines = self.fetch_klines(symbol, "1h", limit, start_time=cursor, end_time=end_time)
+            if klines is None:
+                return None
+            klines = klines[klines[:, 0] >= cursor]
+            if len(klines) == 0:
+                break
+            pages.append(klines)
+            cursor = int(klines[-1, 0]) + 3600000
+        
+        return np.vstack(pages) if pages else np.empty((0, 6))
+    
+    def _exchange_time(self) -> float:
+        """交易所服务器时间（秒），供请求调度器对齐权重窗口"""
+        return self.exchange_router.now_ms() / 1000
+    
+    def _latest_closed_time(self) -> int:
+        """最新一根已收盘K线的开盘时间（毫秒，按交易所服务器时间）"""
+        return (int(self.exchange_router.now_ms()) // 3600000 - 1) * 3600000
+    
     def initialize_symbol(self, symbol: str) -> bool:
-        """步骤1：初始化交易对，缓存200根K线并找出A点"""
-        klines = self.fetch_klines(symbol, "1h", 200)
-        if not klines or len(klines) < 200:
+        """步骤1：初始化交易对，优先从磁盘历史恢复，否则缓存已收盘K线并找出A点"""
+        if self._warm_start(symbol):
+            return True
+        
+        # 一次性回填足够的1小时K线，使各高周期重采样后也有 CACHE_KLINES_COUNT 根，超过单次上限时分页
+        cache = self.data_cache[symbol]
+        buffer = cache['klines']
+        count = max(buffer.capacity, self._backfill_count())
+        end_time = self._latest_closed_time()
+        klines = self.fetch_klines_range(symbol, end_time - (count - 1) * 3600000, end_time)
+        if klines is None or len(klines) < Config.CACHE_KLINES_COUNT:
             return False
         
-        self.data_cache[symbol]['klines'] = klines
+        buffer.clear()
+        buffer.extend(klines)
+        cache['indicators'].reset()
+        cache['extrema'].reset()
         self._calculate_ab_points(symbol)
         self._calculate_indicators(symbol)
+        # 不足以热启动的旧历史整体重写，否则更早的回填K线会因早于已有历史而被忽略
+        if cache['history'] is not None and len(cache['history']):
+            try:
+                cache['history'].clear()
+            except OSError as e:
+                self.logger.warning(f"{symbol} 清空K线历史失败: {str(e)}")
+        self._persist_klines(symbol, klines)
+        self._resample(symbol, rebuild=True, klines=klines)
         
-        self.logger.info(f"{symbol} 初始化完成，缓存了 {len(klines)} 根K线")
+        self.logger.info(f"{symbol} 初始化完成，回填 {len(klines)} 根K线，缓存了 {len(buffer)} 根")
         return True
     
+    def _backfill_count(self) -> int:
+        """冷启动回填的1小时K线数量：最大的重采样周期也能得到 CACHE_KLINES_COUNT 根已收盘K线"""
+        ratios = [TIMEFRAME_MS[timeframe] // 3600000 for timeframe in Config.RESAMPLE_TIMEFRAMES]
+        # 多一个周期，抵消开头不完整和末尾正在形成的K线
+        return (Config.CACHE_KLINES_COUNT + 1) * max(ratios, default=1)
+    
+    def _warm_start(self, symbol: str) -> bool:
+        """从磁盘历史载入缓冲区，只通过REST补齐上次保存之后的K线"""
+        history = self.data_cache[symbol]['history']
+        if history is None or len(history) < Config.CACHE_KLINES_COUNT:
+            return False
+        
+        buffer = self.data_cache[symbol]['klines']
+        buffer.clear()
+        buffer.extend(history.tail(buffer.capacity))
+        
+        # 只补齐上次保存之后的K线，缺口较大时分页获取
+        missing = max(0, (self._latest_closed_time() - buffer.last_timestamp) // 3600000)
+        if missing:
+            klines = self.fetch_klines_range(symbol, buffer.last_timestamp + 3600000)
+            if klines is None:
+                return False
+            self._persist_klines(symbol, klines)
+            buffer.extend(klines)
+        
+        if not self.check_cache_validity(symbol):
+            return False
+        
+        self.data_cache[symbol]['indicators'].reset()
+        self.data_cache[symbol]['extrema'].reset()
+        self._calculate_ab_points(symbol)
+        self._calculate_indicators(symbol)
+        self._resample(symbol, rebuild=True)
+        
+        self.logger.info(f"{symbol} 从磁盘历史恢复 {len(buffer)} 根K线，补齐 {missing} 根")
+        return True
+    
+    def _persist_klines(self, symbol: str, klines: np.ndarray = None):
+        """
+        把比磁盘历史更新的K线追加写入磁盘
+        
+        Args:
+            klines: 本次获取的K线；为None时取缓冲区中的K线。超过缓冲区容量的
+                补缺数据需要直接传入，否则会被缓冲区截断
+        """
+        history = self.data_cache[symbol]['history']
+        if history is None:
+            return
+        
+        try:
+            if klines is None:
+                buffer = self.data_cache[symbol]['klines']
+                last = history.last_timestamp
+                start = 0 if last is None else int(np.searchsorted(buffer.timestamp, last, side='right'))
+                klines = buffer.to_array(start)
+            history.append(klines)
+        except OSError as e:
+            self.logger.warning(f"{symbol} 写入K线历史失败: {str(e)}")
+    
+    def _a_point_range(self, length: int) -> Tuple[int, int]:
+        """A点搜索范围（闭区间索引），B点为最新收盘K线"""
+        return a_point_range(length, Config.CACHE_A_POINT_START, Config.CACHE_A_POINT_END)
+    
+    def set_a_point_window(self, start: int, end: int):
+        """
+        运行时调整A点范围，并立即按新范围重新计算所有交易对的A点
+        
+        Args:
+            start: A点范围开始，与 CACHE_A_POINT_START 相同按含未收盘K线的倒数计数（B点为倒数第2根），
+                至少为3；为2时范围的最后一根就是B点本身（见 a_point_range）
+            end: A点范围结束
+        """
+        if not 3 <= start <= end < Config.CACHE_KLINES_COUNT:
+            raise ValueError(f"无效的A点范围: {start}-{end}")
+        
+        Config.CACHE_A_POINT_START = start
+        Config.CACHE_A_POINT_END = end
+        self.batch_engine.a_point_start = start
+        self.batch_engine.a_point_end = end
+        
+        # 区间查询与窗口长度无关，重新计算不需要重建索引
+        for symbol in self.symbols:
+            if len(self.data_cache[symbol]['klines']):
+                self._calculate_ab_points(symbol)
+        self.logger.info(f"A点范围已调整为 {start}-{end}")
+    
     def _calculate_ab_points(self, symbol: str):
         """计算A点（从最新收盘K线往左数第13到34根K线的最高价和最低价）"""
         klines = self.data_cache[symbol]['klines']
-        if len(klines) < 34:
+        if len(klines) < Config.CACHE_A_POINT_END - 1:
             return
         
-        # 从最新收盘K线往左数第13到34根K线中找A点
-        # 倒数第34根对应索引len-34，倒数第13根对应索引len-13
-        start_index = len(klines) - 34
-        end_index = len(klines) - 13
-        
-        if start_index < 0:
-            start_index = 0
-        if end_index >= len(klines):
-            end_index = len(klines) - 1
-            
-        search_range = klines[start_index:end_index + 1]
-        
-        if not search_range:
+        start_index, end_index = self._a_point_range(len(klines))
+        if start_index > end_index:
             return
         
-        # 找最高价作为A_top
-        max_high = max(k['high'] for k in search_range)
-        for i, k in enumerate(search_range):
-            if k['high'] == max_high:
-                self.data_cache[symbol]['A_top'] = max_high
-                self.data_cache[symbol]['A_top_index'] = start_index + i
-                break
+        # 区间极值索引只追加新收盘K线，查询与窗口长度无关；并列时取第一个位置
+        extrema = self.data_cache[symbol]['extrema']
+        extrema.sync(klines)
         
-        # 找最低价作为A_bottom
-        min_low = min(k['low'] for k in search_range)
-        for i, k in enumerate(search_range):
-            if k['low'] == min_low:
-                self.data_cache[symbol]['A_bottom'] = min_low
-                self.data_cache[symbol]['A_bottom_index'] = start_index + i
-                break
+        A_top, A_top_index = extrema.max_high(start_index, end_index)
+        self.data_cache[symbol]['A_top'] = A_top
+        self.data_cache[symbol]['A_top_index'] = A_top_index
+        
+        A_bottom, A_bottom_index = extrema.min_low(start_index, end_index)
+        self.data_cache[symbol]['A_bottom'] = A_bottom
+        self.data_cache[symbol]['A_bottom_index'] = A_bottom_index
         
         self.logger.info(f"{symbol} A点计算完成 - A_top: {self.data_cache[symbol]['A_top']:.4f}, "
                         f"A_bottom: {self.data_cache[symbol]['A_bottom']:.4f}, "
@@ -568,211 +1230,406 @@ class KlineMonitor:
                         f"A_bottom_index: {self.data_cache[symbol].get('A_bottom_index')}")
     
     def _calculate_indicators(self, symbol: str):
-        """计算技术指标"""
+        """计算技术指标（增量推进新收盘K线，出现缺口时自动重建）"""
         klines = self.data_cache[symbol]['klines']
-        closes = [k['close'] for k in klines]
+        state = self.data_cache[symbol]['indicators']
+        advanced = state.sync(klines)
         
         # 计算EMA
-        if len(closes) >= 21:
-            self.data_cache[symbol]['ema21'] = self.calculate_ema(closes, 21)
-        if len(closes) >= 55:
-            self.data_cache[symbol]['ema55'] = self.calculate_ema(closes, 55)
-        if len(closes) >= 144:
-            self.data_cache[symbol]['ema144'] = self.calculate_ema(closes, 144)
+        for period in (21, 55, 144):
+            value = state.ema_value(period)
+            if value is not None:
+                self.data_cache[symbol][f'ema{period}'] = value
         
         # 计算ATR
-        self.data_cache[symbol]['atr'] = self.calculate_atr(klines)
+        self.data_cache[symbol]['atr'] = state.atr.value if state.atr.value is not None else 0.0
         
-        self.logger.info(f"{symbol} 指标计算完成")
+        self.logger.info(f"{symbol} 指标计算完成，推进 {advanced} 根K线")
     
     def update_symbol_data(self, symbol: str) -> bool:
-        """步骤3：获取实时最新收盘K线并更新缓存"""
+        """步骤3：从最新缓存K线之后增量获取已收盘K线并追加到缓存"""
         try:
-            # 获取最新的K线数据
-            new_klines = self.fetch_klines(symbol, "1h", 5)  # 获取最新5根
-            if not new_klines:
-                return False
-            
-            # 获取当前缓存的K线
-            cached_klines = self.data_cache[symbol]['klines']
-            
-            # 合并新数据，去重并保持200根
-            all_klines = cached_klines + new_klines
-            
-            # 按时间戳去重
-            unique_klines = {}
-            for kline in all_klines:
-                unique_klines[kline['timestamp']] = kline
-            
-            # 按时间排序并保持最新200根
-            sorted_klines = sorted(unique_klines.values(), key=lambda x: x['timestamp'])
-            old_klines_len = len(cached_klines)
-            new_klines_data = sorted_klines[-200:]
-            new_klines_len = len(new_klines_data)
-            
-            # 计算K线数据变化量，调整A点索引
-            if old_klines_len > 0 and new_klines_len > 0:
-                # 计算数据偏移量
-                offset = new_klines_len - old_klines_len
-                
-                # 调整A点索引（如果存在）
-                if 'A_top_index' in self.data_cache[symbol] and self.data_cache[symbol]['A_top_index'] is not None:
-                    old_a_top_index = self.data_cache[symbol]['A_top_index']
-                    new_a_top_index = old_a_top_index + offset
-                    # 确保索引在有效范围内
-                    if 0 <= new_a_top_index < new_klines_len:
-                        self.data_cache[symbol]['A_top_index'] = new_a_top_index
-                    else:
-                        # 如果A点索引超出范围，重新计算A点
-                        self.data_cache[symbol]['klines'] = new_klines_data
-                        self._calculate_ab_points(symbol)
-                        
-                if 'A_bottom_index' in self.data_cache[symbol] and self.data_cache[symbol]['A_bottom_index'] is not None:
-                    old_a_bottom_index = self.data_cache[symbol]['A_bottom_index']
-                    new_a_bottom_index = old_a_bottom_index + offset
-                    # 确保索引在有效范围内
-                    if 0 <= new_a_bottom_index < new_klines_len:
-                        self.data_cache[symbol]['A_bottom_index'] = new_a_bottom_index
-                    else:
-                        # 如果A点索引超出范围，重新计算A点
-                        self.data_cache[symbol]['klines'] = new_klines_data
-                        self._calculate_ab_points(symbol)
-            
-            self.data_cache[symbol]['klines'] = new_klines_data
-            
-            # 检查缓存有效性
-            if not self.check_cache_validity(symbol):
-                self.logger.warning(f"{symbol} 缓存无效，重新初始化")
+            last_timestamp = self.data_cache[symbol]['klines'].last_timestamp
+            if last_timestamp is None:
                 return self.initialize_symbol(symbol)
             
-            # 更新指标
-            self._calculate_indicators(symbol)
-            self.data_cache[symbol]['last_update'] = datetime.now()
+            # 最新收盘K线已在缓存中，不发请求
+            if last_timestamp >= self._latest_closed_time():
+                self.logger.debug(f"{symbol} 已是最新，跳过请求")
+                return True
             
-            return True
+            # 只请求缓存之后缺少的K线，缺口按页补齐
+            new_klines = self.fetch_klines_range(symbol, last_timestamp + 3600000)
+            if new_klines is None or len(new_klines) == 0:
+                return False
             
+            return self.apply_klines(symbol, new_klines)
+        
         except Exception as e:
             self.logger.error(f"{symbol} 数据更新失败: {str(e)}")
             return False
     
+    def apply_klines(self, symbol: str, klines: np.ndarray) -> bool:
+        """把已收盘K线（轮询或推送得到）追加到缓存，并更新A点和指标"""
+        self._persist_klines(symbol, klines)
+        
+        # 只追加比缓存更新的K线，缓冲区自动淘汰最旧的K线
+        self.data_cache[symbol]['klines'].extend(klines)
+        
+        # 检查缓存有效性
+        if not self.check_cache_validity(symbol):
+            self.logger.warning(f"{symbol} 缓存无效，重新初始化")
+            return self.initialize_symbol(symbol)
+        
+        # A点窗口随最新K线滑动，每次更新后重新定位
+        self._calculate_ab_points(symbol)
+        
+        # 更新指标
+        self._calculate_indicators(symbol)
+        self._resample(symbol)
+        self.data_cache[symbol]['last_update'] = datetime.now()
+        
+        return True
+    
+    def _resample(self, symbol: str, rebuild: bool = False, klines: np.ndarray = None):
+        """
+        把新收盘的1小时K线聚合到各高周期（每根K线常数开销，不请求交易所）
+        
+        Args:
+            rebuild: 缓存重建时为True，优先用磁盘K线历史重新聚合，使高周期一开始就有足够的K线
+            klines: 重建时使用的1小时K线（冷启动回填的数据），None表示取磁盘历史或缓冲区
+        """
+        cache = self.data_cache[symbol]
+        history = cache['history']
+        for timeframe, resampler in cache['timeframes'].items():
+            if rebuild:
+                count = (resampler.klines.capacity + 1) * resampler.ratio
+                if klines is not None:
+                    resampler.seed(klines[-count:])
+                else:
+                    resampler.seed(history.tail(count) if history is not None and len(history)
+                                   else cache['klines'].to_array())
+            resampler.sync(cache['klines'])
+            if rebuild:
+                self.logger.info(f"{symbol} {timeframe} 重采样完成，{len(resampler)} 根K线")
+                if len(resampler) < Config.CACHE_KLINES_COUNT:
+                    missing = (Config.CACHE_KLINES_COUNT - len(resampler)) * resampler.ratio
+                    self.logger.warning(f"{symbol} {timeframe} 只有 {len(resampler)} 根K线，"
+                                        f"不足 {Config.CACHE_KLINES_COUNT} 根，约 {missing} 小时后开始检测")
+    
     def check_cache_validity(self, symbol: str) -> bool:
         """检查缓存数据有效性"""
         klines = self.data_cache[symbol]['klines']
         
         # 检查数量
-        if len(klines) < 200:
+        if len(klines) < Config.CACHE_KLINES_COUNT:
             return False
         
         # 检查时间连续性（允许少量缺失）
-        timestamps = [k['timestamp'] for k in klines]
-        time_diffs = [timestamps[i+1] - timestamps[i] for i in range(len(timestamps)-1)]
+        time_diffs = np.diff(klines.timestamp)
         
         # 1小时 = 3600000毫秒，允许一定误差
         expected_diff = 3600000
-        valid_diffs = sum(1 for diff in time_diffs if abs(diff - expected_diff) < 600000)  # 10分钟误差
+        valid_diffs = np.count_nonzero(np.abs(time_diffs - expected_diff) < 600000)  # 10分钟误差
         
         return valid_diffs / len(time_diffs) > 0.9  # 90%的数据连续性
     
-    def calculate_atr(self, klines: List, period: int = 14) -> float:
+    def calculate_atr(self, klines: KlineBuffer, period: int = 14) -> float:
         """计算ATR（平均真实波幅）"""
         if len(klines) < period + 1:
             return 0.0
         
-        true_ranges = []
-        for i in range(1, len(klines)):
-            high = klines[i]['high']
-            low = klines[i]['low']
-            prev_close = klines[i-1]['close']
-            
-            tr1 = high - low
-            tr2 = abs(high - prev_close)
-            tr3 = abs(low - prev_close)
-            
-            true_ranges.append(max(tr1, tr2, tr3))
-        
-        # 计算ATR（简单移动平均）
-        if len(true_ranges) >= period:
-            return sum(true_ranges[-period:]) / period
-        else:
-            return sum(true_ranges) / len(true_ranges)
+        # 计算ATR（最近 period 个真实波幅的简单移动平均）
+        return float(atr_latest(klines.high, klines.low, klines.close, period))
     
-    def calculate_ema_series(self, prices: List[float], period: int) -> List[float]:
-        """计算EMA序列"""
-        if len(prices) < period:
-            return []
+    def detect_pending_signals(self, symbols: List[str]) -> List[Tuple[str, str, Optional[Dict]]]:
+        """
+        检测所有尚未检测过的已收盘K线：先补检上次检测之后漏掉的K线，再检测最新K线，
+        然后记录各交易对的检测进度
         
-        ema_values = []
-        multiplier = 2 / (period + 1)
+        Returns:
+            List[Tuple[str, str, Optional[Dict]]]: (交易对, 信号类型, 补检信息)，
+            补检信号按K线时间排在前面，最新K线的信号补检信息为None
+        """
+        signals = self.catch_up_signals(symbols)
+        signals.extend((symbol, signal_type, None) for symbol, signal_type in self.detect_signals(symbols))
+        signals.extend(self.detect_timeframe_signals(symbols))
         
-        # 第一个EMA值使用SMA
-        sma = sum(prices[:period]) / period
-        ema_values.append(sma)
+        now_ms = self.exchange_router.now_ms()
+        for symbol in symbols:
+            cache = self.data_cache[symbol]
+            last_timestamp = cache['klines'].last_timestamp
+            # 只统计连续运行时的收盘延迟：启动前收盘的K线和缺口之后的第一根K线不计入
+            if last_timestamp is not None and cache['last_evaluated'] == last_timestamp - 3600000 \
+                    and last_timestamp + 3600000 >= self.started_ms:
+                cache['evaluated_close'] = last_timestamp + 3600000
+                self.latency_slo.record(symbol, 'evaluation', (now_ms - cache['evaluated_close']) / 1000)
+            if last_timestamp is not None:
+                cache['last_evaluated'] = last_timestamp
+            for resampler in cache['timeframes'].values():
+                if resampler.klines.last_timestamp is not None:
+                    resampler.last_evaluated = resampler.klines.last_timestamp
+        self._save_evaluation_state()
+        return signals
+    
+    def catch_up_signals(self, symbols: List[str]) -> List[Tuple[str, str, Dict]]:
+        """
+        补检上次检测之后、最新K线之前收盘的K线（重启、单轮超时或推送缺口期间）
+        
+        待补检的交易对对齐成矩阵，所有漏掉的K线作为B点一次求值，
+        每一列的判定与该K线为最新K线时的 detect_signals 一致。
         
-        # 计算后续EMA值
-        for i in range(period, len(prices)):
-            ema = (prices[i] * multiplier) + (ema_values[-1] * (1 - multiplier))
-            ema_values.append(ema)
+        Returns:
+            List[Tuple[str, str, Dict]]: (交易对, 信号类型, 补检信息)，按K线时间排序；
+            补检信息包含K线时间、缓冲区索引、收盘价以及用于绘图的A/B/C点
+        """
+        pending = {}
+        for symbol in symbols:
+            cache = self.data_cache[symbol]
+            buffer = cache['klines']
+            if cache['last_evaluated'] is None or len(buffer) < Config.CACHE_KLINES_COUNT:
+                continue
+            
+            # 最新一根由 detect_signals 检测
+            count = len(buffer) - 1 - int(np.searchsorted(buffer.timestamp, cache['last_evaluated'], side='right'))
+            if count > Config.CATCH_UP_MAX_KLINES:
+                self.logger.warning(f"{symbol} 有 {count} 根K线未检测，只补检最近 {Config.CATCH_UP_MAX_KLINES} 根")
+                count = Config.CATCH_UP_MAX_KLINES
+            if count > 0:
+                pending[symbol] = count
+        if not pending:
+            return []
         
-        return ema_values
+        started = time.monotonic()
+        buffers = {symbol: self.data_cache[symbol]['klines'] for symbol in pending}
+        found = self._scan_pending(buffers, pending, symbols, skip_latest=True)
+        self.logger.info(f"补检 {len(pending)} 个交易对共 {sum(pending.values())} 根K线，"
+                         f"发现 {len(found)} 个信号，耗时 {(time.monotonic() - started) * 1000:.0f}ms")
+        return found
     
-    def calculate_ema(self, prices: List[float], period: int) -> float:
-        """计算单个EMA值"""
-        if len(prices) < period:
-            return 0.0
+    def detect_timeframe_signals(self, symbols: List[str]) -> List[Tuple[str, str, Dict]]:
+        """
+        对重采样得到的高周期K线（RESAMPLE_TIMEFRAMES）运行同样的双顶/双底和EMA趋势检测
         
-        multiplier = 2 / (period + 1)
+        只检测上次检测之后新收盘的高周期K线（通常是最新一根，停机后最多 CATCH_UP_MAX_KLINES 根），
+        没有新收盘K线的周期不做任何计算。
         
-        # 第一个EMA值使用SMA
-        ema = sum(prices[:period]) / period
+        Returns:
+            List[Tuple[str, str, Dict]]: (交易对, 信号类型, K线信息)，K线信息与补检信息格式相同，
+            另含 timeframe；只有不是最新一根高周期K线的信号 late 为True
+        """
+        found = []
+        for timeframe in Config.RESAMPLE_TIMEFRAMES:
+            pending = {}
+            for symbol in symbols:
+                resampler = self.data_cache[symbol]['timeframes'][timeframe]
+                if len(resampler) >= Config.CACHE_KLINES_COUNT and resampler.pending:
+                    pending[symbol] = min(resampler.pending, Config.CATCH_UP_MAX_KLINES)
+            if not pending:
+                continue
+            
+            started = time.monotonic()
+            buffers = {symbol: self.data_cache[symbol]['timeframes'][timeframe].klines for symbol in pending}
+            signals = self._scan_pending(buffers, pending, symbols, interval_ms=TIMEFRAME_MS[timeframe])
+            for symbol, signal_type, info in signals:
+                info['timeframe'] = timeframe
+                info['late'] = info['kline_timestamp'] != buffers[symbol].last_timestamp
+            found.extend(signals)
+            self.logger.info(f"{timeframe} 检测 {len(pending)} 个交易对，发现 {len(signals)} 个信号，"
+                             f"耗时 {(time.monotonic() - started) * 1000:.0f}ms")
+        return found
+    
+    def _scan_pending(self, buffers: Dict[str, KlineBuffer], pending: Dict[str, int], symbols: List[str],
+                      skip_latest: bool = False, interval_ms: int = 3600000) -> List[Tuple[str, str, Dict]]:
+        """
+        把各交易对最后 pending[symbol] 根K线作为B点批量求值
         
-        # 计算后续EMA值
-        for i in range(period, len(prices)):
-            ema = (prices[i] * multiplier) + (ema * (1 - multiplier))
+        Args:
+            buffers: {交易对: KlineBuffer}
+            pending: {交易对: 需要检测的K线数量}
+            symbols: 交易对顺序，同一时间的信号按该顺序排列
+            skip_latest: 为True时不含最新一根（由 detect_signals 检测）
+            interval_ms: K线周期（毫秒）
+            
+        Returns:
+            List[Tuple[str, str, Dict]]: (交易对, 信号类型, K线信息)，按K线时间排序
+        """
+        matrix, skipped = stack_universe(buffers, Config.CACHE_KLINES_COUNT, interval_ms)
+        matrices = [matrix] if matrix is not None else []
+        # 最新K线时间不一致的交易对各自求值
+        matrices.extend(stack_universe({symbol: buffers[symbol]}, Config.CACHE_KLINES_COUNT, interval_ms)[0]
+                        for symbol in skipped)
         
-        return ema
+        stop_offset = 1 if skip_latest else 0
+        found = []
+        for matrix in matrices:
+            count = max(pending[symbol] for symbol in matrix.symbols)
+            stop = matrix.length - stop_offset
+            try:
+                result = self.batch_engine.scan_matrix(matrix, stop - count, stop)
+            except Exception as e:
+                self.logger.error(f"补检信号失败: {str(e)}")
+                continue
+            
+            columns = len(result['B_index'])
+            for row, symbol in enumerate(matrix.symbols):
+                for column in range(max(0, columns - pending[symbol]), columns):
+                    found.extend(self._collect_late_signals(symbol, buffers[symbol], result, row, column,
+                                                            matrix.length))
+        
+        order = {symbol: i for i, symbol in enumerate(symbols)}
+        found.sort(key=lambda item: (item[2]['kline_timestamp'], order[item[0]]))
+        return found
     
-    def calculate_ema_convergence(self, klines: List, atr: float) -> float:
-        """计算EMA收敛度 - 使用21根K线回溯窗口均值法"""
-        if len(klines) < 144:  # 需要足够的数据计算EMA144
-            return 1.0  # 返回高值表示不收敛
+    def _collect_late_signals(self, symbol: str, buffer: KlineBuffer, result: Dict, row: int, column: int,
+                              length: int) -> List[Tuple[str, str, Dict]]:
+        """读取补检结果中某个交易对某一列的信号，矩阵列号换算为缓冲区索引"""
+        offset = length - len(buffer)
+        index = int(result['B_index'][column]) - offset
+        base = {
+            'kline_timestamp': int(buffer.timestamp[index]),
+            'index': index,
+            'price': float(buffer.close[index]),
+            'atr': float(result['atr'][row, column]),
+            'ema21': float(result['ema21'][row, column]),
+            'ema55': float(result['ema55'][row, column])
+        }
         
-        closes = [k['close'] for k in klines]
+        signals = []
+        if result['double_top'][row, column]:
+            signals.append((symbol, 'double_top', dict(
+                base,
+                A_top=float(result['A_top'][row, column]),
+                A_top_index=int(result['A_top_index'][row, column]) - offset,
+                B_top=float(result['B_top'][row, column]),
+                B_top_index=index,
+                C_bottom=float(result['C_bottom'][row, column]),
+                C_bottom_index=int(result['C_bottom_index'][row, column]) - offset
+            )))
+        elif result['double_bottom'][row, column]:
+            signals.append((symbol, 'double_bottom', dict(
+                base,
+                A_bottom=float(result['A_bottom'][row, column]),
+                A_bottom_index=int(result['A_bottom_index'][row, column]) - offset,
+                B_bottom=float(result['B_bottom'][row, column]),
+                B_bottom_index=index,
+                C_top=float(result['C_top'][row, column]),
+                C_top_index=int(result['C_top_index'][row, column]) - offset
+            )))
         
-        # 计算过去21根K线的平均相对聚合度
-        ratios = []
+        if result['uptrend'][row, column]:
+            signals.append((symbol, "上升趋势", base))
+        elif result['downtrend'][row, column]:
+            signals.append((symbol, "下降趋势", base))
+        return signals
+    
+    def _load_evaluation_state(self):
+        """读取各交易对最后检测的K线时间，重启后据此补检停机期间收盘的K线"""
+        try:
+            with open(Config.EVALUATION_STATE_FILE, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"读取检测进度失败: {str(e)}")
+            return
         
-        # 从最新K线开始往前21根
-        for i in range(21):
-            # 计算当前位置的EMA值
-            current_closes = closes[:-(i) if i > 0 else len(closes)]
-            
-            if len(current_closes) < 144:
+        for key, timestamp in state.items():
+            # 高周期的检测进度保存为 "交易对@周期"
+            symbol, _, timeframe = key.partition('@')
+            if symbol not in self.data_cache or timestamp is None:
                 continue
-                
-            ema21 = self.calculate_ema(current_closes, 21)
-            ema55 = self.calculate_ema(current_closes, 55)
-            ema144 = self.calculate_ema(current_closes, 144)
-            
-            # 计算均线瞬时宽度
-            span = max(ema21, ema55, ema144) - min(ema21, ema55, ema144)
-            
-            # 计算相对聚合度
-            if atr > 0:
-                ratio = span / atr
-                ratios.append(ratio)
+            if not timeframe:
+                self.data_cache[symbol]['last_evaluated'] = int(timestamp)
+            elif timeframe in self.data_cache[symbol]['timeframes']:
+                self.data_cache[symbol]['timeframes'][timeframe].last_evaluated = int(timestamp)
+    
+    def _save_evaluation_state(self):
+        """保存各交易对最后检测的K线时间（先写临时文件再替换，避免写到一半）"""
+        state = {symbol: cache['last_evaluated'] for symbol, cache in self.data_cache.items()
+                 if cache['last_evaluated'] is not None}
+        for symbol, cache in self.data_cache.items():
+            for timeframe, resampler in cache['timeframes'].items():
+                if resampler.last_evaluated is not None:
+                    state[f"{symbol}@{timeframe}"] = resampler.last_evaluated
+        try:
+            directory = os.path.dirname(Config.EVALUATION_STATE_FILE)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = Config.EVALUATION_STATE_FILE + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(temp_path, Config.EVALUATION_STATE_FILE)
+        except OSError as e:
+            self.logger.warning(f"保存检测进度失败: {str(e)}")
+    
+    def detect_signals(self, symbols: List[str]) -> List[Tuple[str, str]]:
+        """
+        步骤4/5：批量检查所有交易对的双顶/双底形态和EMA趋势
+        
+        最新K线时间一致的交易对堆叠成矩阵一次求值；无法对齐的交易对
+        逐个走 check_double_pattern / check_ema_trend。
         
-        if not ratios:
-            return 1.0
+        Returns:
+            List[Tuple[str, str]]: (交易对, 信号类型)，按交易对顺序排列，形态信号在趋势信号之前
+        """
+        buffers = {symbol: self.data_cache[symbol]['klines'] for symbol in symbols}
+        matrix, skipped = stack_universe(buffers, Config.CACHE_KLINES_COUNT)
+        
+        found = {}
+        if matrix is not None:
+            try:
+                result = self.batch_engine.evaluate(matrix)
+                for row, symbol in enumerate(matrix.symbols):
+                    found[symbol] = self._collect_batch_signals(symbol, result, row, matrix.length)
+            except Exception as e:
+                self.logger.error(f"批量信号检查失败: {str(e)}")
+                skipped = list(symbols)
+                found = {}
+        
+        for symbol in skipped:
+            found[symbol] = [self.check_double_pattern(symbol), self.check_ema_trend(symbol)]
         
-        # 计算窗口期内的平均聚合水平
-        avg_ratio = sum(ratios) / len(ratios)
-        return avg_ratio
+        return [(symbol, signal) for symbol in symbols for signal in found.get(symbol, []) if signal]
+    
+    def _collect_batch_signals(self, symbol: str, result: Dict, row: int, length: int) -> List[Optional[str]]:
+        """读取批量求值结果中某个交易对的信号，并缓存B点和C点信息用于绘图"""
+        cache = self.data_cache[symbol]
+        # 矩阵右对齐，换算回该交易对缓冲区内的索引
+        offset = length - len(cache['klines'])
+        
+        pattern = None
+        if result['double_top'][row]:
+            pattern = 'double_top'
+            cache['B_top'] = float(result['B_top'][row])
+            cache['B_top_index'] = int(result['B_index'][row]) - offset
+            cache['C_bottom'] = float(result['C_bottom'][row])
+            cache['C_bottom_index'] = int(result['C_bottom_index'][row]) - offset
+        elif result['double_bottom'][row]:
+            pattern = 'double_bottom'
+            cache['B_bottom'] = float(result['B_bottom'][row])
+            cache['B_bottom_index'] = int(result['B_index'][row]) - offset
+            cache['C_top'] = float(result['C_top'][row])
+            cache['C_top_index'] = int(result['C_top_index'][row]) - offset
+        
+        # 形态距离越接近1越可能在下一根K线形成信号，下一轮优先检测
+        cache['near_miss'] = float('inf') if pattern else float(
+            min(result['double_top_distance'][row], result['double_bottom_distance'][row])
+        )
+        
+        trend = None
+        if result['uptrend'][row]:
+            trend = "上升趋势"
+        elif result['downtrend'][row]:
+            trend = "下降趋势"
+        
+        return [pattern, trend]
     
     def check_double_pattern(self, symbol: str) -> Optional[str]:
         """步骤4：检查双顶/双底形态"""
         try:
             klines = self.data_cache[symbol]['klines']
-            if len(klines) < 200:
+            if len(klines) < Config.CACHE_KLINES_COUNT:
                 return None
             
             A_top = self.data_cache[symbol]['A_top']
@@ -787,15 +1644,20 @@ class KlineMonitor:
             if not all([A_top, A_bottom, atr, ema21, ema55, ema144]):
                 return None
             
-            # B点定义：最新收盘K线（倒数第二根K线，因为最后一根可能未收盘）
-            latest_closed_kline = klines[-2]  # 最新收盘K线
-            B_top = latest_closed_kline['high']
-            B_bottom = latest_closed_kline['low']
+            highs = klines.high
+            lows = klines.low
+            extrema = self.data_cache[symbol]['extrema']
+            extrema.sync(klines)
+            
+            # B点定义：最新收盘K线（缓存中只保存已收盘K线，即最后一根）
+            B_index = len(klines) - 1
+            B_top = float(highs[B_index])
+            B_bottom = float(lows[B_index])
             
             # 双顶检测
-            if abs(A_top - B_top) <= 0.8 * atr:
+            if abs(A_top - B_top) <= Config.DOUBLE_PATTERN_ATR_THRESHOLD * atr:
                 # 寻找C_bottom：A_top与B_top之间的最低点
-                B_top_index = len(klines) - 2  # B点索引（最新收盘K线）
+                B_top_index = B_index  # B点索引（最新收盘K线）
                 
                 # 确保A点在B点之前（时间顺序）
                 if A_top_index >= B_top_index:
@@ -805,32 +1667,26 @@ class KlineMonitor:
                 end_index = B_top_index
                 
                 if start_index < end_index:
-                    c_range = klines[start_index + 1:end_index]  # A和B之间的K线，不包括A和B本身
-                    if c_range:  # 确保A和B之间有K线
-                        C_bottom = min(k['low'] for k in c_range)
+                    if start_index + 1 < end_index:  # 确保A和B之间有K线（不包括A和B本身）
+                        # 区间最低点，并列时取第一个位置
+                        C_bottom, C_bottom_index = extrema.min_low(start_index + 1, end_index - 1)
                         
                         # 检查C_bottom与A_top和B_top的差值（C点应该明显低于A、B点）
-                        if (A_top - C_bottom) >= 2.3 * atr and (B_top - C_bottom) >= 2.3 * atr:
+                        depth = Config.DOUBLE_PATTERN_DEPTH_THRESHOLD * atr
+                        if (A_top - C_bottom) >= depth and (B_top - C_bottom) >= depth:
                             # 检查EMA条件：不满足ema21>ema55>ema144
                             if not (ema21 > ema55 > ema144):
                                 # 缓存B点和C点信息用于绘图
                                 self.data_cache[symbol]['B_top'] = B_top
                                 self.data_cache[symbol]['B_top_index'] = B_top_index
                                 self.data_cache[symbol]['C_bottom'] = C_bottom
-                                # 找到C_bottom对应的索引（选择第一个匹配的）
-                                c_bottom_index = None
-                                for i, k in enumerate(c_range):
-                                    if k['low'] == C_bottom:
-                                        c_bottom_index = start_index + 1 + i
-                                        break
-                                if c_bottom_index is not None:
-                                    self.data_cache[symbol]['C_bottom_index'] = c_bottom_index
+                                self.data_cache[symbol]['C_bottom_index'] = C_bottom_index
                                 return 'double_top'
             
             # 双底检测
-            if abs(A_bottom - B_bottom) <= 0.8 * atr:
+            if abs(A_bottom - B_bottom) <= Config.DOUBLE_PATTERN_ATR_THRESHOLD * atr:
                 # 寻找C_top：A_bottom与B_bottom之间的最高点
-                B_bottom_index = len(klines) - 2  # B点索引（最新收盘K线）
+                B_bottom_index = B_index  # B点索引（最新收盘K线）
                 
                 # 确保A点在B点之前（时间顺序）
                 if A_bottom_index >= B_bottom_index:
@@ -840,26 +1696,20 @@ class KlineMonitor:
                 end_index = B_bottom_index
                 
                 if start_index < end_index:
-                    c_range = klines[start_index + 1:end_index]  # A和B之间的K线，不包括A和B本身
-                    if c_range:  # 确保A和B之间有K线
-                        C_top = max(k['high'] for k in c_range)
+                    if start_index + 1 < end_index:  # 确保A和B之间有K线（不包括A和B本身）
+                        # 区间最高点，并列时取第一个位置
+                        C_top, C_top_index = extrema.max_high(start_index + 1, end_index - 1)
                         
                         # 检查C_top与A_bottom和B_bottom的差值（C点应该明显高于A、B点）
-                        if (C_top - A_bottom) >= 2.3 * atr and (C_top - B_bottom) >= 2.3 * atr:
+                        depth = Config.DOUBLE_PATTERN_DEPTH_THRESHOLD * atr
+                        if (C_top - A_bottom) >= depth and (C_top - B_bottom) >= depth:
                             # 检查EMA条件：不满足ema21<ema55<ema144
                             if not (ema21 < ema55 < ema144):
                                 # 缓存B点和C点信息用于绘图
                                 self.data_cache[symbol]['B_bottom'] = B_bottom
                                 self.data_cache[symbol]['B_bottom_index'] = B_bottom_index
                                 self.data_cache[symbol]['C_top'] = C_top
-                                # 找到C_top对应的索引（选择第一个匹配的）
-                                c_top_index = None
-                                for i, k in enumerate(c_range):
-                                    if k['high'] == C_top:
-                                        c_top_index = start_index + 1 + i
-                                        break
-                                if c_top_index is not None:
-                                    self.data_cache[symbol]['C_top_index'] = c_top_index
+                                self.data_cache[symbol]['C_top_index'] = C_top_index
                                 return 'double_bottom'
             
             return None
@@ -879,23 +1729,22 @@ class KlineMonitor:
             if len(klines) < 144:  # 需要足够数据计算EMA144
                 return None
             
-            # 获取当前和前一根K线的EMA值
-            closes = [k['close'] for k in klines]
+            # 从增量指标状态读取当前和前一根K线的EMA值
+            state = self.data_cache[symbol]['indicators']
+            state.sync(klines)
             
             # 当前K线的EMA
-            current_ema21 = self.calculate_ema(closes, 21)
-            current_ema55 = self.calculate_ema(closes, 55)
-            current_ema144 = self.calculate_ema(closes, 144)
+            current_ema21 = state.ema_value(21)
+            current_ema55 = state.ema_value(55)
+            current_ema144 = state.ema_value(144)
             
             # 前一根K线的EMA
-            prev_closes = closes[:-1]
-            if len(prev_closes) < 144:
+            prev_ema21 = state.prev_ema_value(21)
+            prev_ema55 = state.prev_ema_value(55)
+            prev_ema144 = state.prev_ema_value(144)
+            if current_ema144 is None or prev_ema144 is None:
                 return None
             
-            prev_ema21 = self.calculate_ema(prev_closes, 21)
-            prev_ema55 = self.calculate_ema(prev_closes, 55)
-            prev_ema144 = self.calculate_ema(prev_closes, 144)
-            
             # 检查上升趋势
             current_uptrend = current_ema21 > current_ema55 > current_ema144
             prev_uptrend = prev_ema21 > prev_ema55 > prev_ema144
@@ -904,15 +1753,19 @@ class KlineMonitor:
             current_downtrend = current_ema21 < current_ema55 < current_ema144
             prev_downtrend = prev_ema21 < prev_ema55 < prev_ema144
             
-            # 二次筛选条件：检查EMA收敛度
-            atr = self.data_cache[symbol]['atr']
-            convergence_ratio = self.calculate_ema_convergence(klines, atr)
-            
             # 判断趋势启动
-            if current_uptrend and not prev_uptrend and convergence_ratio < 0.5:
-                return "上升趋势"
-            elif current_downtrend and not prev_downtrend and convergence_ratio < 0.5:
-                return "下降趋势"
+            if current_uptrend and not prev_uptrend:
+                trend = "上升趋势"
+            elif current_downtrend and not prev_downtrend:
+                trend = "下降趋势"
+            else:
+                return None
+            
+            # 二次筛选条件：检查EMA收敛度（取增量状态中最近的EMA宽度，不重算EMA序列）
+            atr = self.data_cache[symbol]['atr']
+            convergence_ratio = state.ema_convergence(atr)
+            if convergence_ratio < Config.EMA_CONVERGENCE_THRESHOLD:
+                return trend
             
             return None
             
@@ -920,261 +1773,156 @@ class KlineMonitor:
             self.logger.error(f"EMA趋势检查失败: {str(e)}")
             return None
     
-    def handle_signal(self, symbol: str, signal_type: str):
-        """处理信号"""
+    def handle_signal(self, symbol: str, signal_type: str, late: Dict = None):
+        """
+        处理信号
+        
+        Args:
+            late: 补检信号或高周期信号所在K线的信息（见 catch_up_signals / detect_timeframe_signals），
+                价格、K线时间、EMA和ATR取信号所在的K线
+        """
         try:
-            current_price = self.data_cache[symbol]['klines'][-1]['close']
+            klines = self.data_cache[symbol]['klines']
+            current_price = late['price'] if late else float(klines.close[-1])
+            kline_timestamp = late['kline_timestamp'] if late else klines.last_timestamp
+            timeframe = late.get('timeframe', '1h') if late else '1h'
             
             signal_info = {
                 'symbol': symbol,
                 'type': signal_type,
+                'timeframe': timeframe,
                 'price': current_price,
                 'timestamp': datetime.now().isoformat(),
-                'ema21': self.data_cache[symbol]['ema21'],
-                'ema55': self.data_cache[symbol]['ema55'],
-                'atr': self.data_cache[symbol]['atr']
+                'kline_time': datetime.fromtimestamp(kline_timestamp / 1000).isoformat(),
+                'kline_timestamp': int(kline_timestamp),
+                'ema21': late['ema21'] if late else self.data_cache[symbol]['ema21'],
+                'ema55': late['ema55'] if late else self.data_cache[symbol]['ema55'],
+                'atr': late['atr'] if late else self.data_cache[symbol]['atr']
             }
+            if late and late.get('late', True):
+                signal_info['late'] = True
             
-            # 存储信号
+            # 存储信号：内存中只保留最近的信号，全部信号追加到信号日志
             if symbol not in self.signals:
-                self.signals[symbol] = []
+                self.signals[symbol] = deque(maxlen=Config.SIGNAL_HISTORY_LIMIT)
             self.signals[symbol].append(signal_info)
+            self.journal.append(signal_info)
+            self.signal_store.add(signal_info)
+            
+            # 文字通知只写入发件箱，不等待发送；图表在进程池中渲染，完成后按同一交易对的顺序排在文字之后。
+            # 汇总模式下信号和图表先交给 SignalDigest，按批合并后再写入发件箱
+            detected_at = time.time()
+            digest_entry = None
+            if self.digest:
+                digest_entry = self.digest.add(signal_info, created=detected_at)
+            elif self.outbox:
+                self.outbox.enqueue_message(symbol, self.telegram_bot.format_signal_message(signal_info),
+                                            created=detected_at)
+            
+            chart_future = self.chart_pool.submit(self._chart_payload(symbol, signal_type, late, timeframe))
+            if chart_future is not None:
+                chart_future.add_done_callback(
+                    lambda future: self._queue_signal_chart(signal_info, future, detected_at, digest_entry)
+                )
+            elif digest_entry is not None:
+                self.digest.attach_chart(digest_entry)
             
-            # 生成图表
-            chart_path = self.plot_signal(symbol, signal_type)
-            
-            # 发送Telegram通知
-            if self.telegram_bot:
-                try:
-                    success = self.telegram_bot.send_signal_alert(signal_info, chart_path)
-                    if success:
-                        self.logger.info(f"Telegram通知发送成功: {symbol} {signal_type}")
-                    else:
-                        self.logger.warning(f"Telegram通知发送失败: {symbol} {signal_type}")
-                except Exception as e:
-                    self.logger.error(f"发送Telegram通知时出错: {str(e)}")
+            # 收盘到信号加入发件箱的延迟（补检信号和重启后的第一根K线不计入）
+            close_ms = kline_timestamp + TIMEFRAME_MS[timeframe]
+            if not signal_info.get('late') and close_ms == self.data_cache[symbol]['evaluated_close']:
+                self.latency_slo.record(symbol, 'signal', (self.exchange_router.now_ms() - close_ms) / 1000)
             
-            self.logger.info(f"📊 {symbol} {signal_type} 信号 - 价格: {current_price:.4f}")
+            if signal_info.get('late'):
+                self.logger.info(f"📊 {symbol} {timeframe} {signal_type} 补检信号 - K线时间: {signal_info['kline_time']}，"
+                                 f"价格: {current_price:.4f}")
+            else:
+                self.logger.info(f"📊 {symbol} {timeframe} {signal_type} 信号 - 价格: {current_price:.4f}")
             
         except Exception as e:
             self.logger.error(f"处理信号失败: {str(e)}")
     
-    def calculate_macd(self, closes: List[float], fast: int = 12, slow: int = 26, signal: int = 9):
-        """计算MACD指标"""
-        if len(closes) < slow:
-            return [], [], []
-        
-        # 计算EMA
-        ema_fast = self.calculate_ema_series(closes, fast)
-        ema_slow = self.calculate_ema_series(closes, slow)
-        
-        # 对齐长度
-        min_len = min(len(ema_fast), len(ema_slow))
-        if min_len == 0:
-            return [], [], []
-        
-        ema_fast = ema_fast[-min_len:]
-        ema_slow = ema_slow[-min_len:]
-        
-        # 计算MACD线
-        macd_line = [ema_fast[i] - ema_slow[i] for i in range(min_len)]
-        
-        # 计算信号线
-        if len(macd_line) >= signal:
-            signal_line = self.calculate_ema_series(macd_line, signal)
-        else:
-            signal_line = []
-        
-        # 计算柱状图
-        if len(signal_line) > 0:
-            histogram = [macd_line[i] - signal_line[i] for i in range(len(signal_line))]
-        else:
-            histogram = []
+    def _queue_signal_chart(self, signal_info: Dict, chart_future, detected_at: float, digest_entry: Dict = None):
+        """图表渲染完成后把内存中的图片加入发件箱（汇总模式下交给 SignalDigest），投递延迟从检测到信号时算起"""
+        symbol = signal_info['symbol']
+        try:
+            chart = chart_future.result()
+        except Exception as e:
+            self.logger.error(f"{symbol} Chart generation failed: {str(e)}")
+            if digest_entry is not None:
+                self.digest.attach_chart(digest_entry)
+            return
         
-        return macd_line, signal_line, histogram
+        self.logger.info(f"Chart generated: {chart['path'] or chart['filename']}，"
+                         f"{chart['bytes'] / 1024:.0f}KB，渲染 {chart['elapsed'] * 1000:.0f}ms")
+        try:
+            if digest_entry is not None:
+                self.digest.attach_chart(digest_entry, chart['image'], chart['filename'])
+            elif self.outbox:
+                self.outbox.enqueue_photo(symbol, chart['image'], chart['filename'],
+                                          self.telegram_bot.format_chart_caption(signal_info), created=detected_at)
+        except Exception as e:
+            self.logger.error(f"{symbol} 图表加入发件箱失败: {str(e)}")
     
-    def calculate_rsi(self, closes: List[float], period: int = 14):
-        """计算RSI指标"""
-        if len(closes) < period + 1:
-            return []
-        
-        # 计算价格变化
-        deltas = [closes[i] - closes[i-1] for i in range(1, len(closes))]
+    def _chart_payload(self, symbol: str, signal_type: str, points: Dict = None, timeframe: str = '1h') -> Dict:
+        """
+        打包渲染进程需要的绘图数据（55根K线和对应的指标，均为副本）
         
-        # 分离上涨和下跌
-        gains = [delta if delta > 0 else 0 for delta in deltas]
-        losses = [-delta if delta < 0 else 0 for delta in deltas]
+        默认取最近55根K线；points 带有B点索引（补检信号或高周期信号）时，窗口截止到B点之后
+        CHART_BARS_AFTER_SIGNAL 根，保证较早的信号也能画出A/B/C点。
         
-        rsi_values = []
+        Args:
+            points: 补检信号或高周期信号的A/B/C点，默认取缓存中的最新值
+            timeframe: K线周期，高周期信号使用重采样得到的K线
+        """
+        # 获取最近55根K线用于绘图
+        if timeframe == '1h':
+            all_klines = self.data_cache[symbol]['klines']
+        else:
+            all_klines = self.data_cache[symbol]['timeframes'][timeframe].klines
+        points = points or self.data_cache[symbol]
+        end = len(all_klines)
+        if points.get('index') is not None:
+            end = min(end, max(CHART_KLINES, points['index'] + 1 + Config.CHART_BARS_AFTER_SIGNAL))
+        window = slice(max(0, end - CHART_KLINES), end)
         
-        # 计算第一个RSI值
-        if len(gains) >= period:
-            avg_gain = sum(gains[:period]) / period
-            avg_loss = sum(losses[:period]) / period
-            
-            if avg_loss == 0:
-                rsi_values.append(100)
-            else:
-                rs = avg_gain / avg_loss
-                rsi = 100 - (100 / (1 + rs))
-                rsi_values.append(rsi)
-            
-            # 计算后续RSI值
-            for i in range(period, len(gains)):
-                avg_gain = (avg_gain * (period - 1) + gains[i]) / period
-                avg_loss = (avg_loss * (period - 1) + losses[i]) / period
-                
-                if avg_loss == 0:
-                    rsi_values.append(100)
-                else:
-                    rs = avg_gain / avg_loss
-                    rsi = 100 - (100 / (1 + rs))
-                    rsi_values.append(rsi)
+        # 指标使用全部缓存K线计算（向量化，与K线等长），只传窗口内的值
+        all_closes = all_klines.close
+        macd_line, signal_line, histogram = macd_series(all_closes, Config.MACD_FAST, Config.MACD_SLOW,
+                                                        Config.MACD_SIGNAL)
+        rsi_values = rsi_series(all_closes, Config.RSI_PERIOD)
         
-        return rsi_values
+        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return {
+            'symbol': symbol,
+            'signal_type': signal_type,
+            'timeframe': timeframe,
+            'title_time': datetime.now().strftime("%Y-%m-%d %H:%M"),
+            'profile': Config.CHART_PROFILE,
+            'archive_profile': Config.CHART_ARCHIVE_PROFILE,
+            'directory': Config.CHART_DIR,
+            'name': f"{symbol}_{timeframe}_{signal_type}_{timestamp_str}",
+            'chart_start': window.start,
+            'open': all_klines.open[window].copy(),
+            'high': all_klines.high[window].copy(),
+            'low': all_klines.low[window].copy(),
+            'close': all_klines.close[window].copy(),
+            'volume': all_klines.volume[window].copy(),
+            'ema21': ema_series(all_closes, 21)[window],
+            'ema55': ema_series(all_closes, 55)[window],
+            'ema144': ema_series(all_closes, 144)[window],
+            'macd': macd_line[window],
+            'signal': signal_line[window],
+            'histogram': histogram[window],
+            'rsi': rsi_values[window],
+            'points': {key: points.get(key) for key in PATTERN_POINT_KEYS}
+        }
     
-    def plot_signal(self, symbol: str, signal_type: str):
-        """步骤7：生成信号图表（基于55根K线）"""
+    def plot_signal(self, symbol: str, signal_type: str, points: Dict = None, timeframe: str = '1h'):
+        """步骤7：在当前进程中生成信号图表并存盘（基于55根K线），信号处理使用 chart_pool 异步渲染"""
         try:
-            # 获取最近55根K线用于绘图
-            all_klines = self.data_cache[symbol]['klines']
-            chart_klines = all_klines[-55:]
-            
-            closes = [k['close'] for k in chart_klines]
-            highs = [k['high'] for k in chart_klines]
-            lows = [k['low'] for k in chart_klines]
-            volumes = [k['volume'] for k in chart_klines]
-            
-            # 计算指标 - 使用全部300根K线数据计算，然后取最后55个值
-            all_closes = [k['close'] for k in all_klines]
-            
-            # 计算EMA序列（使用全部数据）
-            ema21_full = self.calculate_ema_series(all_closes, 21)
-            ema55_full = self.calculate_ema_series(all_closes, 55)
-            ema144_full = self.calculate_ema_series(all_closes, 144)
-            
-            # 取最后55个值用于绘图
-            ema21_series = ema21_full[-55:] if len(ema21_full) >= 55 else ema21_full
-            ema55_series = ema55_full[-55:] if len(ema55_full) >= 55 else ema55_full
-            ema144_series = ema144_full[-55:] if len(ema144_full) >= 55 else ema144_full
-            
-            # 计算MACD和RSI（使用全部数据）
-            macd_line_full, signal_line_full, histogram_full = self.calculate_macd(all_closes)
-            rsi_values_full = self.calculate_rsi(all_closes)
-            
-            # 取最后55个值用于绘图
-            macd_line = macd_line_full[-55:] if len(macd_line_full) >= 55 else macd_line_full
-            signal_line = signal_line_full[-55:] if len(signal_line_full) >= 55 else signal_line_full
-            histogram = histogram_full[-55:] if len(histogram_full) >= 55 else histogram_full
-            rsi_values = rsi_values_full[-55:] if len(rsi_values_full) >= 55 else rsi_values_full
-            
-            # 创建图表
-            fig, (ax1, ax2, ax3, ax4) = plt.subplots(4, 1, figsize=(15, 16), 
-                                                   gridspec_kw={'height_ratios': [3, 0.8, 1, 1]})
-            
-            # 主图：K线图
-            x_range = range(len(chart_klines))
-            
-            # 绘制K线 - 绿涨红跌
-            for i in x_range:
-                color = 'green' if closes[i] >= chart_klines[i]['open'] else 'red'
-                ax1.plot([i, i], [lows[i], highs[i]], color='black', linewidth=0.8)
-                ax1.plot([i, i], [chart_klines[i]['open'], closes[i]], color=color, linewidth=3)
-            
-            # 绘制EMA线 - 确保x轴对齐
-            chart_len = len(chart_klines)
-            
-            if len(ema21_series) > 0:
-                # 计算EMA21的起始位置
-                ema21_start = max(0, chart_len - len(ema21_series))
-                ema21_x = range(ema21_start, chart_len)
-                ax1.plot(ema21_x, ema21_series, 'yellow', label='EMA21', linewidth=1.5)
-            
-            if len(ema55_series) > 0:
-                # 计算EMA55的起始位置
-                ema55_start = max(0, chart_len - len(ema55_series))
-                ema55_x = range(ema55_start, chart_len)
-                ax1.plot(ema55_x, ema55_series, 'green', label='EMA55', linewidth=1.5)
-            
-            if len(ema144_series) > 0:
-                # 计算EMA144的起始位置
-                ema144_start = max(0, chart_len - len(ema144_series))
-                ema144_x = range(ema144_start, chart_len)
-                ax1.plot(ema144_x, ema144_series, 'red', label='EMA144', linewidth=1.5)
-            
-            # 标记关键点（如果是双顶/双底信号）
-            if signal_type in ['double_top', 'double_bottom']:
-                self._mark_pattern_points(ax1, symbol, signal_type, all_klines, chart_klines)
-            
-            ax1.set_title(f'{symbol} - {signal_type} Signal - {datetime.now().strftime("%Y-%m-%d %H:%M")}', fontsize=14)
-            ax1.legend()
-            ax1.grid(True, alpha=0.3)
-            
-            # 成交量图 - 绿涨红跌
-            colors = ['green' if closes[i] >= chart_klines[i]['open'] else 'red' for i in range(len(chart_klines))]
-            ax2.bar(x_range, volumes, color=colors, alpha=0.7)
-            
-            # 连接BC点对应的成交量柱状图顶点
-            if signal_type in ['double_top', 'double_bottom']:
-                self._mark_volume_connection(ax2, symbol, signal_type, all_klines, chart_klines, volumes)
-            
-            ax2.set_title('Volume')
-            ax2.grid(True, alpha=0.3)
-            
-            # MACD图 - 确保x轴对齐
-            if len(macd_line) > 0:
-                macd_start = max(0, chart_len - len(macd_line))
-                macd_x = range(macd_start, macd_start + len(macd_line))
-                ax3.plot(macd_x, macd_line, 'blue', label='MACD', linewidth=1.5)
-            
-            if len(signal_line) > 0:
-                signal_start = max(0, chart_len - len(signal_line))
-                signal_x = range(signal_start, signal_start + len(signal_line))
-                ax3.plot(signal_x, signal_line, 'red', label='Signal', linewidth=1.5)
-            
-            if len(histogram) > 0:
-                hist_start = max(0, chart_len - len(histogram))
-                hist_x = range(hist_start, hist_start + len(histogram))
-                ax3.bar(hist_x, histogram, color=['green' if x >= 0 else 'red' for x in histogram], 
-                       alpha=0.7, label='Histogram')
-            
-            # 连接BC点对应的MACD柱状图顶点
-            if signal_type in ['double_top', 'double_bottom']:
-                self._mark_macd_connection(ax3, symbol, signal_type, all_klines, chart_klines, histogram, hist_start if len(histogram) > 0 else 0)
-            
-            ax3.axhline(y=0, color='black', linestyle='-', linewidth=0.5)
-            ax3.set_title('MACD')
-            ax3.legend()
-            ax3.grid(True, alpha=0.3)
-            
-            # RSI图 - 确保x轴对齐
-            if len(rsi_values) > 0:
-                rsi_start = max(0, chart_len - len(rsi_values))
-                rsi_x = range(rsi_start, rsi_start + len(rsi_values))
-                ax4.plot(rsi_x, rsi_values, 'purple', label='RSI', linewidth=1.5)
-            
-            # 连接BC点对应的RSI点
-            if signal_type in ['double_top', 'double_bottom']:
-                self._mark_rsi_connection(ax4, symbol, signal_type, all_klines, chart_klines, rsi_values, rsi_start if len(rsi_values) > 0 else 0)
-            
-            ax4.axhline(y=70, color='red', linestyle='--', alpha=0.7, label='Overbought')
-            ax4.axhline(y=30, color='green', linestyle='--', alpha=0.7, label='Oversold')
-            ax4.axhline(y=50, color='black', linestyle='-', alpha=0.3)
-            ax4.set_ylim(0, 100)
-            ax4.set_title('RSI')
-            ax4.legend()
-            ax4.grid(True, alpha=0.3)
-            
-            # 保存图表
-            if not os.path.exists(Config.CHART_DIR):
-                os.makedirs(Config.CHART_DIR)
-            
-            timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = os.path.join(Config.CHART_DIR, f"{symbol}_{signal_type}_{timestamp_str}.png")
-            plt.tight_layout()
-            plt.savefig(filename, dpi=300, bbox_inches='tight')
-            plt.close()
-            
+            chart = self._chart_payload(symbol, signal_type, points, timeframe)
+            chart['archive_profile'] = chart['archive_profile'] or chart['profile']
+            filename = render_signal_chart(chart)['path']
             self.logger.info(f"Chart generated: {filename}")
             return filename
             
@@ -1182,252 +1930,53 @@ class KlineMonitor:
             self.logger.error(f"{symbol} Chart generation failed: {str(e)}")
             return ""
     
-    def _mark_pattern_points(self, ax, symbol: str, signal_type: str, all_klines: List, chart_klines: List):
-        """标记双顶/双底的关键点ABC并连接相关点"""
-        try:
-            # 获取缓存中的关键点数据
-            B_top = self.data_cache[symbol].get('B_top')
-            B_bottom = self.data_cache[symbol].get('B_bottom')
-            B_top_index = self.data_cache[symbol].get('B_top_index')
-            B_bottom_index = self.data_cache[symbol].get('B_bottom_index')
-            C_top = self.data_cache[symbol].get('C_top')
-            C_bottom = self.data_cache[symbol].get('C_bottom')
-            C_top_index = self.data_cache[symbol].get('C_top_index')
-            C_bottom_index = self.data_cache[symbol].get('C_bottom_index')
-            A_top = self.data_cache[symbol].get('A_top')
-            A_bottom = self.data_cache[symbol].get('A_bottom')
-            A_top_index = self.data_cache[symbol].get('A_top_index')
-            A_bottom_index = self.data_cache[symbol].get('A_bottom_index')
-            
-            # 计算在55根K线图表中的相对位置
-            all_klines_len = len(all_klines)
-            chart_start_index = all_klines_len - 55  # 图表开始的索引位置
-            
-            if signal_type == 'double_top':
-                # 标记A点（红色）
-                if A_top and A_top_index is not None and A_top_index >= chart_start_index:
-                    a_chart_pos = A_top_index - chart_start_index
-                    ax.scatter(a_chart_pos, A_top, color='red', s=100, marker='o', zorder=5)
-                    ax.annotate('A', (a_chart_pos, A_top), xytext=(5, 10), 
-                               textcoords='offset points', fontsize=12, color='red', weight='bold')
-                
-                # 标记B点（蓝色）- 最新收盘K线的最高点
-                if B_top and B_top_index is not None and B_top_index >= chart_start_index:
-                    b_chart_pos = B_top_index - chart_start_index
-                    ax.scatter(b_chart_pos, B_top, color='blue', s=100, marker='o', zorder=5)
-                    ax.annotate('B', (b_chart_pos, B_top), xytext=(5, 10), 
-                               textcoords='offset points', fontsize=12, color='blue', weight='bold')
-                
-                # 标记C点（绿色）- A_top与B_top之间的最低点
-                if C_bottom and C_bottom_index is not None and C_bottom_index >= chart_start_index:
-                    c_chart_pos = C_bottom_index - chart_start_index
-                    ax.scatter(c_chart_pos, C_bottom, color='green', s=100, marker='o', zorder=5)
-                    ax.annotate('C', (c_chart_pos, C_bottom), xytext=(5, -15), 
-                               textcoords='offset points', fontsize=12, color='green', weight='bold')
-                    
-                    # 连接C_bottom和B_top两个点
-                    if B_top and B_top_index is not None and B_top_index >= chart_start_index:
-                        b_chart_pos = B_top_index - chart_start_index
-                        ax.plot([c_chart_pos, b_chart_pos], [C_bottom, B_top], 
-                               color='orange', linewidth=2, linestyle='-', alpha=0.8, label='C-B Line')
-                
-                # 画双顶参考线
-                if A_top:
-                    ax.axhline(y=A_top, color='red', linestyle='--', alpha=0.5, label='Double Top Line')
-            
-            elif signal_type == 'double_bottom':
-                # 标记A点（红色）
-                if A_bottom and A_bottom_index is not None and A_bottom_index >= chart_start_index:
-                    a_chart_pos = A_bottom_index - chart_start_index
-                    ax.scatter(a_chart_pos, A_bottom, color='red', s=100, marker='o', zorder=5)
-                    ax.annotate('A', (a_chart_pos, A_bottom), xytext=(5, -15), 
-                               textcoords='offset points', fontsize=12, color='red', weight='bold')
-                
-                # 标记B点（蓝色）- 最新收盘K线的最低点
-                if B_bottom and B_bottom_index is not None and B_bottom_index >= chart_start_index:
-                    b_chart_pos = B_bottom_index - chart_start_index
-                    ax.scatter(b_chart_pos, B_bottom, color='blue', s=100, marker='o', zorder=5)
-                    ax.annotate('B', (b_chart_pos, B_bottom), xytext=(5, -15), 
-                               textcoords='offset points', fontsize=12, color='blue', weight='bold')
-                
-                # 标记C点（绿色）- A_bottom与B_bottom之间的最高点
-                if C_top and C_top_index is not None and C_top_index >= chart_start_index:
-                    c_chart_pos = C_top_index - chart_start_index
-                    ax.scatter(c_chart_pos, C_top, color='green', s=100, marker='o', zorder=5)
-                    ax.annotate('C', (c_chart_pos, C_top), xytext=(5, 10), 
-                               textcoords='offset points', fontsize=12, color='green', weight='bold')
-                    
-                    # 连接C_top和B_bottom两个点
-                    if B_bottom and B_bottom_index is not None and B_bottom_index >= chart_start_index:
-                        b_chart_pos = B_bottom_index - chart_start_index
-                        ax.plot([c_chart_pos, b_chart_pos], [C_top, B_bottom], 
-                               color='orange', linewidth=2, linestyle='-', alpha=0.8, label='C-B Line')
-                
-                # 画双底参考线
-                if A_bottom:
-                    ax.axhline(y=A_bottom, color='green', linestyle='--', alpha=0.5, label='Double Bottom Line')
-                
-        except Exception as e:
-            self.logger.error(f"Mark key points failed: {str(e)}")
-    
-    def _mark_volume_connection(self, ax, symbol: str, signal_type: str, all_klines: List, chart_klines: List, volumes: List):
-        """连接BC点对应的成交量柱状图顶点"""
-        try:
-            # 获取BC点的索引
-            B_top_index = self.data_cache[symbol].get('B_top_index')
-            B_bottom_index = self.data_cache[symbol].get('B_bottom_index')
-            C_top_index = self.data_cache[symbol].get('C_top_index')
-            C_bottom_index = self.data_cache[symbol].get('C_bottom_index')
-            
-            # 计算在55根K线图表中的相对位置
-            all_klines_len = len(all_klines)
-            chart_start_index = all_klines_len - 55
-            
-            if signal_type == 'double_top':
-                # 双顶：连接C_bottom和B_top对应的成交量
-                if (B_top_index is not None and C_bottom_index is not None and 
-                    B_top_index >= chart_start_index and C_bottom_index >= chart_start_index):
-                    b_chart_pos = B_top_index - chart_start_index
-                    c_chart_pos = C_bottom_index - chart_start_index
-                    if 0 <= b_chart_pos < len(volumes) and 0 <= c_chart_pos < len(volumes):
-                        ax.plot([c_chart_pos, b_chart_pos], [volumes[c_chart_pos], volumes[b_chart_pos]], 
-                               color='orange', linewidth=2, linestyle='-', alpha=0.8, label='C-B Volume Line')
-            
-            elif signal_type == 'double_bottom':
-                # 双底：连接C_top和B_bottom对应的成交量
-                if (B_bottom_index is not None and C_top_index is not None and 
-                    B_bottom_index >= chart_start_index and C_top_index >= chart_start_index):
-                    b_chart_pos = B_bottom_index - chart_start_index
-                    c_chart_pos = C_top_index - chart_start_index
-                    if 0 <= b_chart_pos < len(volumes) and 0 <= c_chart_pos < len(volumes):
-                        ax.plot([c_chart_pos, b_chart_pos], [volumes[c_chart_pos], volumes[b_chart_pos]], 
-                               color='orange', linewidth=2, linestyle='-', alpha=0.8, label='C-B Volume Line')
-                        
-        except Exception as e:
-            self.logger.error(f"Connect volume points failed: {str(e)}")
-    
-    def _mark_macd_connection(self, ax, symbol: str, signal_type: str, all_klines: List, chart_klines: List, histogram: List, hist_start: int):
-        """连接BC点对应的MACD柱状图顶点"""
-        try:
-            # 获取BC点的索引
-            B_top_index = self.data_cache[symbol].get('B_top_index')
-            B_bottom_index = self.data_cache[symbol].get('B_bottom_index')
-            C_top_index = self.data_cache[symbol].get('C_top_index')
-            C_bottom_index = self.data_cache[symbol].get('C_bottom_index')
-            
-            # 计算在55根K线图表中的相对位置
-            all_klines_len = len(all_klines)
-            chart_start_index = all_klines_len - 55
-            
-            if len(histogram) == 0:
-                return
-            
-            if signal_type == 'double_top':
-                # 双顶：连接C_bottom和B_top对应的MACD柱状图
-                if (B_top_index is not None and C_bottom_index is not None and 
-                    B_top_index >= chart_start_index and C_bottom_index >= chart_start_index):
-                    b_chart_pos = B_top_index - chart_start_index
-                    c_chart_pos = C_bottom_index - chart_start_index
-                    
-                    # 转换为MACD数据的索引
-                    b_macd_pos = b_chart_pos - hist_start
-                    c_macd_pos = c_chart_pos - hist_start
-                    
-                    if 0 <= b_macd_pos < len(histogram) and 0 <= c_macd_pos < len(histogram):
-                        ax.plot([c_chart_pos, b_chart_pos], [histogram[c_macd_pos], histogram[b_macd_pos]], 
-                               color='orange', linewidth=2, linestyle='-', alpha=0.8, label='C-B MACD Line')
-            
-            elif signal_type == 'double_bottom':
-                # 双底：连接C_top和B_bottom对应的MACD柱状图
-                if (B_bottom_index is not None and C_top_index is not None and 
-                    B_bottom_index >= chart_start_index and C_top_index >= chart_start_index):
-                    b_chart_pos = B_bottom_index - chart_start_index
-                    c_chart_pos = C_top_index - chart_start_index
-                    
-                    # 转换为MACD数据的索引
-                    b_macd_pos = b_chart_pos - hist_start
-                    c_macd_pos = c_chart_pos - hist_start
-                    
-                    if 0 <= b_macd_pos < len(histogram) and 0 <= c_macd_pos < len(histogram):
-                        ax.plot([c_chart_pos, b_chart_pos], [histogram[c_macd_pos], histogram[b_macd_pos]], 
-                               color='orange', linewidth=2, linestyle='-', alpha=0.8, label='C-B MACD Line')
-                        
-        except Exception as e:
-            self.logger.error(f"Connect MACD points failed: {str(e)}")
-    
-    def _mark_rsi_connection(self, ax, symbol: str, signal_type: str, all_klines: List, chart_klines: List, rsi_values: List, rsi_start: int):
-        """连接BC点对应的RSI点"""
-        try:
-            # 获取BC点的索引
-            B_top_index = self.data_cache[symbol].get('B_top_index')
-            B_bottom_index = self.data_cache[symbol].get('B_bottom_index')
-            C_top_index = self.data_cache[symbol].get('C_top_index')
-            C_bottom_index = self.data_cache[symbol].get('C_bottom_index')
-            
-            # 计算在55根K线图表中的相对位置
-            all_klines_len = len(all_klines)
-            chart_start_index = all_klines_len - 55
-            
-            if len(rsi_values) == 0:
-                return
-            
-            if signal_type == 'double_top':
-                # 双顶：连接C_bottom和B_top对应的RSI
-                if (B_top_index is not None and C_bottom_index is not None and 
-                    B_top_index >= chart_start_index and C_bottom_index >= chart_start_index):
-                    b_chart_pos = B_top_index - chart_start_index
-                    c_chart_pos = C_bottom_index - chart_start_index
-                    
-                    # 转换为RSI数据的索引
-                    b_rsi_pos = b_chart_pos - rsi_start
-                    c_rsi_pos = c_chart_pos - rsi_start
-                    
-                    if 0 <= b_rsi_pos < len(rsi_values) and 0 <= c_rsi_pos < len(rsi_values):
-                        ax.plot([c_chart_pos, b_chart_pos], [rsi_values[c_rsi_pos], rsi_values[b_rsi_pos]], 
-                               color='orange', linewidth=2, linestyle='-', alpha=0.8, label='C-B RSI Line')
-            
-            elif signal_type == 'double_bottom':
-                # 双底：连接C_top和B_bottom对应的RSI
-                if (B_bottom_index is not None and C_top_index is not None and 
-                    B_bottom_index >= chart_start_index and C_top_index >= chart_start_index):
-                    b_chart_pos = B_bottom_index - chart_start_index
-                    c_chart_pos = C_top_index - chart_start_index
-                    
-                    # 转换为RSI数据的索引
-                    b_rsi_pos = b_chart_pos - rsi_start
-                    c_rsi_pos = c_chart_pos - rsi_start
-                    
-                    if 0 <= b_rsi_pos < len(rsi_values) and 0 <= c_rsi_pos < len(rsi_values):
-                        ax.plot([c_chart_pos, b_chart_pos], [rsi_values[c_rsi_pos], rsi_values[b_rsi_pos]], 
-                               color='orange', linewidth=2, linestyle='-', alpha=0.8, label='C-B RSI Line')
-                        
-        except Exception as e:
-            self.logger.error(f"Connect RSI points failed: {str(e)}")
-    
-    def get_signal_summary(self, symbol: str = None) -> Dict:
-        """获取信号汇总"""
+    def get_signal_summary(self, symbol: str = None, signal_type: str = None, days: float = None,
+                           limit: int = None, timeframe: str = None):
+        """
+        获取信号汇总
+        
+        只传 symbol（或不传参数）时返回内存中最近的信号；指定 signal_type、days、limit 或 timeframe 时
+        查询信号库中的全部历史，例如 get_signal_summary("SOLUSDT", "double_bottom", days=90)。
+        
+        Returns:
+            指定 symbol 时为该交易对的信号列表（按时间先后），否则为 {交易对: 信号列表}
+        """
+        if signal_type is None and days is None and limit is None and timeframe is None:
+            if symbol:
+                return list(self.signals.get(symbol, []))
+            return {symbol: list(history) for symbol, history in self.signals.items()}
+        
+        self.signal_store.flush()
+        start = datetime.now() - timedelta(days=days) if days is not None else None
+        signals = self.signal_store.query(symbol, signal_type, start=start, limit=limit, timeframe=timeframe)[::-1]
         if symbol:
-            return self.signals.get(symbol, [])
-        return self.signals
+            return signals
+        summary = {}
+        for signal_info in signals:
+            summary.setdefault(signal_info['symbol'], []).append(signal_info)
+        return summary
+    
+    def get_signal_stats(self, days: float = None, group_by: Tuple[str, ...] = ('symbol', 'type'),
+                         **filters) -> List[Dict]:
+        """按交易对、信号类型等维度统计信号库中的信号数（filters 同 SignalStore.aggregate）"""
+        self.signal_store.flush()
+        start = datetime.now() - timedelta(days=days) if days is not None else None
+        return self.signal_store.aggregate(group_by, start=start, **filters)
     
-    def save_signals_to_file(self):
-        """保存信号数据到文件"""
+    def save_signals_to_file(self, sync: bool = False):
+        """
+        把本轮新检测到的信号写入信号库（一个事务）和当天的信号日志（只写新信号，fsync 按批次执行）
+        
+        Args:
+            sync: 为True时立即 fsync（退出前调用）
+        """
         try:
-            if not os.path.exists(Config.DATA_DIR):
-                os.makedirs(Config.DATA_DIR)
-            
-            filename = os.path.join(Config.DATA_DIR, f"signals_{datetime.now().strftime('%Y%m%d')}.json")
-            
-            # 准备保存的数据
-            save_data = {
-                'last_update': datetime.now().isoformat(),
-                'signals': self.signals
-            }
-            
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(save_data, f, ensure_ascii=False, indent=2)
-            
-            self.logger.info(f"信号数据已保存到: {filename}")
+            self.signal_store.flush()
+            written = self.journal.flush(sync)
+            if written:
+                stats = self.journal.stats()
+                self.logger.info(f"信号数据已保存到: {self.journal.segment_path(stats['segment'])}，"
+                                 f"新增 {written} 条，累计 {stats['records']} 条，fsync {stats['syncs']} 次")
             
         except Exception as e:
             self.logger.error(f"保存信号数据失败: {str(e)}")
@@ -1493,7 +2042,11 @@ if __name__ == "__main__":
                     print("系统停止通知已发送")
                 except Exception as e:
                     print(f"发送停止通知失败: {str(e)}")
-            monitor.save_signals_to_file()
+            if monitor.digest:
+                monitor.digest.stop()
+            if monitor.outbox:
+                monitor.outbox.stop()
+            monitor.save_signals_to_file(sync=True)
             print("信号数据已保存，程序退出")
         except Exception as e:
             print(f"程序运行出错: {e}")
@@ -1504,7 +2057,7 @@ if __name__ == "__main__":
                     print("系统错误通知已发送")
                 except Exception as te:
                     print(f"发送错误通知失败: {str(te)}")
-            monitor.save_signals_to_file()
+            monitor.save_signals_to_file(sync=True)
             print("信号数据已保存")
             
     except Exception as e:
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+回测模块 - 把磁盘上的历史K线逐根回放给 KlineMonitor 的检测逻辑，记录信号及之后的收益
+
+用法示例：
+    python backtest.py --symbols BTCUSDT ETHUSDT --start 2022-01-01 --download
+    python backtest.py --set DOUBLE_PATTERN_ATR_THRESHOLD=0.6 --workers 8
+"""
+
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from app import Config, KlineMonitor
+from batch_engine import BatchSignalEngine
+from kline_store import KlineHistory
+
+# 计算信号之后第 N 根K线的收益
+FORWARD_HORIZONS = (1, 4, 12, 24, 72)
+
+# 信号的预期方向，用于统计胜率
+SIGNAL_DIRECTIONS = {
+    'double_top': -1,
+    'double_bottom': 1,
+    '上升趋势': 1,
+    '下降趋势': -1
+}
+
+
+class ReplayMonitor(KlineMonitor):
+    """
+    逐根回放历史K线的监控器
+
+    只保留单个交易对的缓存，不创建HTTP客户端、Telegram和线程池；每根K线
+    走与实盘相同的 apply_klines → check_double_pattern / check_ema_trend 流程。
+    缓存失效时与实盘重新下载一样，用截至当前K线的最近一段历史重建缓冲区。
+    """
+
+    def __init__(self, symbol: str):
+        self.symbols = [symbol]
+        self.signals = {}
+        self.logger = logging.getLogger("Backtest")
+        self.data_cache = {symbol: self._new_cache_entry(symbol)}
+        self._klines = None
+        self._cursor = -1
+
+    def _open_history(self, symbol: str) -> Optional[KlineHistory]:
+        return None  # 回放时不写磁盘历史
+
+    def initialize_symbol(self, symbol: str) -> bool:
+        """用截至当前K线的最近历史重建缓存，对应实盘中的重新初始化"""
+        buffer = self.data_cache[symbol]['klines']
+        end = self._cursor + 1
+        start = max(0, end - buffer.capacity)
+        if end - start < Config.CACHE_KLINES_COUNT:
+            return False
+
+        buffer.clear()
+        buffer.extend(self._klines[start:end])
+        self.data_cache[symbol]['indicators'].reset()
+        self.data_cache[symbol]['extrema'].reset()
+        self._calculate_ab_points(symbol)
+        self._calculate_indicators(symbol)
+        return True
+
+    def replay(self, symbol: str, klines: np.ndarray, start_index: int, stop_index: int = None) -> List[Dict]:
+        """
+        从 start_index 开始逐根回放K线并检测信号
+
+        Args:
+            symbol: 交易对
+            klines: (n, 6) 历史K线，start_index 之前的部分用于预热
+            start_index: 第一根作为B点检测的K线
+            stop_index: 回放到该索引为止（不含），None表示到最后
+
+        Returns:
+            List[Dict]: 信号记录，A/B/C索引为 klines 中的位置
+        """
+        self._klines = klines
+        self._cursor = start_index - 1
+        self.initialize_symbol(symbol)
+
+        stop_index = len(klines) if stop_index is None else min(stop_index, len(klines))
+        records = []
+        for index in range(start_index, stop_index):
+            self._cursor = index
+            if not self.apply_klines(symbol, klines[index:index + 1]):
+                continue
+
+            for signal_type in (self.check_double_pattern(symbol), self.check_ema_trend(symbol)):
+                if signal_type:
+                    records.append(self._record(symbol, signal_type, index))
+        return records
+
+    def _record(self, symbol: str, signal_type: str, index: int) -> Dict:
+        cache = self.data_cache[symbol]
+        # 缓冲区索引换算为历史数组中的位置
+        offset = index - (len(cache['klines']) - 1)
+        a_index = c_index = None
+        if signal_type == 'double_top':
+            a_index, c_index = cache['A_top_index'], cache['C_bottom_index']
+        elif signal_type == 'double_bottom':
+            a_index, c_index = cache['A_bottom_index'], cache['C_top_index']
+
+        return {
+            'symbol': symbol,
+            'type': signal_type,
+            'timestamp': int(self._klines[index, 0]),
+            'price': float(self._klines[index, 4]),
+            'A_index': None if a_index is None else offset + a_index,
+            'B_index': index,
+            'C_index': None if c_index is None else offset + c_index,
+            'ema21': cache['ema21'],
+            'ema55': cache['ema55'],
+            'ema144': cache['ema144'],
+            'atr': cache['atr']
+        }
+
+
+def add_forward_returns(records: List[Dict], closes: np.ndarray, horizons: Sequence[int]):
+    """为每条信号加上B点之后第 h 根K线相对B点收盘价的收益，超出数据范围时为NaN"""
+    for record in records:
+        index = record['B_index']
+        for horizon in horizons:
+            target = index + horizon
+            record[f'return_{horizon}'] = (closes[target] / closes[index] - 1
+                                           if target < len(closes) else np.nan)
+
+
+def _load_symbol(symbol: str, history_dir: str, start_time: int, end_time: int,
+                 horizons: Sequence[int], overrides: Dict):
+    """应用参数覆盖并读取回测所需的K线（含预热和前瞻部分），返回 (klines, start_index, stop_index)"""
+    for name, value in (overrides or {}).items():
+        setattr(Config, name, value)
+
+    warmup = max(Config.CACHE_KLINES_COUNT, Config.INDICATOR_WARMUP_KLINES)
+    history = KlineHistory(history_dir, symbol, "1h")
+    load_from = None if start_time is None else start_time - warmup * 3600000
+    load_to = None if end_time is None else end_time + max(horizons) * 3600000
+    klines = history.load(load_from, load_to)
+
+    timestamps = klines[:, 0]
+    start_index = warmup if start_time is None else int(np.searchsorted(timestamps, start_time))
+    stop_index = None if end_time is None else int(np.searchsorted(timestamps, end_time, side='right'))
+    return klines, start_index, stop_index
+
+
+def backtest_symbol(symbol: str, history_dir: str, start_time: int = None, end_time: int = None,
+                    horizons: Sequence[int] = FORWARD_HORIZONS, overrides: Dict = None) -> List[Dict]:
+    """
+    回测单个交易对（在子进程中运行）
+
+    Args:
+        symbol: 交易对
+        history_dir: K线历史根目录
+        start_time/end_time: 作为B点检测的K线开盘时间范围（毫秒），None表示不限
+        horizons: 前瞻收益的K线数
+        overrides: 覆盖的 Config 参数，如 {'DOUBLE_PATTERN_ATR_THRESHOLD': 0.6}
+
+    Returns:
+        List[Dict]: 信号记录
+    """
+    klines, start_index, stop_index = _load_symbol(symbol, history_dir, start_time, end_time, horizons, overrides)
+    if len(klines) == 0:
+        return []
+
+    timestamps = klines[:, 0]
+    monitor = ReplayMonitor(symbol)
+    records = monitor.replay(symbol, klines, start_index, stop_index)
+    add_forward_returns(records, klines[:, 4], horizons)
+    for record in records:
+        for key in ('A_index', 'C_index'):
+            if record[key] is not None:
+                record[key.replace('index', 'time')] = int(timestamps[record[key]])
+    return records
+
+
+def scan_symbol(symbol: str, history_dir: str, start_time: int = None, end_time: int = None,
+                horizons: Sequence[int] = FORWARD_HORIZONS, overrides: Dict = None) -> List[Dict]:
+    """
+    用向量化扫描一次求出单个交易对历史中的全部双顶/双底（不含EMA趋势信号）
+
+    参数与返回值同 backtest_symbol，结果与逐根回放的双顶/双底信号一致
+    """
+    klines, start_index, stop_index = _load_symbol(symbol, history_dir, start_time, end_time, horizons, overrides)
+    if len(klines) == 0:
+        return []
+
+    timestamps = klines[:, 0]
+    engine = BatchSignalEngine(
+        a_point_start=Config.CACHE_A_POINT_START,
+        a_point_end=Config.CACHE_A_POINT_END,
+        atr_period=Config.ATR_PERIOD,
+        atr_threshold=Config.DOUBLE_PATTERN_ATR_THRESHOLD,
+        depth_threshold=Config.DOUBLE_PATTERN_DEPTH_THRESHOLD
+    )
+    result = engine.scan_history(klines, start_index)
+    keep = result['B_index'] < (len(klines) if stop_index is None else stop_index)
+
+    records = []
+    for i in np.nonzero(keep)[0]:
+        b_index = int(result['B_index'][i])
+        a_index = int(result['A_index'][i])
+        c_index = int(result['C_index'][i])
+        records.append({
+            'symbol': symbol,
+            'type': str(result['type'][i]),
+            'timestamp': int(result['timestamp'][i]),
+            'price': float(klines[b_index, 4]),
+            'A_index': a_index,
+            'B_index': b_index,
+            'C_index': c_index,
+            'atr': float(result['atr'][i]),
+            'A_time': int(timestamps[a_index]),
+            'C_time': int(timestamps[c_index])
+        })
+    add_forward_returns(records, klines[:, 4], horizons)
+    return records
+
+
+def run_backtest(symbols: List[str], history_dir: str, start_time: int = None, end_time: int = None,
+                 horizons: Sequence[int] = FORWARD_HORIZONS, overrides: Dict = None,
+                 workers: int = None, scan: bool = False) -> pd.DataFrame:
+    """
+    按交易对并行回测
+
+    Args:
+        workers: 进程数，默认使用全部CPU核心；为1时在当前进程中运行
+        scan: 为True时用向量化扫描代替逐根回放，只统计双顶/双底
+
+    Returns:
+        pd.DataFrame: 所有信号，按时间和交易对排序
+    """
+    workers = workers or os.cpu_count() or 1
+    args = [(symbol, history_dir, start_time, end_time, tuple(horizons), overrides) for symbol in symbols]
+
+    target = scan_symbol if scan else backtest_symbol
+    records = []
+    if workers == 1:
+        for arg in args:
+            records.extend(target(*arg))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(symbols))) as executor:
+            for result in executor.map(target, *zip(*args)):
+                records.extend(result)
+
+    frame = pd.DataFrame(records)
+    if frame.empty:
+        return frame
+    frame['time'] = pd.to_datetime(frame['timestamp'], unit='ms', utc=True)
+    return frame.sort_values(['timestamp', 'symbol']).reset_index(drop=True)
+
+
+def summarize(frame: pd.DataFrame, horizons: Sequence[int] = FORWARD_HORIZONS) -> pd.DataFrame:
+    """按信号类型汇总数量、平均收益和胜率（收益方向与信号预期方向一致的比例）"""
+    if frame.empty:
+        return pd.DataFrame()
+
+    rows = []
+    for signal_type, group in frame.groupby('type'):
+        direction = SIGNAL_DIRECTIONS.get(signal_type, 1)
+        row = {'type': signal_type, 'count': len(group)}
+        for horizon in horizons:
+            returns = group[f'return_{horizon}'].dropna()
+            row[f'mean_{horizon}'] = returns.mean()
+            row[f'win_{horizon}'] = (returns * direction > 0).mean() if len(returns) else np.nan
+        rows.append(row)
+    return pd.DataFrame(rows).set_index('type')
+
+
+def download_history(symbols: List[str], start_time: int):
+    """通过REST把K线历史补齐到最新，已有历史时只获取最新历史之后的部分"""
+    monitor = KlineMonitor(symbols)
+
+    def download(symbol: str) -> bool:
+        history = monitor.data_cache[symbol]['history']
+        if history is None:
+            return False
+        if len(history) and start_time < int(history.columns()['timestamp'][0]):
+            monitor.logger.warning(f"{symbol} 已有历史晚于起始时间，只能向后补齐")
+        begin = start_time if len(history) == 0 else history.last_timestamp + 3600000
+        klines = monitor.fetch_klines_range(symbol, begin)
+        if klines is None:
+            return False
+        history.append(klines)
+        monitor.logger.info(f"{symbol} 历史K线: {len(history)} 根")
+        return True
+
+    results = monitor.fetch_all(download, symbols)
+    monitor.fetch_executor.shutdown()
+    return results
+
+
+def _parse_date(value: str) -> int:
+    return int(datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def _parse_overrides(items: List[str]) -> Dict:
+    overrides = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        if not hasattr(Config, name):
+            raise ValueError(f"未知的配置项: {name}")
+        overrides[name] = type(getattr(Config, name))(value)
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description="双顶/双底与EMA趋势信号回测")
+    parser.add_argument('--symbols', nargs='+', default=Config.SYMBOLS, help="交易对列表")
+    parser.add_argument('--start', type=_parse_date, help="回测起始日期 YYYY-MM-DD（UTC）")
+    parser.add_argument('--end', type=_parse_date, help="回测结束日期 YYYY-MM-DD（UTC）")
+    parser.add_argument('--history-dir', default=Config.KLINE_HISTORY_DIR, help="K线历史目录")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="并行进程数")
+    parser.add_argument('--horizons', type=int, nargs='+', default=list(FORWARD_HORIZONS), help="前瞻收益K线数")
+    parser.add_argument('--set', dest='overrides', action='append', default=[], metavar="NAME=VALUE",
+                        help="覆盖Config参数，可重复")
+    parser.add_argument('--download', action='store_true', help="回测前通过REST补齐K线历史")
+    parser.add_argument('--scan', action='store_true', help="向量化扫描全部历史的双顶/双底，不逐根回放")
+    parser.add_argument('--output', help="信号明细CSV路径")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logging.getLogger("Backtest").setLevel(logging.WARNING)
+    try:
+        overrides = _parse_overrides(args.overrides)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.download:
+        Config.KLINE_HISTORY_DIR = args.history_dir
+        warmup = max(Config.CACHE_KLINES_COUNT, Config.INDICATOR_WARMUP_KLINES)
+        start = args.start if args.start is not None else _parse_date("2020-01-01")
+        download_history(args.symbols, start - warmup * 3600000)
+
+    started = time.monotonic()
+    frame = run_backtest(args.symbols, args.history_dir, args.start, args.end,
+                         args.horizons, overrides, args.workers, args.scan)
+    print(f"回测完成: {len(args.symbols)} 个交易对, {len(frame)} 个信号, 耗时 {time.monotonic() - started:.1f} 秒")
+
+    if frame.empty:
+        return
+    print(summarize(frame, args.horizons).to_string(float_format=lambda x: f"{x:.4f}"))
+
+    output = args.output or os.path.join(Config.DATA_DIR, f"backtest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    frame.to_csv(output, index=False)
+    print(f"信号明细已保存到: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,446 @@
+"""
+批量信号引擎 - 把全部交易对对齐成 (交易对 × K线) 矩阵，一次计算指标并生成信号掩码
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from indicators import atr_latest, atr_series, ema_series, macd_series, rsi_series
+
+
+def a_point_range(length: int, a_start: int, a_end: int) -> Tuple[int, int]:
+    """
+    A点搜索范围（闭区间索引）
+
+    缓存只保存已收盘K线，B点为最新收盘K线（索引 length-1），
+    范围与原先包含未收盘K线时的倒数第 a_start 到 a_end 根保持一致
+    """
+    start_index = max(0, length - a_end + 1)
+    end_index = min(length - 1, length - a_start + 1)
+    return start_index, end_index
+
+
+class UniverseMatrix:
+    """按最新K线右对齐的多交易对K线矩阵，历史较短的交易对左侧以NaN填充"""
+
+    def __init__(self, symbols: List[str], timestamp: np.ndarray, open_: np.ndarray,
+                 high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray):
+        self.symbols = symbols
+        self.timestamp = timestamp
+        self.open = open_
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    @property
+    def length(self) -> int:
+        return self.close.shape[1]
+
+
+def stack_universe(buffers: Dict[str, object], min_length: int,
+                   interval_ms: int = 3600000) -> Tuple[Optional[UniverseMatrix], List[str]]:
+    """
+    把最新K线时间一致的交易对堆叠成矩阵
+
+    Args:
+        buffers: {交易对: KlineBuffer}
+        min_length: 参与计算的最少K线数量
+        interval_ms: K线周期（毫秒），用于生成矩阵的时间轴
+
+    Returns:
+        Tuple[UniverseMatrix, List[str]]: 矩阵（没有可对齐的交易对时为None）和未能对齐的交易对
+    """
+    candidates = {symbol: buffer for symbol, buffer in buffers.items() if len(buffer) >= min_length}
+    skipped = [symbol for symbol in buffers if symbol not in candidates]
+    if not candidates:
+        return None, skipped
+
+    latest = max(buffer.last_timestamp for buffer in candidates.values())
+    aligned = []
+    for symbol, buffer in candidates.items():
+        if buffer.last_timestamp == latest:
+            aligned.append(symbol)
+        else:
+            skipped.append(symbol)
+
+    length = max(len(candidates[symbol]) for symbol in aligned)
+    shape = (len(aligned), length)
+    open_ = np.full(shape, np.nan)
+    high = np.full(shape, np.nan)
+    low = np.full(shape, np.nan)
+    close = np.full(shape, np.nan)
+    volume = np.full(shape, np.nan)
+    timestamp = latest - interval_ms * np.arange(length - 1, -1, -1, dtype=np.int64)
+
+    for row, symbol in enumerate(aligned):
+        buffer = candidates[symbol]
+        start = length - len(buffer)
+        open_[row, start:] = buffer.open
+        high[row, start:] = buffer.high
+        low[row, start:] = buffer.low
+        close[row, start:] = buffer.close
+        volume[row, start:] = buffer.volume
+
+    return UniverseMatrix(aligned, timestamp, open_, high, low, close, volume), skipped
+
+
+class BatchSignalEngine:
+    """
+    全市场批量指标与信号计算
+
+    所有指标沿时间轴对整个矩阵一次计算，双顶/双底和EMA趋势条件
+    以布尔掩码的形式同时对所有交易对求值，判定规则与
+    KlineMonitor.check_double_pattern / check_ema_trend 一致。
+    """
+
+    EMA_PERIODS = (21, 55, 144)
+
+    def __init__(self, a_point_start: int = 13, a_point_end: int = 34, atr_period: int = 14,
+                 atr_threshold: float = 0.8, depth_threshold: float = 2.3,
+                 convergence_threshold: float = 0.5, convergence_lookback: int = 21,
+                 rsi_period: int = 14, macd_params=(12, 26, 9)):
+        """
+        初始化引擎
+
+        Args:
+            a_point_start/a_point_end: A点范围（从最新收盘K线往左数）
+            atr_period: ATR周期
+            atr_threshold: A与B点差值阈值（ATR倍数）
+            depth_threshold: C点深度阈值（ATR倍数）
+            convergence_threshold: EMA聚合度阈值
+            convergence_lookback: EMA聚合度回溯周期
+            rsi_period: RSI周期
+            macd_params: MACD (fast, slow, signal) 参数
+        """
+        self.a_point_start = a_point_start
+        self.a_point_end = a_point_end
+        self.atr_period = atr_period
+        self.atr_threshold = atr_threshold
+        self.depth_threshold = depth_threshold
+        self.convergence_threshold = convergence_threshold
+        self.convergence_lookback = convergence_lookback
+        self.rsi_period = rsi_period
+        self.macd_params = macd_params
+
+    def compute_indicators(self, matrix: UniverseMatrix) -> Dict[str, np.ndarray]:
+        """计算所有交易对的指标，返回每个交易对最新（及上一根）K线的值"""
+        closes = matrix.close
+        result = {}
+
+        emas = {period: ema_series(closes, period) for period in self.EMA_PERIODS}
+        for period, series in emas.items():
+            result[f'ema{period}'] = series[:, -1]
+            result[f'prev_ema{period}'] = series[:, -2]
+
+        result['atr'] = atr_latest(matrix.high, matrix.low, closes, self.atr_period)
+
+        # EMA收敛度：回溯窗口内三条EMA都有值的位置上，宽度均值 / ATR
+        lookback = slice(-self.convergence_lookback, None)
+        stacked = np.stack([series[:, lookback] for series in emas.values()])
+        spans = stacked.max(axis=0) - stacked.min(axis=0)
+        valid = ~np.isnan(spans)
+        counts = valid.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            convergence = np.where(valid, spans, 0.0).sum(axis=1) / counts / result['atr']
+        result['convergence'] = np.where((counts > 0) & (result['atr'] > 0), convergence, 1.0)
+
+        result['rsi'] = rsi_series(closes, self.rsi_period)[:, -1]
+        macd_line, signal_line, histogram = macd_series(closes, *self.macd_params)
+        result['macd'] = macd_line[:, -1]
+        result['macd_signal'] = signal_line[:, -1]
+        result['macd_histogram'] = histogram[:, -1]
+        return result
+
+    def evaluate(self, matrix: UniverseMatrix) -> Dict[str, np.ndarray]:
+        """
+        计算指标并求值所有信号条件
+
+        Returns:
+            Dict[str, np.ndarray]: 指标值、A/B/C点、double_top / double_bottom /
+            uptrend / downtrend 布尔掩码及形态距离（double_top_distance / double_bottom_distance，
+            价格条件全部满足时 <=1），每个数组按 matrix.symbols 顺序排列
+        """
+        result = self.compute_indicators(matrix)
+        result.update(self._double_pattern_masks(matrix, result))
+        result.update(self._trend_masks(result))
+        return result
+
+    def scan_history(self, klines: np.ndarray, start_index: int = 0) -> Dict[str, np.ndarray]:
+        """
+        把单个交易对历史中的每根K线都当作B点，一次求出所有双顶/双底
+
+        A点为B点往左数第 a_point_start 到 a_point_end 根内的极值（与 a_point_range
+        一致），指标为截至B点的值，判定规则与 KlineMonitor.check_double_pattern 一致。
+
+        Args:
+            klines: (n, 6) 历史K线，列顺序见 KLINE_COLUMNS
+            start_index: 只返回B点索引不小于该值的信号，之前的K线仍用于指标预热
+
+        Returns:
+            Dict[str, np.ndarray]: 按B点排序的信号，键为 type / timestamp /
+            B_index / B / A_index / A / C_index / C / atr，索引为 klines 中的位置
+        """
+        timestamps = klines[:, 0].astype(np.int64)
+        highs = np.ascontiguousarray(klines[:, 2], dtype=np.float64)
+        lows = np.ascontiguousarray(klines[:, 3], dtype=np.float64)
+        closes = np.ascontiguousarray(klines[:, 4], dtype=np.float64)
+
+        first = self._first_scan_index(start_index)
+        if first is None or first >= len(klines):
+            return self._scan_result(timestamps, np.zeros(0, dtype=np.int64), {})
+
+        # 单个交易对按一维计算指标，再作为一行矩阵求值
+        emas = {period: ema_series(closes, period)[None, :] for period in self.EMA_PERIODS}
+        atr = atr_series(highs, lows, closes, self.atr_period)[None, :]
+        scan = {key: value[0] for key, value in
+                self._scan_patterns(highs[None, :], lows[None, :], atr, emas, first, len(klines)).items()}
+
+        double_top = scan['double_top']
+        b_index = np.arange(first, len(klines))
+        matched = np.nonzero(double_top | scan['double_bottom'])[0]
+        is_top = double_top[matched]
+
+        def pick(top_key: str, bottom_key: str) -> np.ndarray:
+            return np.where(is_top, scan[top_key][matched], scan[bottom_key][matched])
+
+        return self._scan_result(timestamps, b_index[matched], {
+            'type': np.where(is_top, 'double_top', 'double_bottom'),
+            'B': pick('B_top', 'B_bottom'),
+            'A_index': pick('A_top_index', 'A_bottom_index'),
+            'A': pick('A_top', 'A_bottom'),
+            'C_index': pick('C_bottom_index', 'C_top_index'),
+            'C': pick('C_bottom', 'C_top'),
+            'atr': scan['atr'][matched]
+        })
+
+    def scan_matrix(self, matrix: UniverseMatrix, first: int, stop: int = None) -> Dict[str, np.ndarray]:
+        """
+        把矩阵中第 first 到 stop（不含）列的K线都当作B点，一次求出所有交易对的信号
+
+        用于补检停机或轮询超时期间漏掉的K线；每一列的判定与该列为最新K线时
+        evaluate 的结果一致（指标从矩阵第一列开始预热）。
+
+        Returns:
+            Dict[str, np.ndarray]: double_top / double_bottom / uptrend / downtrend
+            掩码及 A/B/C 点和该列的 ema21 / ema55，形状为 (交易对 × 列)，索引为矩阵中的列；
+            B_index / timestamp 为对应的列号和开盘时间
+        """
+        stop = matrix.length if stop is None else stop
+        first = self._first_scan_index(first)
+        if first is None:
+            first = stop
+        first = min(max(first, 1), stop)
+
+        emas = {period: ema_series(matrix.close, period) for period in self.EMA_PERIODS}
+        atr = atr_series(matrix.high, matrix.low, matrix.close, self.atr_period)
+        result = self._scan_patterns(matrix.high, matrix.low, atr, emas, first, stop)
+        result.update(self._scan_trends(emas, atr, first, stop))
+        result['ema21'] = emas[21][:, first:stop]
+        result['ema55'] = emas[55][:, first:stop]
+        result['B_index'] = np.arange(first, stop)
+        result['timestamp'] = matrix.timestamp[first:stop]
+        return result
+
+    def _first_scan_index(self, start_index: int) -> Optional[int]:
+        """可以作为B点的第一列（A点和C点范围完整），A点范围无效时返回None"""
+        lead = self.a_point_end - 2
+        if lead - 1 < 1 or self.a_point_start < 2:
+            return None
+        return max(start_index, lead, 1)
+
+    def _scan_patterns(self, highs: np.ndarray, lows: np.ndarray, atr: np.ndarray,
+                       emas: Dict[int, np.ndarray], first: int, stop: int) -> Dict[str, np.ndarray]:
+        """
+        (交易对 × K线) 数组上以第 first 到 stop（不含）列为B点的双顶/双底掩码
+
+        B点 b 的A点范围为 [b - lead, b - lead + width - 1]，C点在A点之后、B点之前的
+        width_c 根内；各列取滑动窗口视图后一次求极值，并列时取第一个位置
+        """
+        sliding = np.lib.stride_tricks.sliding_window_view
+        lead = self.a_point_end - 2
+        width = self.a_point_end - self.a_point_start + 1
+        width_c = lead - 1
+        rows = np.arange(len(highs))[:, None]
+
+        a_first = np.arange(first, stop) - lead
+        a_windows = slice(first - lead, stop - lead)
+        c_windows = slice(first - lead + 1, stop - lead + 1)
+
+        top_offset = np.argmax(sliding(highs, width, axis=1)[:, a_windows], axis=2)
+        bottom_offset = np.argmin(sliding(lows, width, axis=1)[:, a_windows], axis=2)
+        a_top_index = a_first + top_offset
+        a_bottom_index = a_first + bottom_offset
+        a_top = highs[rows, a_top_index]
+        a_bottom = lows[rows, a_bottom_index]
+        b_top = highs[:, first:stop]
+        b_bottom = lows[:, first:stop]
+
+        columns = np.arange(width_c)
+        between_top = columns >= top_offset[..., None]
+        between_bottom = columns >= bottom_offset[..., None]
+        c_bottom_index = a_first + 1 + np.argmin(
+            np.where(between_top, sliding(lows, width_c, axis=1)[:, c_windows], np.inf), axis=2)
+        c_top_index = a_first + 1 + np.argmax(
+            np.where(between_bottom, sliding(highs, width_c, axis=1)[:, c_windows], -np.inf), axis=2)
+        c_bottom = lows[rows, c_bottom_index]
+        c_top = highs[rows, c_top_index]
+
+        atr = atr[:, first:stop]
+        ema21, ema55, ema144 = (emas[period][:, first:stop] for period in self.EMA_PERIODS)
+        required = np.stack([a_top, a_bottom, atr, ema21, ema55, ema144])
+        ready = np.all(np.nan_to_num(required) != 0, axis=0)
+
+        tolerance = self.atr_threshold * atr
+        depth = self.depth_threshold * atr
+        top_tolerance = ready & (np.abs(a_top - b_top) <= tolerance)
+        double_top = (
+            top_tolerance
+            & between_top.any(axis=2)
+            & (a_top - c_bottom >= depth)
+            & (b_top - c_bottom >= depth)
+            & ~((ema21 > ema55) & (ema55 > ema144))
+        )
+        double_bottom = (
+            ready
+            & ~double_top
+            & ~(top_tolerance & (a_top_index >= a_first + lead))  # 逐根检查在A点不早于B点时直接返回
+            & between_bottom.any(axis=2)
+            & (np.abs(a_bottom - b_bottom) <= tolerance)
+            & (c_top - a_bottom >= depth)
+            & (c_top - b_bottom >= depth)
+            & ~((ema21 < ema55) & (ema55 < ema144))
+        )
+
+        return {
+            'A_top': a_top, 'A_top_index': a_top_index,
+            'A_bottom': a_bottom, 'A_bottom_index': a_bottom_index,
+            'B_top': b_top, 'B_bottom': b_bottom,
+            'C_bottom': c_bottom, 'C_bottom_index': c_bottom_index,
+            'C_top': c_top, 'C_top_index': c_top_index,
+            'atr': atr, 'double_top': double_top, 'double_bottom': double_bottom,
+        }
+
+    def _scan_trends(self, emas: Dict[int, np.ndarray], atr: np.ndarray, first: int, stop: int) -> Dict[str, np.ndarray]:
+        """以第 first 到 stop（不含）列为最新K线的EMA趋势掩码，收敛度与 compute_indicators 一致"""
+        indicators = {}
+        for period in self.EMA_PERIODS:
+            indicators[f'ema{period}'] = emas[period][:, first:stop]
+            indicators[f'prev_ema{period}'] = emas[period][:, first - 1:stop - 1]
+
+        # 每列回溯 convergence_lookback 列（含本列）的EMA宽度，左侧不足时以NaN补齐
+        stacked = np.stack([emas[period] for period in self.EMA_PERIODS])
+        spans = stacked.max(axis=0) - stacked.min(axis=0)
+        lookback = self.convergence_lookback
+        padded = np.concatenate([np.full((len(spans), lookback - 1), np.nan), spans], axis=1)
+        windows = np.lib.stride_tricks.sliding_window_view(padded, lookback, axis=1)[:, first:stop]
+        valid = ~np.isnan(windows)
+        counts = valid.sum(axis=2)
+        atr = atr[:, first:stop]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            convergence = np.where(valid, windows, 0.0).sum(axis=2) / counts / atr
+        indicators['convergence'] = np.where((counts > 0) & (atr > 0), convergence, 1.0)
+        return self._trend_masks(indicators)
+
+    @staticmethod
+    def _scan_result(timestamps: np.ndarray, b_index: np.ndarray, columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        empty = {
+            'type': np.zeros(0, dtype='<U13'), 'B': np.zeros(0), 'A_index': np.zeros(0, dtype=np.int64),
+            'A': np.zeros(0), 'C_index': np.zeros(0, dtype=np.int64), 'C': np.zeros(0), 'atr': np.zeros(0)
+        }
+        result = {'timestamp': timestamps[b_index], 'B_index': b_index}
+        result.update(columns or empty)
+        return result
+
+    def _double_pattern_masks(self, matrix: UniverseMatrix, indicators: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        highs = matrix.high
+        lows = matrix.low
+        rows = np.arange(len(matrix))
+        length = matrix.length
+        b_index = length - 1
+        atr = indicators['atr']
+        ema21, ema55, ema144 = (indicators[f'ema{p}'] for p in self.EMA_PERIODS)
+
+        a_start, a_end = a_point_range(length, self.a_point_start, self.a_point_end)
+        a_top_index = a_start + np.argmax(highs[:, a_start:a_end + 1], axis=1)
+        a_bottom_index = a_start + np.argmin(lows[:, a_start:a_end + 1], axis=1)
+        a_top = highs[rows, a_top_index]
+        a_bottom = lows[rows, a_bottom_index]
+        b_top = highs[:, b_index]
+        b_bottom = lows[:, b_index]
+
+        # C点：A与B之间（不含A、B本身）的最低/最高点，只需看A点范围之后的列
+        columns = np.arange(a_start, b_index)
+        between_top = (columns > a_top_index[:, None])
+        between_bottom = (columns > a_bottom_index[:, None])
+        c_bottom_index = a_start + np.argmin(np.where(between_top, lows[:, a_start:b_index], np.inf), axis=1)
+        c_top_index = a_start + np.argmax(np.where(between_bottom, highs[:, a_start:b_index], -np.inf), axis=1)
+        c_bottom = lows[rows, c_bottom_index]
+        c_top = highs[rows, c_top_index]
+
+        # 与逐个交易对检查一致：任一必要值缺失或为0时不判定
+        required = np.stack([a_top, a_bottom, atr, ema21, ema55, ema144])
+        ready = np.all(np.nan_to_num(required) != 0, axis=0)
+
+        tolerance = self.atr_threshold * atr
+        depth = self.depth_threshold * atr
+        double_top = (
+            ready
+            & between_top.any(axis=1)
+            & (np.abs(a_top - b_top) <= tolerance)
+            & (a_top - c_bottom >= depth)
+            & (b_top - c_bottom >= depth)
+            & ~((ema21 > ema55) & (ema55 > ema144))
+        )
+        double_bottom = (
+            ready
+            & ~double_top
+            & between_bottom.any(axis=1)
+            & (np.abs(a_bottom - b_bottom) <= tolerance)
+            & (c_top - a_bottom >= depth)
+            & (c_top - b_bottom >= depth)
+            & ~((ema21 < ema55) & (ema55 < ema144))
+        )
+
+        # 形态距离：A/B差值和C点深度条件中最不满足的比值，<=1 表示价格条件全部满足
+        def distance(ab_gap, depth_a, depth_b, usable):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratios = np.stack([
+                    ab_gap / tolerance,
+                    np.where(depth_a > 0, depth / depth_a, np.inf),
+                    np.where(depth_b > 0, depth / depth_b, np.inf),
+                ])
+            return np.where(ready & usable, np.nan_to_num(ratios.max(axis=0), nan=np.inf), np.inf)
+
+        return {
+            'A_top': a_top, 'A_top_index': a_top_index,
+            'A_bottom': a_bottom, 'A_bottom_index': a_bottom_index,
+            'B_top': b_top, 'B_bottom': b_bottom,
+            'B_index': np.full(len(matrix), b_index),
+            'C_bottom': c_bottom, 'C_bottom_index': c_bottom_index,
+            'C_top': c_top, 'C_top_index': c_top_index,
+            'double_top': double_top, 'double_bottom': double_bottom,
+            'double_top_distance': distance(np.abs(a_top - b_top), a_top - c_bottom, b_top - c_bottom,
+                                            between_top.any(axis=1)),
+            'double_bottom_distance': distance(np.abs(a_bottom - b_bottom), c_top - a_bottom, c_top - b_bottom,
+                                               between_bottom.any(axis=1)),
+        }
+
+    def _trend_masks(self, indicators: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        current = [indicators[f'ema{p}'] for p in self.EMA_PERIODS]
+        previous = [indicators[f'prev_ema{p}'] for p in self.EMA_PERIODS]
+        ready = ~np.isnan(current[2]) & ~np.isnan(previous[2])
+        converged = indicators['convergence'] < self.convergence_threshold
+
+        current_up = (current[0] > current[1]) & (current[1] > current[2])
+        prev_up = (previous[0] > previous[1]) & (previous[1] > previous[2])
+        current_down = (current[0] < current[1]) & (current[1] < current[2])
+        prev_down = (previous[0] < previous[1]) & (previous[1] < previous[2])
+
+        uptrend = ready & current_up & ~prev_up & converged
+        downtrend = ready & ~uptrend & current_down & ~prev_down & converged
+        return {'uptrend': uptrend, 'downtrend': downtrend}
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+EMA收敛度微基准 - 对比最初的逐窗口重算实现和增量指标状态
+
+增量状态每次计时调用推进一根新K线，与实盘每根收盘K线的工作量相同。计时前后两种
+实现的收敛度都必须一致（相对误差不超过 --rtol），否则以非零状态退出。
+
+用法示例：
+    python bench_convergence.py
+    python bench_convergence.py --bars 200 1000 --repeat 5
+"""
+
+import argparse
+import sys
+import timeit
+
+import numpy as np
+
+from indicators import IndicatorState, atr_latest
+from kline_store import KlineBuffer
+
+HOUR = 3600000
+LOOKBACK = 21
+
+
+def _ema(prices, period: int) -> float:
+    """最初的单值EMA（纯Python，前 period 个值取SMA作为种子）"""
+    if len(prices) < period:
+        return 0.0
+    multiplier = 2 / (period + 1)
+    ema = sum(prices[:period]) / period
+    for i in range(period, len(prices)):
+        ema = (prices[i] * multiplier) + (ema * (1 - multiplier))
+    return ema
+
+
+def convergence_loop(closes, atr: float) -> float:
+    """最初的实现：回溯窗口内每个位置截取收盘价，重新计算三条完整EMA"""
+    if len(closes) < 144:
+        return 1.0
+    closes = list(closes)
+    ratios = []
+    for i in range(LOOKBACK):
+        current_closes = closes[:-(i) if i > 0 else len(closes)]
+        if len(current_closes) < 144:
+            continue
+        values = [_ema(current_closes, period) for period in (21, 55, 144)]
+        if atr > 0:
+            ratios.append((max(values) - min(values)) / atr)
+    if not ratios:
+        return 1.0
+    return sum(ratios) / len(ratios)
+
+
+def make_klines(count: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    closes = 100 + np.cumsum(rng.normal(0, 1, count))
+    opens = np.r_[closes[0], closes[:-1]]
+    highs = np.maximum(opens, closes) + rng.random(count)
+    lows = np.minimum(opens, closes) - rng.random(count)
+    timestamps = HOUR * np.arange(count)
+    return np.column_stack([timestamps, opens, highs, lows, closes, rng.random(count) * 1000])
+
+
+def bench(bars: int, repeat: int, rtol: float) -> bool:
+    numbers = {'loop': 5, 'incremental': 200}
+    # 计时期间增量状态消耗的新K线预先生成，每次调用推进不同的一根
+    klines = make_klines(bars + numbers['incremental'] * repeat, seed=bars)
+    buffer = KlineBuffer(bars)
+    buffer.extend(klines[:bars])
+    state = IndicatorState(lookback=LOOKBACK)
+    state.sync(buffer)
+    closes = buffer.close
+    atr = float(atr_latest(buffer.high, buffer.low, closes, 14))
+
+    ratios = {
+        'loop': convergence_loop(closes, atr),
+        'incremental': state.ema_convergence(atr),
+    }
+    ok = bool(np.isclose(ratios['incremental'], ratios['loop'], rtol=rtol, atol=0))
+
+    position = bars
+
+    def incremental():
+        nonlocal position
+        row = klines[position]
+        position += 1
+        state.update(int(row[0]), float(row[2]), float(row[3]), float(row[4]))
+        return state.ema_convergence(atr)
+
+    timers = {
+        'loop': lambda: convergence_loop(closes, atr),
+        'incremental': incremental,
+    }
+    results = {}
+    for name, func in timers.items():
+        number = numbers[name]
+        results[name] = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+    # 推进过全部新K线的增量状态应与对完整历史重算的结果一致
+    ok = ok and bool(np.isclose(state.ema_convergence(atr), convergence_loop(klines[:position, 4], atr),
+                                rtol=rtol, atol=0))
+
+    baseline = results['loop']
+    print(f"{bars} 根K线{'' if ok else '（结果不一致）'}")
+    for name, best in results.items():
+        print(f"  {name:<12} {best * 1e3:8.3f} ms  {baseline / best:6.1f}x  收敛度 {ratios[name]:.12f}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EMA收敛度微基准")
+    parser.add_argument('--bars', type=int, nargs='+', default=[200, 1000], help="缓冲区K线数量")
+    parser.add_argument('--repeat', type=int, default=5, help="timeit 重复次数（取最优）")
+    parser.add_argument('--rtol', type=float, default=1e-9, help="收敛度允许的相对误差")
+    args = parser.parse_args()
+
+    ok = all([bench(bars, args.repeat, args.rtol) for bars in args.bars])
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
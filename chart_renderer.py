@@ -0,0 +1,500 @@
+"""
+图表渲染模块 - 在独立的工作进程中绘制信号图表
+
+主进程只把最近55根K线、指标尾部和A/B/C点打包成紧凑的数组交给渲染进程池，
+检测和文字通知不再等待 matplotlib 绘图；工作进程使用无界面的 Agg 后端，并复用同一个
+图表模板，每张图表只更新数据（见 SignalChartTemplate）。图片按输出配置（OUTPUT_PROFILES）
+直接编码到内存交给上传，是否另存到磁盘可选。
+"""
+
+import io
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.layout_engine import TightLayoutEngine
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger("ChartRenderer")
+
+# 图表显示的K线数量
+CHART_KLINES = 55
+
+# 绘图用到的A/B/C点字段（价格与缓冲区索引）
+PATTERN_POINT_KEYS = (
+    'A_top', 'A_top_index', 'A_bottom', 'A_bottom_index',
+    'B_top', 'B_top_index', 'B_bottom', 'B_bottom_index',
+    'C_top', 'C_top_index', 'C_bottom', 'C_bottom_index'
+)
+
+
+# 输出配置：分辨率、格式和调色板颜色数（None 表示保留全彩）
+OUTPUT_PROFILES = {
+    # 发送到Telegram：Telegram 会重新压缩图片，1800x1920 的256色PNG在手机和桌面端都足够清晰
+    'telegram': {'dpi': 120, 'format': 'png', 'colors': 256},
+    # 存档：与早期版本一致的300dpi全彩PNG
+    'archive': {'dpi': 300, 'format': 'png', 'colors': None}
+}
+
+# 柱状图和成交量柱的宽度（与 ax.bar 默认值一致）
+BAR_WIDTH = 0.8
+
+# 坐标轴两侧留白比例（与 matplotlib 自动缩放的默认边距一致）
+AXIS_MARGIN = 0.05
+
+# 各形态的A/B/C点字段和标注偏移，以及A点参考线的颜色和图例
+PATTERN_LAYOUT = {
+    'double_top': {
+        'A': ('A_top', (5, 10)),
+        'B': ('B_top', (5, 10)),
+        'C': ('C_bottom', (5, -15)),
+        'line': ('red', 'Double Top Line')
+    },
+    'double_bottom': {
+        'A': ('A_bottom', (5, -15)),
+        'B': ('B_bottom', (5, -15)),
+        'C': ('C_top', (5, 10)),
+        'line': ('green', 'Double Bottom Line')
+    }
+}
+POINT_COLORS = {'A': 'red', 'B': 'blue', 'C': 'green'}
+
+
+def _axis_limits(low: float, high: float) -> Tuple[float, float]:
+    """按自动缩放的方式在数据范围两侧留白"""
+    span = high - low
+    if span <= 0:
+        span = abs(high) or 1.0
+    return low - span * AXIS_MARGIN, high + span * AXIS_MARGIN
+
+
+def _finite_range(*arrays) -> Tuple[float, float]:
+    """多组数据中有限值的最小值和最大值"""
+    values = np.concatenate([np.ravel(np.asarray(array, dtype=np.float64)) for array in arrays])
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return 0.0, 1.0
+    return float(values.min()), float(values.max())
+
+
+def _bar_verts(x: np.ndarray, heights: np.ndarray) -> np.ndarray:
+    """从0到 heights 的矩形顶点，形状为 (n, 4, 2)，无值的柱高度为0"""
+    heights = np.nan_to_num(heights)
+    left = x - BAR_WIDTH / 2
+    right = x + BAR_WIDTH / 2
+    zeros = np.zeros(len(x))
+    xs = np.column_stack([left, left, right, right])
+    ys = np.column_stack([zeros, heights, heights, zeros])
+    return np.stack([xs, ys], axis=-1)
+
+
+def _pattern_points(signal_type: str, points: Dict, chart_start_index: int) -> Dict[str, Tuple[int, float]]:
+    """落在图表范围内的A/B/C点：{名称: (图表内位置, 价格)}"""
+    layout = PATTERN_LAYOUT.get(signal_type)
+    if layout is None:
+        return {}
+
+    positions = {}
+    for name in POINT_COLORS:
+        key = layout[name][0]
+        price = points.get(key)
+        index = points.get(f'{key}_index')
+        if price and index is not None and index >= chart_start_index:
+            positions[name] = (index - chart_start_index, price)
+    return positions
+
+
+def _connect_bc(line, positions: Dict[str, Tuple[int, float]], values: np.ndarray) -> bool:
+    """把 line 设为连接C点和B点处 values 的线段，任一点无值时隐藏"""
+    visible = False
+    if 'B' in positions and 'C' in positions:
+        b_pos, c_pos = positions['B'][0], positions['C'][0]
+        if 0 <= b_pos < len(values) and 0 <= c_pos < len(values):
+            visible = bool(np.isfinite(values[b_pos]) and np.isfinite(values[c_pos]))
+    # 隐藏的线也参与图例自动定位，所以同时清空数据
+    if visible:
+        line.set_data([c_pos, b_pos], [values[c_pos], values[b_pos]])
+    else:
+        line.set_data([], [])
+    line.set_visible(visible)
+    return visible
+
+
+class SignalChartTemplate:
+    """
+    可复用的信号图表模板
+
+    4个子图及其中的K线、成交量、指标线、A/B/C标注和参考线只创建一次，每张图表
+    只替换数据后保存。K线影线、实体和柱状图分别用一个集合绘制，不再逐根调用 ax.plot。
+    """
+
+    def __init__(self):
+        self.fig, (ax1, ax2, ax3, ax4) = plt.subplots(4, 1, figsize=(15, 16),
+                                                      gridspec_kw={'height_ratios': [3, 0.8, 1, 1]})
+        self.ax_price, self.ax_volume, self.ax_macd, self.ax_rsi = ax1, ax2, ax3, ax4
+
+        # 主图：K线影线和实体（绿涨红跌），端点样式与 ax.plot 一致
+        self.wicks = LineCollection([], colors='black', linewidths=0.8, capstyle='projecting')
+        self.bodies = LineCollection([], linewidths=3, capstyle='projecting')
+        ax1.add_collection(self.wicks, autolim=False)
+        ax1.add_collection(self.bodies, autolim=False)
+        # 图例自动定位只避让折线和多边形，不看 LineCollection；用一条不绘制的影线路径代替K线参与定位
+        self.candle_outline = ax1.plot([], [], visible=False)[0]
+        self.ema_lines = [ax1.plot([], [], color, label=f'EMA{period}', linewidth=1.5)[0]
+                          for period, color in ((21, 'yellow'), (55, 'green'), (144, 'red'))]
+
+        # 关键点标记、标注、C-B连线和A点参考线
+        self.point_markers = {}
+        self.point_labels = {}
+        for name, color in POINT_COLORS.items():
+            self.point_markers[name] = ax1.plot([], [], 'o', color=color, markersize=10, zorder=5)[0]
+            self.point_labels[name] = ax1.annotate(name, (0, 0), xytext=(5, 10), textcoords='offset points',
+                                                   fontsize=12, color=color, weight='bold')
+        self.price_bc_line = ax1.plot([], [], color='orange', linewidth=2, linestyle='-', alpha=0.8,
+                                      label='C-B Line')[0]
+        self.pattern_line = ax1.axhline(y=0, linestyle='--', alpha=0.5)
+        ax1.grid(True, alpha=0.3)
+
+        # 成交量图
+        self.volume_bars = PolyCollection([], alpha=0.7, edgecolors='none')
+        ax2.add_collection(self.volume_bars, autolim=False)
+        self.volume_bc_line = ax2.plot([], [], color='orange', linewidth=2, linestyle='-', alpha=0.8,
+                                       label='C-B Volume Line')[0]
+        ax2.set_title('Volume')
+        ax2.grid(True, alpha=0.3)
+
+        # MACD图
+        self.macd_line = ax3.plot([], [], 'blue', label='MACD', linewidth=1.5)[0]
+        self.signal_line = ax3.plot([], [], 'red', label='Signal', linewidth=1.5)[0]
+        self.histogram_bars = PolyCollection([], alpha=0.7, edgecolors='none', label='Histogram')
+        ax3.add_collection(self.histogram_bars, autolim=False)
+        self.macd_bc_line = ax3.plot([], [], color='orange', linewidth=2, linestyle='-', alpha=0.8,
+                                     label='C-B MACD Line')[0]
+        ax3.axhline(y=0, color='black', linestyle='-', linewidth=0.5)
+        ax3.set_title('MACD')
+        ax3.grid(True, alpha=0.3)
+
+        # RSI图
+        self.rsi_line = ax4.plot([], [], 'purple', label='RSI', linewidth=1.5)[0]
+        self.rsi_bc_line = ax4.plot([], [], color='orange', linewidth=2, linestyle='-', alpha=0.8,
+                                    label='C-B RSI Line')[0]
+        self.rsi_levels = [
+            ax4.axhline(y=70, color='red', linestyle='--', alpha=0.7, label='Overbought'),
+            ax4.axhline(y=30, color='green', linestyle='--', alpha=0.7, label='Oversold')
+        ]
+        ax4.axhline(y=50, color='black', linestyle='-', alpha=0.3)
+        ax4.set_ylim(0, 100)
+        ax4.set_title('RSI')
+        ax4.grid(True, alpha=0.3)
+
+        self._layout = TightLayoutEngine()
+        self._applied_layout = None
+
+    def render(self, chart: Dict):
+        """用 chart 中的数据更新模板，之后用 export() 输出图片"""
+        opens = np.asarray(chart['open'], dtype=np.float64)
+        highs = np.asarray(chart['high'], dtype=np.float64)
+        lows = np.asarray(chart['low'], dtype=np.float64)
+        closes = np.asarray(chart['close'], dtype=np.float64)
+        volumes = np.asarray(chart['volume'], dtype=np.float64)
+        emas = [np.asarray(chart[key], dtype=np.float64) for key in ('ema21', 'ema55', 'ema144')]
+        macd_line = np.asarray(chart['macd'], dtype=np.float64)
+        signal_line = np.asarray(chart['signal'], dtype=np.float64)
+        histogram = np.asarray(chart['histogram'], dtype=np.float64)
+        rsi_values = np.asarray(chart['rsi'], dtype=np.float64)
+        signal_type = chart['signal_type']
+        layout = PATTERN_LAYOUT.get(signal_type)
+        positions = _pattern_points(signal_type, chart['points'], chart['chart_start'])
+
+        x = np.arange(len(closes), dtype=np.float64)
+        line_xlim = _axis_limits(0, len(x) - 1)
+        bar_xlim = _axis_limits(-BAR_WIDTH / 2, len(x) - 1 + BAR_WIDTH / 2)
+        rising = closes >= opens
+
+        # 主图：K线和EMA（指标序列与K线等长，无值的位置为NaN）
+        self.wicks.set_segments(np.stack([np.column_stack([x, lows]), np.column_stack([x, highs])], axis=1))
+        self.bodies.set_segments(np.stack([np.column_stack([x, opens]), np.column_stack([x, closes])], axis=1))
+        self.bodies.set_color(np.where(rising, 'green', 'red'))
+        self.candle_outline.set_data(np.repeat(x, 3), np.column_stack([lows, highs, np.full(len(x), np.nan)]).ravel())
+        for line, values in zip(self.ema_lines, emas):
+            line.set_data(x, values)
+
+        # 标记关键点（如果是双顶/双底信号）
+        for name, marker in self.point_markers.items():
+            label = self.point_labels[name]
+            if name in positions:
+                marker.set_data([positions[name][0]], [positions[name][1]])
+                label.xy = positions[name]
+                label.xyann = layout[name][1]
+            else:
+                marker.set_data([], [])
+            marker.set_visible(name in positions)
+            label.set_visible(name in positions)
+
+        price_handles = list(self.ema_lines)
+        point_prices = [price for _, price in positions.values()]
+        if 'B' in positions and 'C' in positions:
+            (b_pos, b_price), (c_pos, c_price) = positions['B'], positions['C']
+            self.price_bc_line.set_data([c_pos, b_pos], [c_price, b_price])
+            price_handles.append(self.price_bc_line)
+        else:
+            self.price_bc_line.set_data([], [])
+        self.price_bc_line.set_visible('B' in positions and 'C' in positions)
+
+        # 双顶/双底参考线
+        a_price = chart['points'].get(layout['A'][0]) if layout else None
+        if a_price:
+            color, line_label = layout['line']
+            self.pattern_line.set_ydata([a_price, a_price])
+            self.pattern_line.set_color(color)
+            self.pattern_line.set_label(line_label)
+            price_handles.append(self.pattern_line)
+            point_prices.append(a_price)
+        else:
+            self.pattern_line.set_ydata([np.nan, np.nan])
+        self.pattern_line.set_visible(bool(a_price))
+
+        ax1 = self.ax_price
+        ax1.set_xlim(*line_xlim)
+        ax1.set_ylim(*_axis_limits(*_finite_range(lows, highs, *emas, point_prices)))
+        ax1.set_title(f'{chart["symbol"]} {chart["timeframe"]} - {signal_type} Signal - {chart["title_time"]}',
+                      fontsize=14)
+        ax1.legend(handles=price_handles)
+
+        # 成交量图 - 绿涨红跌，连接BC点对应的成交量
+        self.volume_bars.set_verts(_bar_verts(x, volumes))
+        self.volume_bars.set_facecolor(np.where(rising, 'green', 'red'))
+        _connect_bc(self.volume_bc_line, positions, volumes)
+        self.ax_volume.set_xlim(*bar_xlim)
+        self.ax_volume.set_ylim(0, _axis_limits(0, _finite_range(volumes, [0])[1])[1])
+
+        # MACD图，连接BC点对应的MACD柱状图顶点
+        self.macd_line.set_data(x, macd_line)
+        self.signal_line.set_data(x, signal_line)
+        self.histogram_bars.set_verts(_bar_verts(x, histogram))
+        self.histogram_bars.set_facecolor(np.where(histogram >= 0, 'green', 'red'))
+        macd_handles = [self.macd_line, self.signal_line]
+        if _connect_bc(self.macd_bc_line, positions, histogram):
+            macd_handles.append(self.macd_bc_line)
+        macd_handles.append(self.histogram_bars)
+        self.ax_macd.set_xlim(*bar_xlim)
+        self.ax_macd.set_ylim(*_axis_limits(*_finite_range(macd_line, signal_line, histogram, [0])))
+        self.ax_macd.legend(handles=macd_handles)
+
+        # RSI图，连接BC点对应的RSI点
+        self.rsi_line.set_data(x, rsi_values)
+        rsi_handles = [self.rsi_line]
+        if _connect_bc(self.rsi_bc_line, positions, rsi_values):
+            rsi_handles.append(self.rsi_bc_line)
+        self.ax_rsi.set_xlim(*line_xlim)
+        self.ax_rsi.legend(handles=rsi_handles + self.rsi_levels)
+
+        # 只有纵轴刻度标签宽度变化时才重新计算紧凑布局；直接执行布局引擎而不挂到图上，
+        # 保存时不会再多做一遍不输出的绘制
+        layout_key = self._layout_key()
+        if layout_key != self._applied_layout:
+            self._layout.execute(self.fig)
+            self._applied_layout = layout_key
+
+    def export(self, profile: Dict) -> bytes:
+        """按输出配置把当前图表编码为图片数据（不经过磁盘）"""
+        buffer = io.BytesIO()
+        dpi = profile['dpi']
+        if not profile.get('colors'):
+            self.fig.savefig(buffer, format=profile['format'], dpi=dpi)
+            return buffer.getvalue()
+
+        # 调色板输出：取未编码的RGBA像素，量化为 colors 色后再编码，图片体积约为全彩的三分之一
+        self.fig.savefig(buffer, format='rgba', dpi=dpi)
+        width = int(self.fig.get_figwidth() * dpi)
+        height = len(buffer.getbuffer()) // (4 * width)
+        image = Image.frombuffer('RGBA', (width, height), buffer.getbuffer(), 'raw', 'RGBA', 0, 1)
+        image = image.convert('RGB').quantize(colors=profile['colors'], method=Image.Quantize.FASTOCTREE,
+                                              dither=Image.Dither.NONE)
+        output = io.BytesIO()
+        image.save(output, format=profile['format'].upper())
+        return output.getvalue()
+
+    def _layout_key(self) -> Tuple:
+        """各子图纵轴最宽的刻度标签（数字统一为0）和偏移文本，决定紧凑布局的边距"""
+        key = []
+        for ax in (self.ax_price, self.ax_volume, self.ax_macd, self.ax_rsi):
+            formatter = ax.yaxis.get_major_formatter()
+            labels = formatter.format_ticks(ax.yaxis.get_major_locator()())
+            widest = max(labels, key=len, default='')
+            key.append((re.sub(r'\d', '0', widest), formatter.get_offset()))
+        return tuple(key)
+
+
+_template: Optional[SignalChartTemplate] = None
+_template_lock = threading.Lock()
+
+
+def _get_template() -> SignalChartTemplate:
+    global _template
+    if _template is None:
+        _template = SignalChartTemplate()
+    return _template
+
+
+def _init_worker():
+    """渲染进程初始化：固定 Agg 后端和字体设置，并预先构建图表模板"""
+    matplotlib.use('Agg')
+    plt.rcParams['font.sans-serif'] = ['SimHei', 'Arial Unicode MS', 'DejaVu Sans']
+    plt.rcParams['axes.unicode_minus'] = False
+    with _template_lock:
+        _get_template()
+
+
+def render_signal_chart(chart: Dict) -> Dict:
+    """
+    绘制信号图表，返回内存中的图片数据，按需另存一份到磁盘
+
+    Args:
+        chart: 绘图数据（见 KlineMonitor._chart_payload），包含最近55根K线的OHLCV、
+            与K线等长的 EMA/MACD/RSI 序列（无值处为NaN）、A/B/C点、图表首根K线
+            在缓冲区中的索引 chart_start，以及输出配置：
+            profile（发送用）、archive_profile（存盘用，空值不存盘）、directory 和 name
+
+    Returns:
+        Dict: image（图片数据）、filename（文件名）、path（存盘路径或 None）、
+            bytes（图片字节数）和 elapsed（绘制耗时秒数）
+    """
+    started = time.perf_counter()
+    profile = OUTPUT_PROFILES[chart['profile']]
+    archive_name = chart.get('archive_profile')
+    path = None
+
+    with _template_lock:
+        template = _get_template()
+        template.render(chart)
+        image = template.export(profile)
+
+        if archive_name:
+            archive = OUTPUT_PROFILES[archive_name]
+            data = image if archive_name == chart['profile'] else template.export(archive)
+            os.makedirs(chart['directory'], exist_ok=True)
+            path = os.path.join(chart['directory'], f"{chart['name']}.{archive['format']}")
+            with open(path, 'wb') as f:
+                f.write(data)
+
+    return {
+        'image': image,
+        'filename': f"{chart['name']}.{profile['format']}",
+        'path': path,
+        'bytes': len(image),
+        'elapsed': time.perf_counter() - started
+    }
+
+
+class ChartRenderPool:
+    """
+    有界的图表渲染进程池
+
+    submit() 立即返回 Future，调用方继续检测和发送文字通知；排队和正在渲染的图表
+    达到 max_pending 时新的图表直接丢弃并计数，信号集中出现时不会无限积压。
+    工作进程在第一次提交时才启动，使用 spawn 方式避免复制主进程中的线程和连接。
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 16):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.render_seconds = 0.0
+        self.max_render_seconds = 0.0
+        self.image_bytes = 0
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+        return self._executor
+
+    def submit(self, chart: Dict) -> Optional[Future]:
+        """
+        提交一张图表
+
+        Returns:
+            Optional[Future]: 结果见 render_signal_chart；队列已满或进程池不可用时返回 None
+        """
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.dropped += 1
+                logger.warning(f"图表渲染队列已满（{self.pending}），丢弃 {chart['symbol']} {chart['signal_type']} 图表")
+                return None
+            self.pending += 1
+            self.submitted += 1
+
+            try:
+                future = self._ensure_executor().submit(render_signal_chart, chart)
+            except Exception as e:
+                # 工作进程异常退出后进程池不可再用，下次提交时重建
+                self.pending -= 1
+                self.failed += 1
+                self._executor = None
+                logger.error(f"提交图表渲染失败: {str(e)}")
+                return None
+
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future):
+        with self._lock:
+            self.pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+                return
+            self.completed += 1
+            result = future.result()
+            elapsed = result['elapsed']
+            self.image_bytes += result['bytes']
+            self.render_seconds += elapsed
+            self.max_render_seconds = max(self.max_render_seconds, elapsed)
+
+    def stats(self) -> Dict:
+        """返回进程池大小、当前队列深度和累计渲染统计"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'avg_render_ms': self.render_seconds / self.completed * 1000 if self.completed else 0.0,
+                'max_render_ms': self.max_render_seconds * 1000,
+                'avg_image_kb': self.image_bytes / self.completed / 1024 if self.completed else 0.0
+            }
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        return (f"进程 {stats['workers']}，队列 {stats['pending']}/{stats['max_pending']}，"
+                f"完成 {stats['completed']}，失败 {stats['failed']}，丢弃 {stats['dropped']}，"
+                f"平均 {stats['avg_render_ms']:.0f}ms，最长 {stats['max_render_ms']:.0f}ms，"
+                f"平均 {stats['avg_image_kb']:.0f}KB")
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
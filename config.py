@@ -19,6 +19,10 @@ class Config:
     # Telegram配置
     TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '8079021434:AAGcoQXZOxaBgkXPd6L9TKARegltWzTP3DU')
     TELEGRAM_CHANNEL_ID = os.getenv('TELEGRAM_CHANNEL_ID', '-1002434065698')
+    # 同时接收通知的其他频道（逗号分隔），图片只上传到 TELEGRAM_CHANNEL_ID 一次，其余频道按 file_id 转发
+    TELEGRAM_EXTRA_CHANNEL_IDS = [
+        channel.strip() for channel in os.getenv('TELEGRAM_EXTRA_CHANNEL_IDS', '').split(',') if channel.strip()
+    ]
     
     # 监控配置
     SYMBOLS = [
@@ -42,27 +46,105 @@ class Config:
     CACHE_A_POINT_START = 13  # A点范围开始（从最新收盘K线往左数）
     CACHE_A_POINT_END = 34    # A点范围结束
     CACHE_KLINES_COUNT = 200  # 缓存K线数量
+    INDICATOR_WARMUP_KLINES = 1000  # 指标预热K线数量（缓冲区容量）
     CHART_KLINES_COUNT = 55   # 图表显示K线数量
+    CHART_BARS_AFTER_SIGNAL = 5  # 补检信号的图表在B点之后多显示的K线数（窗口不超过最新K线）
     
     # API请求配置
     REQUEST_TIMEOUT = 10  # 请求超时时间（秒）
-    REQUEST_INTERVAL = 3  # 请求间隔时间（秒）
+    MAX_KLINES_PER_REQUEST = 1000  # 单次请求最多K线数量（币安上限）
+    FETCH_WORKERS = 16    # 获取K线的线程数（实际并发由请求调度器按剩余权重调整）
+    RATE_LIMIT_WEIGHT_PER_MINUTE = 6000  # 币安每分钟请求权重上限（按 X-MBX-USED-WEIGHT-1M 校正已用权重）
+    RATE_LIMIT_SAFETY = 0.8  # 最多使用权重上限的比例，超过时等待下一分钟，避免被限流
+    RATE_LIMIT_MIN_CONCURRENCY = 2  # 初始和最小并发请求数
+    OKX_RATE_LIMIT_PER_2S = 20  # OKX每2秒K线请求上限（历史K线接口为20次，近期接口为40次）
+    UPLOAD_TIMEOUT = 60   # 图片上传超时时间（秒）
     MAX_RETRIES = 2       # 最大重试次数
+    HTTP_POOL_SIZE = 16   # 每个主机的HTTP连接池大小（不小于 FETCH_WORKERS 才能全部复用连接）
+    HTTP_KEEP_ALIVE = True  # 是否复用长连接
     UPDATE_INTERVAL = 300 # 检测间隔时间（秒，默认5分钟）
     
+    # 收盘对齐调度：按交易所服务器时间在每根1小时K线收盘后 CANDLE_CLOSE_GUARD 秒开始一轮检测
+    CANDLE_CLOSE_GUARD = 1.0          # 收盘后的保护时间（秒），等交易所生成收盘K线
+    CANDLE_CLOSE_RETRIES = 3          # 收盘K线尚未生成的交易对在同一轮内的重试次数
+    CANDLE_CLOSE_RETRY_DELAY = 1.0    # 重试间隔（秒）
+    CLOCK_SYNC_SAMPLES = 3            # 每次时间同步的采样次数（取往返最快的一次）
+    NEAR_MISS_MARGIN = 0.1            # 形态距离不超过 1+该值 的交易对（差一点形成双顶/双底）下一轮优先获取和检测
+    LATENCY_SLO_SECONDS = 30          # 收盘到检测完成/信号发出的延迟目标（秒）
+    LATENCY_SLO_PERCENTILE = 95       # 按该百分位判断是否达标
+    LATENCY_SLO_WINDOW = 500          # 参与统计的最近样本数
+    
+    # 交易所路由：每次K线请求发往延迟最低的健康交易所，失败时依次切换（列表顺序为延迟相同时的优先级）
+    EXCHANGE_PRIORITY = [
+        exchange.strip() for exchange in os.getenv('EXCHANGE_PRIORITY', 'binance,okx').split(',') if exchange.strip()
+    ]
+    EXCHANGE_TIMEOUT = 5              # 单次K线请求超时时间（秒）
+    EXCHANGE_LATENCY_PRIOR = 1.0      # 尚未测量或长时间未使用的交易所按该延迟（秒）参与排序
+    EXCHANGE_FAILURE_THRESHOLD = 2    # 连续失败该次数后暂停使用该交易所
+    EXCHANGE_COOLDOWN = 30            # 首次暂停秒数，连续暂停时翻倍
+    EXCHANGE_MAX_COOLDOWN = 600       # 最长暂停秒数
+    EXCHANGE_PROBE_INTERVAL = 300     # 超过该秒数未使用的交易所重新参与排序
+    EXCHANGE_SWITCH_MARGIN = 0.5      # 其他交易所的延迟低于当前交易所的 1/(1+该值) 时才切换
+    
+    # K线获取方式：polling（每小时轮询REST）或 stream（WebSocket推送收盘K线）
+    INGESTION_MODE = os.getenv('INGESTION_MODE', 'polling')
+    STREAM_URL = os.getenv('STREAM_URL', 'wss://stream.binance.com:9443/stream')
+    STREAM_IDLE_TIMEOUT = 3900  # 推送静默超过该时间（秒）时执行一轮REST轮询兜底
+    STREAM_RECORD_PATH = os.getenv('STREAM_RECORD_PATH', '')  # 录制收盘K线推送，供回放使用
+    
+    # 漏检补查：停机或单轮超时后，补检上次检测之后收盘的K线
+    CATCH_UP_MAX_KLINES = 168  # 每个交易对最多补检的K线数量（只补检最近的部分）
+    # 由1小时K线在本地重采样并同样检测信号的高周期（逗号分隔，可选 4h/12h/1d，留空关闭）
+    # 冷启动时按其中最大的周期回填 (CACHE_KLINES_COUNT+1)*周期小时数 根1小时K线（日线约4800根，分页请求）；
+    # 从较短的旧历史热启动时，K线不足 CACHE_KLINES_COUNT 根的周期会告警并暂不检测
+    RESAMPLE_TIMEFRAMES = [
+        timeframe.strip() for timeframe in os.getenv('RESAMPLE_TIMEFRAMES', '4h,12h,1d').split(',') if timeframe.strip()
+    ]
+    
+    # 图表渲染进程池：检测和文字通知不等待绘图
+    CHART_WORKERS = 2      # 渲染进程数
+    CHART_QUEUE_SIZE = 16  # 排队和正在渲染的图表上限，超出时丢弃新图表
+    CHART_PROFILE = os.getenv('CHART_PROFILE', 'telegram')  # 发送用的输出配置（见 chart_renderer.OUTPUT_PROFILES）
+    CHART_ARCHIVE_PROFILE = os.getenv('CHART_ARCHIVE_PROFILE', '')  # 另存到 CHART_DIR 的输出配置，留空不存盘
+    
+    # Telegram发件箱：频道和群组每分钟最多20条，全部聊天合计每秒最多30条
+    TELEGRAM_SEND_WORKERS = 2             # 发送线程数
+    TELEGRAM_CHAT_RATE_PER_MINUTE = 20    # 每个聊天每分钟发送的消息数
+    TELEGRAM_CHAT_BURST = 3               # 每个聊天允许的突发消息数
+    TELEGRAM_GLOBAL_RATE_PER_SECOND = 30  # 全部聊天合计每秒发送的消息数
+    TELEGRAM_MAX_ATTEMPTS = 8             # 5xx或网络错误时的最多尝试次数
+    
+    # 通知模式：single 每个信号单独发送文字和图表；digest 把同一轮收盘的信号合并为汇总消息和媒体组
+    TELEGRAM_NOTIFY_MODE = os.getenv('TELEGRAM_NOTIFY_MODE', 'single')
+    DIGEST_WINDOW = 5          # 从第一个信号起收集同一批信号的秒数
+    DIGEST_MAX_WAIT = 30       # 等待图表渲染的最长秒数
+    DIGEST_GROUP_SIZE = 10     # 每个媒体组的图片数（Telegram上限10）
+    DIGEST_MAX_SIGNALS = 50    # 一批达到该信号数时不等窗口结束立即发送
+    
     # 文件路径配置
     LOG_DIR = os.getenv('LOG_DIR', "logs")
     CHART_DIR = os.getenv('CHART_DIR', "charts")
     DATA_DIR = os.getenv('DATA_DIR', "data")
+    KLINE_HISTORY_DIR = os.getenv('KLINE_HISTORY_DIR', os.path.join(DATA_DIR, "klines"))  # 磁盘K线历史目录
+    EVALUATION_STATE_FILE = os.getenv('EVALUATION_STATE_FILE', os.path.join(DATA_DIR, "last_evaluated.json"))  # 各交易对最后检测的K线
+    METRICS_FILE = os.getenv('METRICS_FILE', os.path.join(DATA_DIR, "metrics.json"))  # 每轮更新的运行指标（请求权重、交易所路由等）
+    OUTBOX_FILE = os.getenv('OUTBOX_FILE', os.path.join(DATA_DIR, "outbox.db"))  # 待发送的Telegram通知
+    SIGNAL_DB_FILE = os.getenv('SIGNAL_DB_FILE', os.path.join(DATA_DIR, "signals.db"))  # 历史信号库
+    SIGNAL_HISTORY_LIMIT = 200      # 每个交易对在内存中保留的最近信号数
+    SIGNAL_FSYNC_INTERVAL = 60      # 信号日志两次fsync之间的最长秒数
+    SIGNAL_FSYNC_BATCH = 100        # 未fsync的信号达到该条数时立即fsync
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')  # 日志级别配置
     
     # 交易所API端点
     EXCHANGE_ENDPOINTS = {
         "binance": {
-            "klines": "https://api.binance.com/api/v3/klines"
+            "klines": "https://api.binance.com/api/v3/klines",
+            "time": "https://api.binance.com/api/v3/time"
         },
         "okx": {
-            "klines": "https://www.okx.com/api/v5/market/candles"
+            "klines": "https://www.okx.com/api/v5/market/candles",
+            "history_klines": "https://www.okx.com/api/v5/market/history-candles",
+            "time": "https://www.okx.com/api/v5/public/time"
         }
     }
     
@@ -93,15 +175,16 @@ class Config:
         return True
     
     @classmethod
-    def get_symbol_mapping(cls, exchange: str) -> Dict[str, str]:
-        """获取交易对映射"""
+    def get_symbol_mapping(cls, exchange: str, symbols: List[str] = None) -> Dict[str, str]:
+        """获取交易对映射（默认为 SYMBOLS）"""
+        symbols = symbols or cls.SYMBOLS
         if exchange == "binance":
             # 币安不需要转换
-            return {symbol: symbol for symbol in cls.SYMBOLS}
+            return {symbol: symbol for symbol in symbols}
         elif exchange == "okx":
             # OKX使用不同的交易对格式
             mapping = {}
-            for symbol in cls.SYMBOLS:
+            for symbol in symbols:
                 if symbol.endswith("USDT"):
                     # BTCUSDT -> BTC-USDT
                     base = symbol[:-4]
@@ -110,7 +193,7 @@ class Config:
                     mapping[symbol] = symbol
             return mapping
         else:
-            return {symbol: symbol for symbol in cls.SYMBOLS}
+            return {symbol: symbol for symbol in symbols}
     
     @classmethod
     def create_directories(cls):
@@ -0,0 +1,481 @@
+"""
+交易所适配模块 - 币安和OKX的K线接口适配器，以及按健康度和延迟选择交易所的路由
+
+各适配器把交易对名称、周期参数、分页方式和响应格式转换为统一约定：
+返回按开盘时间升序的已收盘K线，形状为 (n, 6)，列顺序为 timestamp/open/high/low/close/volume，
+与 KlineBuffer 相同。路由对每次请求选择延迟最低的健康交易所，失败时依次切换到其他交易所。
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from http_client import HttpClient
+from rate_limiter import RequestScheduler
+from resampler import TIMEFRAME_MS
+
+logger = logging.getLogger("ExchangeRouter")
+
+
+class ExchangeError(Exception):
+    """交易所请求失败（网络错误、超时、限流或服务端错误），计入交易所的健康度"""
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SymbolNotListed(ExchangeError):
+    """交易所没有该交易对，只切换到其他交易所，不计入健康度"""
+
+
+class ExchangeAdapter:
+    """
+    交易所K线接口适配器基类
+
+    子类实现 fetch_klines()，每次请求经过该交易所的 RequestScheduler：发送前获取权重和并发许可，
+    响应后把已用权重响应头和状态码交给调度器。
+    """
+
+    name = ""
+
+    def __init__(self, http: HttpClient, endpoints: Dict[str, str], limiter: RequestScheduler,
+                 request_weight: float = 1, timeout: float = None, symbol_map: Dict[str, str] = None):
+        """
+        初始化适配器
+
+        Args:
+            http: 共享的HTTP客户端
+            endpoints: 接口地址，见 Config.EXCHANGE_ENDPOINTS
+            limiter: 该交易所的请求调度器
+            request_weight: 单次请求的默认权重，子类可按请求参数另行计算
+            timeout: 单次请求超时（秒），None表示使用HTTP客户端的默认值
+            symbol_map: 交易对到交易所代码的映射，见 Config.get_symbol_mapping
+        """
+        self.http = http
+        self.endpoints = endpoints
+        self.limiter = limiter
+        self.request_weight = request_weight
+        self.timeout = timeout
+        self.symbol_map = symbol_map or {}
+        self.clock_offset_ms = 0.0  # 交易所服务器时间 - 本地时间，由 ExchangeRouter.sync_clock 设置
+
+    def now_ms(self) -> float:
+        """按交易所服务器时间校正后的当前时间（毫秒）"""
+        return time.time() * 1000 + self.clock_offset_ms
+
+    def instrument(self, symbol: str) -> str:
+        """交易对在该交易所的代码"""
+        return self.symbol_map.get(symbol, symbol)
+
+    def _get(self, endpoint: str, params: Dict, weight: float = None):
+        """
+        发送一次请求
+
+        Args:
+            weight: 本次请求的权重，None表示使用 request_weight
+
+        Returns:
+            Tuple[requests.Response, float]: 响应和请求耗时（秒，不含限流等待）
+        """
+        self.limiter.acquire(self.request_weight if weight is None else weight)
+        kwargs = {'params': params}
+        if self.timeout is not None:
+            kwargs['timeout'] = self.timeout
+        started = time.perf_counter()
+        response = None
+        try:
+            response = self.http.get(self.endpoints[endpoint], **kwargs)
+        except Exception as e:
+            raise ExchangeError(f"{self.name} 请求异常: {str(e)}") from e
+        finally:
+            if response is None:
+                self.limiter.release()
+            else:
+                self.limiter.release(response.headers, response.status_code)
+        elapsed = time.perf_counter() - started
+
+        if response.status_code in (418, 429):
+            retry_after = response.headers.get('Retry-After')
+            raise ExchangeError(f"{self.name} 限流 (HTTP {response.status_code})",
+                                retry_after=float(retry_after) if retry_after else None)
+        if response.status_code >= 500:
+            raise ExchangeError(f"{self.name} 服务端错误 (HTTP {response.status_code})")
+        return response, elapsed
+
+    def fetch_klines(self, symbol: str, interval: str, limit: int, start_time: int = None,
+                     end_time: int = None) -> Tuple[np.ndarray, float]:
+        """
+        获取已收盘K线
+
+        指定 start_time/end_time（开盘时间，毫秒，含）时返回该范围内最早的 limit 根，
+        否则返回最新的 limit 根（其中未收盘的一根会被丢弃）
+
+        Returns:
+            Tuple[np.ndarray, float]: (n, 6) 的K线和平均每次请求的耗时（秒）
+
+        Raises:
+            ExchangeError: 请求失败
+        """
+        raise NotImplementedError
+
+    def server_time(self) -> int:
+        """
+        交易所服务器时间（毫秒）
+
+        Raises:
+            ExchangeError: 请求失败
+        """
+        raise NotImplementedError
+
+
+class BinanceAdapter(ExchangeAdapter):
+    """币安现货K线（/api/v3/klines），单次最多 1000 根"""
+
+    name = "binance"
+
+    # /api/v3/klines 的权重随 limit 变化：(limit 上限（不含）, 权重)，超过1000为10
+    KLINE_WEIGHTS = ((100, 1), (500, 2), (1001, 5))
+
+    def kline_weight(self, limit: int) -> int:
+        """一次K线请求的权重"""
+        for upper, weight in self.KLINE_WEIGHTS:
+            if limit < upper:
+                return weight
+        return 10
+
+    def fetch_klines(self, symbol: str, interval: str, limit: int, start_time: int = None,
+                     end_time: int = None) -> Tuple[np.ndarray, float]:
+        params = {
+            'symbol': self.instrument(symbol),
+            'interval': interval,
+            'limit': limit
+        }
+        if start_time is not None:
+            params['startTime'] = int(start_time)
+        if end_time is not None:
+            params['endTime'] = int(end_time)
+        response, elapsed = self._get('klines', params, weight=self.kline_weight(limit))
+
+        if response.status_code != 200:
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            if body.get('code') == -1121:
+                raise SymbolNotListed(f"binance 没有交易对 {symbol}")
+            raise ExchangeError(f"binance 请求失败 (HTTP {response.status_code}): {body.get('msg', '')}")
+
+        data = response.json()
+        if not data:
+            return np.empty((0, 6)), elapsed
+        rows = np.array([item[:7] for item in data], dtype=np.float64)
+        # 丢弃尚未收盘的K线（收盘时间在交易所当前时间之后）
+        return rows[rows[:, 6] < self.now_ms(), :6], elapsed
+
+    def server_time(self) -> int:
+        response, _ = self._get('time', {})
+        if response.status_code != 200:
+            raise ExchangeError(f"binance 获取服务器时间失败 (HTTP {response.status_code})")
+        return int(response.json()['serverTime'])
+
+
+class OkxAdapter(ExchangeAdapter):
+    """
+    OKX现货K线
+
+    最近的K线来自 /market/candles（每页最多300根），更早的自动改用
+    /market/history-candles（每页最多100根）。两个接口都按时间倒序分页返回，
+    这里统一换算为升序；周期按UTC对齐（日线使用 1Dutc）以与币安一致。
+    """
+
+    name = "okx"
+
+    BARS = {'1h': '1H', '4h': '4H', '12h': '12Hutc', '1d': '1Dutc'}
+    PAGE_LIMITS = {'klines': 300, 'history_klines': 100}
+
+    def instrument(self, symbol: str) -> str:
+        if symbol in self.symbol_map:
+            return self.symbol_map[symbol]
+        # BTCUSDT -> BTC-USDT
+        return f"{symbol[:-4]}-USDT" if symbol.endswith("USDT") else symbol
+
+    def fetch_klines(self, symbol: str, interval: str, limit: int, start_time: int = None,
+                     end_time: int = None) -> Tuple[np.ndarray, float]:
+        if interval not in self.BARS:
+            raise ExchangeError(f"okx 不支持的周期: {interval}")
+        instrument = self.instrument(symbol)
+
+        # 从区间上界往前翻页：after 返回开盘时间早于该值的K线，before 返回晚于该值的K线
+        upper = int(end_time) if end_time is not None else int(self.now_ms())
+        if start_time is not None:
+            upper = min(upper, int(start_time) + (limit - 1) * TIMEFRAME_MS[interval])
+        cursor = upper + 1
+
+        endpoint = 'klines'
+        pages = []
+        count = 0
+        total = 0.0
+        requests = 0
+        while count < limit:
+            params = {
+                'instId': instrument,
+                'bar': self.BARS[interval],
+                'limit': min(self.PAGE_LIMITS[endpoint], limit - count),
+                'after': cursor
+            }
+            if start_time is not None:
+                params['before'] = int(start_time) - 1
+            response, elapsed = self._get(endpoint, params)
+            total += elapsed
+            requests += 1
+
+            try:
+                body = response.json()
+            except ValueError:
+                raise ExchangeError(f"okx 响应无法解析 (HTTP {response.status_code})")
+            if body.get('code') == '51001':
+                raise SymbolNotListed(f"okx 没有交易对 {instrument}")
+            if response.status_code != 200 or body.get('code') != '0':
+                raise ExchangeError(f"okx 请求失败 (HTTP {response.status_code}): {body.get('msg', '')}")
+
+            data = body.get('data') or []
+            if not data:
+                if endpoint == 'klines':
+                    endpoint = 'history_klines'  # 超出近期接口的范围
+                    continue
+                break
+            page = np.array([item[:6] + [item[8]] for item in data], dtype=np.float64)
+            pages.append(page)
+            count += len(page)
+            cursor = int(page[-1, 0])
+            if start_time is not None and cursor <= start_time:
+                break
+
+        if not pages:
+            return np.empty((0, 6)), total / max(requests, 1)
+        rows = np.vstack(pages)[::-1]
+        # 只保留已确认收盘的K线
+        return rows[rows[:, 6] == 1, :6], total / requests
+
+    def server_time(self) -> int:
+        response, _ = self._get('time', {})
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if response.status_code != 200 or body.get('code') != '0':
+            raise ExchangeError(f"okx 获取服务器时间失败 (HTTP {response.status_code})")
+        return int(body['data'][0]['ts'])
+
+
+class _VenueHealth:
+    """单个交易所的健康状态"""
+
+    def __init__(self):
+        self.latency: Optional[float] = None  # 请求耗时的指数移动平均（秒）
+        self.last_sample = 0.0
+        self.failures = 0          # 连续失败次数
+        self.cooldowns = 0         # 连续暂停次数，决定下一次暂停的时长
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+
+class ExchangeRouter:
+    """
+    K线请求路由
+
+    每次请求按有效延迟从低到高尝试各交易所：有效延迟是请求耗时的指数移动平均，
+    尚未测量或超过 probe_interval 秒未使用的交易所按 latency_prior 计算（便于在
+    恢复后重新启用），每次连续失败再加一倍。上一次成功的交易所的有效延迟除以
+    (1 + switch_margin)，其他交易所明显更快时才切换，避免K线来源频繁交替。
+    连续失败 failure_threshold 次的交易所暂停 cooldown 秒，再次暂停时时长翻倍；
+    所有交易所都在暂停时仍按暂停结束时间依次尝试，不直接放弃。
+    """
+
+    def __init__(self, adapters: List[ExchangeAdapter], latency_prior: float = 1.0, failure_threshold: int = 2,
+                 cooldown: float = 30, max_cooldown: float = 600, probe_interval: float = 300,
+                 switch_margin: float = 0.5, smoothing: float = 0.3):
+        """
+        初始化路由
+
+        Args:
+            adapters: 适配器列表，顺序即延迟相同时的优先级
+            latency_prior: 未测量交易所的假定延迟（秒）
+            failure_threshold: 连续失败多少次后暂停该交易所
+            cooldown: 首次暂停的秒数
+            max_cooldown: 最长暂停秒数
+            probe_interval: 超过该秒数未使用的交易所按 latency_prior 重新参与排序
+            switch_margin: 其他交易所的延迟低于当前交易所的 1/(1 + switch_margin) 时才切换
+            smoothing: 延迟指数移动平均的权重
+        """
+        if not adapters:
+            raise ValueError("至少需要一个交易所适配器")
+        self.adapters = adapters
+        self.latency_prior = latency_prior
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probe_interval = probe_interval
+        self.switch_margin = switch_margin
+        self.smoothing = smoothing
+        self._health = {adapter.name: _VenueHealth() for adapter in adapters}
+        self._current: Optional[str] = None  # 上一次成功的交易所
+        self.clock_offset_ms = 0.0
+        self.clock_rtt_ms: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _effective_latency(self, name: str, now: float) -> float:
+        health = self._health[name]
+        if health.latency is None:
+            latency = self.latency_prior
+        elif now - health.last_sample > self.probe_interval:
+            latency = min(health.latency, self.latency_prior)
+        else:
+            latency = health.latency
+        latency *= 1 + health.failures
+        if name == self._current:
+            latency /= 1 + self.switch_margin
+        return latency
+
+    def ranked(self) -> List[ExchangeAdapter]:
+        """按尝试顺序排列的适配器：健康的按有效延迟排序，暂停中的按暂停结束时间排在最后"""
+        now = time.monotonic()
+        with self._lock:
+            order = {adapter.name: i for i, adapter in enumerate(self.adapters)}
+            healthy = [a for a in self.adapters if self._health[a.name].cooldown_until <= now]
+            paused = [a for a in self.adapters if self._health[a.name].cooldown_until > now]
+            healthy.sort(key=lambda a: (self._effective_latency(a.name, now), order[a.name]))
+            paused.sort(key=lambda a: self._health[a.name].cooldown_until)
+        return healthy + paused
+
+    @property
+    def preferred(self) -> str:
+        """下一次请求首先尝试的交易所"""
+        return self.ranked()[0].name
+
+    def _record_success(self, name: str, latency: float):
+        with self._lock:
+            health = self._health[name]
+            health.requests += 1
+            health.failures = 0
+            health.cooldowns = 0
+            health.cooldown_until = 0.0
+            health.last_sample = time.monotonic()
+            self._current = name
+            if health.latency is None:
+                health.latency = latency
+            else:
+                health.latency += self.smoothing * (latency - health.latency)
+
+    def _record_failure(self, name: str, error: ExchangeError):
+        with self._lock:
+            health = self._health[name]
+            health.requests += 1
+            health.errors += 1
+            health.failures += 1
+            if health.failures < self.failure_threshold and error.retry_after is None:
+                return
+            pause = min(self.max_cooldown, self.cooldown * 2 ** health.cooldowns)
+            if error.retry_after is not None:
+                pause = max(pause, error.retry_after)
+            health.cooldowns += 1
+            health.failures = 0
+            health.cooldown_until = time.monotonic() + pause
+        logger.warning(f"{name} 暂停使用 {pause:.0f} 秒: {str(error)}")
+
+    def suspend(self, name: str, seconds: float = None):
+        """手动暂停某个交易所（默认 cooldown 秒）"""
+        with self._lock:
+            self._health[name].cooldown_until = time.monotonic() + (seconds or self.cooldown)
+
+    def fetch_klines(self, symbol: str, interval: str, limit: int, start_time: int = None,
+                     end_time: int = None) -> Tuple[np.ndarray, str]:
+        """
+        按路由顺序获取已收盘K线，参数见 ExchangeAdapter.fetch_klines
+
+        Returns:
+            Tuple[np.ndarray, str]: K线和实际使用的交易所
+
+        Raises:
+            ExchangeError: 所有交易所都失败
+        """
+        errors = []
+        for adapter in self.ranked():
+            try:
+                klines, latency = adapter.fetch_klines(symbol, interval, limit, start_time, end_time)
+            except SymbolNotListed as e:
+                errors.append(str(e))
+                continue
+            except ExchangeError as e:
+                self._record_failure(adapter.name, e)
+                errors.append(str(e))
+                continue
+            self._record_success(adapter.name, latency)
+            return klines, adapter.name
+        raise ExchangeError("; ".join(errors))
+
+    def now_ms(self) -> float:
+        """按交易所服务器时间校正后的当前时间（毫秒）"""
+        return time.time() * 1000 + self.clock_offset_ms
+
+    def sync_clock(self, samples: int = 3) -> float:
+        """
+        向首选交易所请求服务器时间，估计本地时钟偏差并同步到所有适配器
+
+        取往返耗时最短的一次：偏差 = 服务器时间 - 请求发出与收到响应的中点。
+        首选交易所失败时依次尝试其他交易所；全部失败时保留上一次的偏差。
+
+        Args:
+            samples: 每个交易所的采样次数
+
+        Returns:
+            float: 服务器时间 - 本地时间（毫秒）
+        """
+        for adapter in self.ranked():
+            best = None
+            for _ in range(max(1, samples)):
+                sent = time.time() * 1000
+                try:
+                    server = adapter.server_time()
+                except ExchangeError as e:
+                    logger.warning(f"{adapter.name} 时间同步失败: {str(e)}")
+                    break
+                received = time.time() * 1000
+                rtt = received - sent
+                if best is None or rtt < best[0]:
+                    best = (rtt, server - (sent + received) / 2)
+            if best is None:
+                continue
+            self.clock_rtt_ms, self.clock_offset_ms = best
+            for item in self.adapters:
+                item.clock_offset_ms = self.clock_offset_ms
+            return self.clock_offset_ms
+        return self.clock_offset_ms
+
+    def stats(self) -> Dict[str, Dict]:
+        """各交易所的请求数、错误数、平均延迟（毫秒）和是否暂停"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    'requests': health.requests,
+                    'errors': health.errors,
+                    'latency_ms': None if health.latency is None else round(health.latency * 1000, 1),
+                    'paused': health.cooldown_until > now
+                }
+                for name, health in self._health.items()
+            }
+
+    def format_stats(self) -> str:
+        """格式化路由统计，用于日志"""
+        parts = []
+        for name, stat in self.stats().items():
+            latency = "-" if stat['latency_ms'] is None else f"{stat['latency_ms']:.0f}ms"
+            state = "，暂停中" if stat['paused'] else ""
+            parts.append(f"{name} 请求{stat['requests']}次/错误{stat['errors']}次/延迟{latency}{state}")
+        return "；".join(parts)
@@ -0,0 +1,178 @@
+"""
+HTTP客户端模块 - 按主机复用长连接的会话池，并统计连接与请求耗时
+"""
+
+import threading
+import time
+from typing import Dict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# 记录当前线程上一次请求是否新建了连接以及握手耗时
+_connect_state = threading.local()
+
+
+def _record_connect(connect):
+    started = time.perf_counter()
+    try:
+        connect()
+    finally:
+        _connect_state.connects = getattr(_connect_state, 'connects', 0) + 1
+        _connect_state.seconds = getattr(_connect_state, 'seconds', 0.0) + time.perf_counter() - started
+
+
+class _TrackedHTTPConnection(HTTPConnection):
+    def connect(self):
+        _record_connect(super().connect)
+
+
+class _TrackedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        _record_connect(super().connect)
+
+
+class _TrackedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TrackedHTTPConnection
+
+
+class _TrackedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TrackedHTTPSConnection
+
+
+class _TrackedAdapter(HTTPAdapter):
+    """建立连接时记录握手次数和耗时的适配器"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TrackedHTTPConnectionPool,
+            'https': _TrackedHTTPSConnectionPool,
+        }
+
+
+class HttpClient:
+    """
+    按主机划分的连接池HTTP客户端
+
+    每个主机（api.binance.com、www.okx.com、api.telegram.org 等）使用
+    独立的 requests.Session，连接在请求之间保持复用，只有首次请求或
+    连接被服务端关闭时才重新进行TCP/TLS握手。交易所和Telegram客户端
+    共享同一个实例。
+    """
+
+    def __init__(self, pool_size: int = 10, timeout: float = 10, keep_alive: bool = True):
+        """
+        初始化客户端
+
+        Args:
+            pool_size: 每个主机的最大连接数
+            timeout: 默认请求超时时间（秒）
+            keep_alive: 是否保持长连接
+        """
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self._sessions: Dict[str, requests.Session] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _session(self, host: str) -> requests.Session:
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = _TrackedAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                if not self.keep_alive:
+                    session.headers['Connection'] = 'close'
+                self._sessions[host] = session
+                self._stats[host] = {
+                    'requests': 0, 'errors': 0, 'new_connections': 0,
+                    'handshake_seconds': 0.0, 'total_seconds': 0.0
+                }
+            return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        发送请求，未指定 timeout 时使用默认超时
+
+        Returns:
+            requests.Response: 响应对象
+        """
+        host = urlsplit(url).netloc
+        session = self._session(host)
+        kwargs.setdefault('timeout', self.timeout)
+
+        _connect_state.connects = 0
+        _connect_state.seconds = 0.0
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except Exception:
+            with self._lock:
+                self._stats[host]['errors'] += 1
+            raise
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            stats = self._stats[host]
+            stats['requests'] += 1
+            stats['total_seconds'] += elapsed
+            if _connect_state.connects:
+                stats['new_connections'] += _connect_state.connects
+                stats['handshake_seconds'] += _connect_state.seconds
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        各主机的请求统计
+
+        Returns:
+            Dict: {主机: {requests, errors, new_connections, avg_handshake_ms,
+            avg_request_ms, saved_handshake_ms}}，saved_handshake_ms 为复用
+            连接省下的握手时间估算
+        """
+        with self._lock:
+            result = {}
+            for host, stats in self._stats.items():
+                connections = stats['new_connections']
+                avg_handshake = stats['handshake_seconds'] / connections * 1000 if connections else 0.0
+                reused = max(0, stats['requests'] - connections)
+                result[host] = {
+                    'requests': stats['requests'],
+                    'errors': stats['errors'],
+                    'new_connections': connections,
+                    'avg_handshake_ms': avg_handshake,
+                    'avg_request_ms': (stats['total_seconds'] / stats['requests'] * 1000
+                                       if stats['requests'] else 0.0),
+                    'saved_handshake_ms': reused * avg_handshake,
+                }
+            return result
+
+    def format_stats(self) -> str:
+        """格式化统计信息用于日志"""
+        parts = []
+        for host, stats in self.stats().items():
+            parts.append(f"{host}: 请求 {stats['requests']} 次, 新建连接 {stats['new_connections']} 次, "
+                         f"握手平均 {stats['avg_handshake_ms']:.0f}ms, "
+                         f"请求平均 {stats['avg_request_ms']:.0f}ms, "
+                         f"复用节省约 {stats['saved_handshake_ms'] / 1000:.1f}s, 失败 {stats['errors']} 次")
+        return "; ".join(parts) if parts else "暂无请求"
+
+    def close(self):
+        """关闭所有会话"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
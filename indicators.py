@@ -0,0 +1,409 @@
+"""
+技术指标模块 - 批量指标序列计算与按已收盘K线逐根推进的增量指标状态
+"""
+
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+
+def ema_series(values, period: int) -> np.ndarray:
+    """
+    计算完整EMA序列（前 period 个值取SMA作为种子）
+
+    一维输入按单个交易对计算；二维输入 (交易对 × K线) 沿时间轴对所有
+    交易对同时计算，历史较短的交易对左侧以NaN填充，种子从各自第一个
+    有效值开始，结果与逐个交易对计算一致。
+
+    Args:
+        values: 价格序列
+        period: EMA周期
+
+    Returns:
+        np.ndarray: 与输入同形状的EMA序列，种子之前的位置为NaN
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 2:
+        return _ema_matrix(values, period)
+
+    out = np.full(len(values), np.nan)
+    if len(values) < period:
+        return out
+
+    multiplier = 2 / (period + 1)
+    prices = values.tolist()
+    ema = sum(prices[:period]) / period
+    result = [ema]
+    for price in prices[period:]:
+        ema = (price * multiplier) + (ema * (1 - multiplier))
+        result.append(ema)
+    out[period - 1:] = result
+    return out
+
+
+def _first_valid_index(values: np.ndarray) -> np.ndarray:
+    """每行第一个非NaN值的位置，全为NaN时返回列数"""
+    valid = ~np.isnan(values)
+    return np.where(valid.any(axis=1), valid.argmax(axis=1), values.shape[1])
+
+
+def _ema_matrix(values: np.ndarray, period: int) -> np.ndarray:
+    rows, length = values.shape
+    # 按列（时间）推进，列连续存储减少跨步访问
+    values = np.asfortranarray(values)
+    out = np.full(values.shape, np.nan, order='F')
+    seed_index = _first_valid_index(values) + period - 1
+    active = seed_index < length
+    if not active.any():
+        return out
+
+    # 种子SMA：各行从第一个有效值开始的 period 个值的均值
+    cumsum = np.cumsum(np.nan_to_num(values), axis=1)
+    row_ids = np.arange(rows)
+    seed_pos = np.minimum(seed_index, length - 1)
+    before = seed_pos - period
+    seed = cumsum[row_ids, seed_pos] - np.where(before >= 0, cumsum[row_ids, np.maximum(before, 0)], 0.0)
+    seed = seed / period
+
+    # 按种子位置分组，循环中只在种子位置写入SMA
+    seeds = {}
+    for row in np.nonzero(active)[0]:
+        seeds.setdefault(int(seed_index[row]), []).append(row)
+
+    multiplier = 2 / (period + 1)
+    ema = np.full(rows, np.nan)
+    for t in range(min(seeds), length):
+        ema = (values[:, t] * multiplier) + (ema * (1 - multiplier))
+        if t in seeds:
+            ema[seeds[t]] = seed[seeds[t]]
+        out[:, t] = ema
+    return out
+
+
+def true_range(highs, lows, closes) -> np.ndarray:
+    """真实波幅序列（沿最后一维，比输入少一个值）"""
+    prev_closes = closes[..., :-1]
+    highs = highs[..., 1:]
+    lows = lows[..., 1:]
+    return np.maximum(highs - lows,
+                      np.maximum(np.abs(highs - prev_closes), np.abs(lows - prev_closes)))
+
+
+def atr_latest(highs, lows, closes, period: int):
+    """最新ATR：最近 period 个真实波幅的简单平均（沿最后一维）"""
+    tail = slice(-period - 1, None)
+    return true_range(highs[..., tail], lows[..., tail], closes[..., tail]).mean(axis=-1)
+
+
+def atr_series(highs, lows, closes, period: int) -> np.ndarray:
+    """
+    ATR序列：每根K线处为截至该K线的最近 period 个真实波幅的简单平均（沿最后一维）
+
+    Returns:
+        np.ndarray: 与输入同形状，前 period 个位置为NaN
+    """
+    highs = np.asarray(highs, dtype=np.float64)
+    out = np.full(highs.shape, np.nan)
+    if highs.shape[-1] <= period:
+        return out
+
+    ranges = true_range(highs, np.asarray(lows, dtype=np.float64), np.asarray(closes, dtype=np.float64))
+    out[..., period:] = np.lib.stride_tricks.sliding_window_view(ranges, period, axis=-1).mean(axis=-1)
+    return out
+
+
+def rsi_series(closes, period: int) -> np.ndarray:
+    """
+    计算RSI序列（Wilder平滑），支持一维或二维输入
+
+    Returns:
+        np.ndarray: 与输入同形状，无值的位置为NaN
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    matrix = np.atleast_2d(closes)
+    out = np.full(matrix.shape, np.nan, order='F')
+    deltas = np.asfortranarray(np.diff(matrix, axis=1))
+    gains = np.where(deltas > 0, deltas, 0.0)
+    losses = np.where(deltas < 0, -deltas, 0.0)
+
+    # 各行第一个RSI值位于第一个有效收盘价之后第 period 根
+    first_index = _first_valid_index(matrix) + period
+    length = matrix.shape[1]
+    seeds = {}
+    for row in np.nonzero(first_index < length)[0]:
+        seeds.setdefault(int(first_index[row]), []).append(row)
+
+    if seeds:
+        gain_cumsum = np.cumsum(gains, axis=1)
+        loss_cumsum = np.cumsum(losses, axis=1)
+        avg_gain = np.full(len(matrix), np.nan)
+        avg_loss = np.full(len(matrix), np.nan)
+        for t in range(min(seeds), length):
+            delta_index = t - 1
+            avg_gain = (avg_gain * (period - 1) + gains[:, delta_index]) / period
+            avg_loss = (avg_loss * (period - 1) + losses[:, delta_index]) / period
+            if t in seeds:
+                # 种子：前 period 个涨跌幅的简单平均
+                seed_rows = seeds[t]
+                begin = delta_index - period
+                avg_gain[seed_rows] = (gain_cumsum[seed_rows, delta_index]
+                                       - (gain_cumsum[seed_rows, begin] if begin >= 0 else 0.0)) / period
+                avg_loss[seed_rows] = (loss_cumsum[seed_rows, delta_index]
+                                       - (loss_cumsum[seed_rows, begin] if begin >= 0 else 0.0)) / period
+            with np.errstate(divide='ignore', invalid='ignore'):
+                out[:, t] = np.where(avg_loss == 0, 100.0, 100 - (100 / (1 + avg_gain / avg_loss)))
+
+    return out if closes.ndim == 2 else out[0]
+
+
+def macd_series(closes, fast: int = 12, slow: int = 26, signal: int = 9):
+    """
+    计算MACD线、信号线和柱状图序列，支持一维或二维输入
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: 与输入同形状，无值的位置为NaN
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    matrix = np.atleast_2d(closes)
+    macd_line = ema_series(matrix, fast) - ema_series(matrix, slow)
+    signal_line = ema_series(macd_line, signal)
+    histogram = macd_line - signal_line
+    if closes.ndim == 2:
+        return macd_line, signal_line, histogram
+    return macd_line[0], signal_line[0], histogram[0]
+
+
+class EmaState:
+    """增量EMA，前 period 个值取SMA作为种子，与 ema_series 的最新值一致"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.multiplier = 2 / (period + 1)
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self._seed_sum = 0.0
+        self.value: Optional[float] = None
+        self.prev_value: Optional[float] = None
+
+    def update(self, price: float) -> Optional[float]:
+        self.count += 1
+        self.prev_value = self.value
+        if self.count < self.period:
+            self._seed_sum += price
+        elif self.count == self.period:
+            self._seed_sum += price
+            self.value = self._seed_sum / self.period
+        else:
+            self.value = (price * self.multiplier) + (self.value * (1 - self.multiplier))
+        return self.value
+
+
+class AtrState:
+    """增量ATR，取最近 period 个真实波幅的简单平均，与 atr_latest 一致"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.reset()
+
+    def reset(self):
+        self._true_ranges = deque(maxlen=self.period)
+        self._prev_close: Optional[float] = None
+        self.value: Optional[float] = None
+
+    def update(self, high: float, low: float, close: float) -> Optional[float]:
+        if self._prev_close is not None:
+            self._true_ranges.append(max(high - low,
+                                         abs(high - self._prev_close),
+                                         abs(low - self._prev_close)))
+            if len(self._true_ranges) == self.period:
+                # 窗口固定为 period 个值，直接求和避免累计误差
+                self.value = sum(self._true_ranges) / self.period
+        self._prev_close = close
+        return self.value
+
+
+class RsiState:
+    """增量RSI（Wilder平滑），与 rsi_series 的最新值一致"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.reset()
+
+    def reset(self):
+        self._prev_close: Optional[float] = None
+        self._count = 0
+        self._gain_sum = 0.0
+        self._loss_sum = 0.0
+        self._avg_gain = 0.0
+        self._avg_loss = 0.0
+        self.value: Optional[float] = None
+
+    def update(self, close: float) -> Optional[float]:
+        if self._prev_close is None:
+            self._prev_close = close
+            return None
+
+        delta = close - self._prev_close
+        self._prev_close = close
+        gain = delta if delta > 0 else 0
+        loss = -delta if delta < 0 else 0
+        self._count += 1
+
+        if self._count < self.period:
+            self._gain_sum += gain
+            self._loss_sum += loss
+            return None
+        if self._count == self.period:
+            self._avg_gain = (self._gain_sum + gain) / self.period
+            self._avg_loss = (self._loss_sum + loss) / self.period
+        else:
+            self._avg_gain = (self._avg_gain * (self.period - 1) + gain) / self.period
+            self._avg_loss = (self._avg_loss * (self.period - 1) + loss) / self.period
+
+        if self._avg_loss == 0:
+            self.value = 100
+        else:
+            rs = self._avg_gain / self._avg_loss
+            self.value = 100 - (100 / (1 + rs))
+        return self.value
+
+
+class MacdState:
+    """增量MACD，与 macd_series 的最新值一致"""
+
+    def __init__(self, fast: int, slow: int, signal: int):
+        self.fast = EmaState(fast)
+        self.slow = EmaState(slow)
+        self.signal = EmaState(signal)
+        self.reset()
+
+    def reset(self):
+        self.fast.reset()
+        self.slow.reset()
+        self.signal.reset()
+        self.macd: Optional[float] = None
+        self.histogram: Optional[float] = None
+
+    def update(self, close: float):
+        fast = self.fast.update(close)
+        slow = self.slow.update(close)
+        if slow is None:
+            return
+        self.macd = fast - slow
+        signal = self.signal.update(self.macd)
+        if signal is not None:
+            self.histogram = self.macd - signal
+
+
+class IndicatorState:
+    """
+    单个交易对的增量指标状态
+
+    每根新收盘K线以常数时间推进 EMA/ATR/RSI/MACD，并保留最近
+    lookback 根K线的EMA宽度用于收敛度计算。发现K线缺口、缓存被
+    重新初始化或K线回退时，自动用缓冲区中的全部历史重建。
+    """
+
+    def __init__(self, ema_periods=(21, 55, 144), atr_period: int = 14,
+                 rsi_period: int = 14, macd_params=(12, 26, 9),
+                 lookback: int = 21, interval_ms: int = 3600000):
+        """
+        初始化指标状态
+
+        Args:
+            ema_periods: EMA周期
+            atr_period: ATR周期
+            rsi_period: RSI周期
+            macd_params: MACD (fast, slow, signal) 参数
+            lookback: EMA宽度回溯根数
+            interval_ms: K线周期（毫秒），用于判断缺口
+        """
+        self.ema = {period: EmaState(period) for period in ema_periods}
+        self.atr = AtrState(atr_period)
+        self.rsi = RsiState(rsi_period)
+        self.macd = MacdState(*macd_params)
+        self.interval_ms = interval_ms
+        self.ema_spans = deque(maxlen=lookback)
+        self.last_timestamp: Optional[int] = None
+        self.rebuilds = 0
+
+    def reset(self):
+        """清空所有状态，下次同步时从头重建"""
+        for state in self.ema.values():
+            state.reset()
+        self.atr.reset()
+        self.rsi.reset()
+        self.macd.reset()
+        self.ema_spans.clear()
+        self.last_timestamp = None
+
+    def update(self, timestamp: int, high: float, low: float, close: float):
+        """推进一根已收盘K线"""
+        for state in self.ema.values():
+            state.update(close)
+        self.atr.update(high, low, close)
+        self.rsi.update(close)
+        self.macd.update(close)
+
+        values = [state.value for state in self.ema.values()]
+        if all(value is not None for value in values):
+            self.ema_spans.append(max(values) - min(values))
+        self.last_timestamp = timestamp
+
+    def sync(self, klines) -> int:
+        """
+        与K线缓冲区同步
+
+        Args:
+            klines: KlineBuffer
+
+        Returns:
+            int: 本次推进的K线数量
+        """
+        timestamps = klines.timestamp
+        if len(timestamps) == 0:
+            self.reset()
+            return 0
+
+        start = 0
+        if self.last_timestamp is not None:
+            start = int(np.searchsorted(timestamps, self.last_timestamp, side='right'))
+            contiguous = (
+                start > 0
+                and timestamps[start - 1] == self.last_timestamp
+                and (start == len(timestamps)
+                     or timestamps[start] - self.last_timestamp == self.interval_ms)
+            )
+            if not contiguous:
+                start = 0
+
+        if start == 0:
+            self.reset()
+            self.rebuilds += 1
+
+        highs = klines.high
+        lows = klines.low
+        closes = klines.close
+        for i in range(start, len(timestamps)):
+            self.update(int(timestamps[i]), float(highs[i]), float(lows[i]), float(closes[i]))
+        return len(timestamps) - start
+
+    def ema_value(self, period: int) -> Optional[float]:
+        return self.ema[period].value
+
+    def prev_ema_value(self, period: int) -> Optional[float]:
+        return self.ema[period].prev_value
+
+    def ema_convergence(self, atr: float) -> float:
+        """
+        EMA收敛度：最近 lookback 根K线的EMA宽度（最大EMA减最小EMA）均值与ATR之比
+
+        Returns:
+            float: 收敛度，EMA尚未全部有值或ATR无效时返回1.0（表示不收敛）
+        """
+        if not self.ema_spans or not atr or atr <= 0:
+            return 1.0
+        return sum(self.ema_spans) / len(self.ema_spans) / atr
@@ -0,0 +1,339 @@
+"""
+K线存储模块 - 按交易对缓存已收盘K线的列式环形缓冲区，以及磁盘上的内存映射K线历史
+"""
+
+import os
+
+import numpy as np
+from typing import Dict, Optional
+
+# 列顺序与交易所K线数组前6列一致
+KLINE_COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+
+
+class KlineBuffer:
+    """
+    定长列式K线缓冲区
+
+    每列是一段连续的 int64/float64 数组，底层容量为 2 倍窗口长度：
+    追加时只写入尾部，写满后把最近的窗口整体搬回开头（均摊 O(1)），
+    因此各列属性始终返回连续内存上的零拷贝视图。
+    视图只在下一次写入之前有效，需要长期保留的数据请自行 copy。
+    """
+
+    def __init__(self, capacity: int):
+        """
+        初始化缓冲区
+
+        Args:
+            capacity: 保留的最大K线数量
+        """
+        if capacity <= 0:
+            raise ValueError("capacity必须大于0")
+
+        self.capacity = capacity
+        self._size = capacity * 2
+        self._timestamp = np.zeros(self._size, dtype=np.int64)
+        self._open = np.zeros(self._size, dtype=np.float64)
+        self._high = np.zeros(self._size, dtype=np.float64)
+        self._low = np.zeros(self._size, dtype=np.float64)
+        self._close = np.zeros(self._size, dtype=np.float64)
+        self._volume = np.zeros(self._size, dtype=np.float64)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    @property
+    def timestamp(self) -> np.ndarray:
+        return self._timestamp[self._start:self._end]
+
+    @property
+    def open(self) -> np.ndarray:
+        return self._open[self._start:self._end]
+
+    @property
+    def high(self) -> np.ndarray:
+        return self._high[self._start:self._end]
+
+    @property
+    def low(self) -> np.ndarray:
+        return self._low[self._start:self._end]
+
+    @property
+    def close(self) -> np.ndarray:
+        return self._close[self._start:self._end]
+
+    @property
+    def volume(self) -> np.ndarray:
+        return self._volume[self._start:self._end]
+
+    @property
+    def last_timestamp(self) -> Optional[int]:
+        """最新一根K线的开盘时间（毫秒），缓冲区为空时返回None"""
+        if self._end == self._start:
+            return None
+        return int(self._timestamp[self._end - 1])
+
+    def clear(self):
+        """清空缓冲区"""
+        self._start = 0
+        self._end = 0
+
+    def append(self, timestamp: int, open_: float, high: float, low: float,
+               close: float, volume: float) -> bool:
+        """
+        追加一根已收盘K线
+
+        Args:
+            timestamp: 开盘时间（毫秒）
+            open_/high/low/close/volume: K线数据
+
+        Returns:
+            bool: 是否新增了一根K线（同一时间戳的K线会被覆盖，更早的K线会被忽略）
+        """
+        last = self.last_timestamp
+        if last is not None and timestamp <= last:
+            if timestamp == last:
+                self._write(self._end - 1, timestamp, open_, high, low, close, volume)
+            return False
+
+        if self._end == self._size:
+            self._compact(self.capacity - 1)
+
+        self._write(self._end, timestamp, open_, high, low, close, volume)
+        self._end += 1
+        if self._end - self._start > self.capacity:
+            self._start += 1
+        return True
+
+    def extend(self, rows: np.ndarray) -> int:
+        """
+        批量追加按时间升序排列的K线
+
+        Args:
+            rows: 形状为 (n, 6) 的数组，列顺序见 KLINE_COLUMNS
+
+        Returns:
+            int: 新增的K线数量
+        """
+        if rows is None or len(rows) == 0:
+            return 0
+
+        timestamps = rows[:, 0].astype(np.int64)
+        last = self.last_timestamp
+        if last is not None:
+            # 与最新缓存K线同一时间戳的数据覆盖写入
+            same = np.nonzero(timestamps == last)[0]
+            if len(same):
+                row = rows[same[-1]]
+                self._write(self._end - 1, last, row[1], row[2], row[3], row[4], row[5])
+            newer = timestamps > last
+            rows = rows[newer]
+            timestamps = timestamps[newer]
+
+        count = len(rows)
+        if count == 0:
+            return 0
+        if count > self.capacity:
+            rows = rows[-self.capacity:]
+            timestamps = timestamps[-self.capacity:]
+            count = self.capacity
+
+        if self._end + count > self._size:
+            self._compact(self.capacity - count)
+
+        end = self._end + count
+        self._timestamp[self._end:end] = timestamps
+        self._open[self._end:end] = rows[:, 1]
+        self._high[self._end:end] = rows[:, 2]
+        self._low[self._end:end] = rows[:, 3]
+        self._close[self._end:end] = rows[:, 4]
+        self._volume[self._end:end] = rows[:, 5]
+        self._end = end
+        if self._end - self._start > self.capacity:
+            self._start = self._end - self.capacity
+        return count
+
+    def to_array(self, start: int = 0) -> np.ndarray:
+        """导出第 start 根之后的K线为 (n, 6) 的 float64 数组副本"""
+        return np.column_stack([
+            self.timestamp[start:].astype(np.float64), self.open[start:], self.high[start:],
+            self.low[start:], self.close[start:], self.volume[start:]
+        ])
+
+    def _write(self, pos: int, timestamp, open_, high, low, close, volume):
+        self._timestamp[pos] = timestamp
+        self._open[pos] = open_
+        self._high[pos] = high
+        self._low[pos] = low
+        self._close[pos] = close
+        self._volume[pos] = volume
+
+    def _compact(self, keep: int):
+        """把最近 keep 根K线搬回底层数组开头"""
+        keep = max(0, min(keep, len(self)))
+        src = slice(self._end - keep, self._end)
+        for column in (self._timestamp, self._open, self._high,
+                       self._low, self._close, self._volume):
+            column[:keep] = column[src]
+        self._start = 0
+        self._end = keep
+
+
+class KlineHistory:
+    """
+    单个交易对的磁盘K线历史
+
+    目录 root/{symbol}_{interval}/ 下每列一个只追加的二进制文件
+    （timestamp 为 int64，其余为 float64，列与 KlineBuffer 一致），
+    读取时通过 np.memmap 映射，不需要整体载入内存。
+    进程异常退出可能留下长度不一致的列文件，打开时按最短的列截齐；
+    运行中某列写入失败时立即把所有列截回写入前的长度，截齐之前不再追加。
+    同一份文件也可以直接作为回测数据源。
+    """
+
+    DTYPES = {name: (np.int64 if name == 'timestamp' else np.float64) for name in KLINE_COLUMNS}
+
+    def __init__(self, root: str, symbol: str, interval: str = "1h"):
+        """
+        打开（不存在时创建）交易对的历史目录
+
+        Args:
+            root: 历史数据根目录
+            symbol: 交易对
+            interval: K线周期
+        """
+        self.symbol = symbol
+        self.interval = interval
+        self.path = os.path.join(root, f"{symbol}_{interval}")
+        os.makedirs(self.path, exist_ok=True)
+        self._length = self._recover()
+        self._maps = None
+        self._dirty = False
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _recover(self) -> int:
+        """按最短的列确定有效长度，并截掉其余列多出的部分"""
+        lengths = {}
+        for name in KLINE_COLUMNS:
+            path = self._column_path(name)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            lengths[name] = size // np.dtype(self.DTYPES[name]).itemsize
+
+        length = min(lengths.values())
+        for name in KLINE_COLUMNS:
+            path = self._column_path(name)
+            expected = length * np.dtype(self.DTYPES[name]).itemsize
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+            elif os.path.getsize(path) != expected:
+                os.truncate(path, expected)
+        return length
+
+    def _truncate(self):
+        """把所有列截回当前有效长度，失败时保持待截齐状态并抛出 OSError"""
+        for name in KLINE_COLUMNS:
+            os.truncate(self._column_path(name), self._length * np.dtype(self.DTYPES[name]).itemsize)
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return self._length
+
+    def clear(self):
+        """清空历史（重新回填更早的K线之前调用，追加只接受比最新历史更晚的K线）"""
+        self._length = 0
+        self._maps = None
+        self._dirty = True
+        self._truncate()
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """
+        各列的只读内存映射
+
+        Returns:
+            Dict[str, np.ndarray]: {列名: 数组}，历史为空时为空数组
+        """
+        if self._maps is None or len(self._maps['timestamp']) != self._length:
+            if self._length == 0:
+                self._maps = {name: np.empty(0, dtype=dtype) for name, dtype in self.DTYPES.items()}
+            else:
+                self._maps = {
+                    name: np.memmap(self._column_path(name), dtype=dtype, mode='r', shape=(self._length,))
+                    for name, dtype in self.DTYPES.items()
+                }
+        return self._maps
+
+    @property
+    def last_timestamp(self) -> Optional[int]:
+        """最新一根K线的开盘时间（毫秒），历史为空时返回None"""
+        if self._length == 0:
+            return None
+        return int(self.columns()['timestamp'][-1])
+
+    def tail(self, count: int) -> np.ndarray:
+        """读取最近 count 根K线，返回 (n, 6) 数组"""
+        start = max(0, self._length - count)
+        return self._stack(slice(start, self._length))
+
+    def load(self, start_time: int = None, end_time: int = None) -> np.ndarray:
+        """
+        按开盘时间读取K线，返回 (n, 6) 数组
+
+        Args:
+            start_time: 起始开盘时间（毫秒，含），None表示从头开始
+            end_time: 结束开盘时间（毫秒，含），None表示到最新
+        """
+        timestamps = self.columns()['timestamp']
+        start = 0 if start_time is None else int(np.searchsorted(timestamps, start_time, side='left'))
+        end = self._length if end_time is None else int(np.searchsorted(timestamps, end_time, side='right'))
+        return self._stack(slice(start, end))
+
+    def _stack(self, index: slice) -> np.ndarray:
+        columns = self.columns()
+        return np.column_stack([columns[name][index].astype(np.float64) for name in KLINE_COLUMNS])
+
+    def append(self, rows: np.ndarray) -> int:
+        """
+        追加按时间升序排列的已收盘K线，不晚于最新历史的K线会被忽略
+
+        Args:
+            rows: 形状为 (n, 6) 的数组，列顺序见 KLINE_COLUMNS
+
+        Returns:
+            int: 写入的K线数量
+        """
+        if rows is None or len(rows) == 0:
+            return 0
+        # 上次失败后未能截齐的列必须先截齐，否则新数据会与残留字节错位
+        if self._dirty:
+            self._truncate()
+
+        last = self.last_timestamp
+        if last is not None:
+            rows = rows[rows[:, 0] > last]
+        count = len(rows)
+        if count == 0:
+            return 0
+
+        # 时间戳列最后写入，进程在写入中途退出时由 _recover 按最短列截齐
+        try:
+            for i in (1, 2, 3, 4, 5, 0):
+                name = KLINE_COLUMNS[i]
+                with open(self._column_path(name), 'ab') as f:
+                    f.write(rows[:, i].astype(self.DTYPES[name]).tobytes())
+        except OSError:
+            # 写入失败（如磁盘已满）时已写入的列会多出字节，截回原长度后再抛出；
+            # 截齐本身失败时保持 _dirty，下次追加前重试
+            self._dirty = True
+            try:
+                self._truncate()
+            except OSError:
+                pass
+            raise
+
+        self._length += count
+        return count
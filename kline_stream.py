@@ -0,0 +1,380 @@
+"""
+K线推送模块 - 订阅币安K线WebSocket，K线收盘（x=true）时立即回调；附带本地回放服务用于测试
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import socket
+import struct
+import threading
+from typing import Callable, List, Optional
+
+import numpy as np
+
+try:
+    import websocket
+except ImportError:  # 仅轮询模式时可以不安装 websocket-client
+    websocket = None
+
+
+class KlineEvent:
+    """一条K线推送，row 为 timestamp/open/high/low/close/volume"""
+
+    def __init__(self, symbol: str, row: np.ndarray, closed: bool, event_time: int, close_time: int):
+        self.symbol = symbol
+        self.row = row
+        self.closed = closed
+        self.event_time = event_time
+        self.close_time = close_time
+
+
+def parse_kline_event(message: str) -> Optional[KlineEvent]:
+    """
+    解析币安K线推送，兼容单一流和组合流（{"stream": ..., "data": ...}）格式
+
+    Returns:
+        KlineEvent: 非K线消息返回None
+    """
+    payload = json.loads(message)
+    if isinstance(payload, dict) and 'data' in payload:
+        payload = payload['data']
+    if not isinstance(payload, dict) or payload.get('e') != 'kline':
+        return None
+
+    k = payload['k']
+    row = np.array([k['t'], k['o'], k['h'], k['l'], k['c'], k['v']], dtype=np.float64)
+    return KlineEvent(
+        symbol=payload['s'].upper(),
+        row=row,
+        closed=bool(k['x']),
+        event_time=int(payload['E']),
+        close_time=int(k['T'])
+    )
+
+
+class BinanceKlineStream:
+    """
+    币安K线组合流订阅
+
+    交易对按 STREAMS_PER_CONNECTION 分组，每组一条长连接、一个后台线程。
+    只有已收盘的K线（x=true）会回调 on_closed_kline；连接断开后按指数
+    退避重连，重连成功时回调 on_reconnect，由调用方用REST补齐断线期间
+    可能漏掉的K线。
+    """
+
+    STREAMS_PER_CONNECTION = 200
+
+    def __init__(self, symbols: List[str], interval: str,
+                 on_closed_kline: Callable[[KlineEvent], None],
+                 url: str = "wss://stream.binance.com:9443/stream",
+                 on_reconnect: Callable[[List[str]], None] = None,
+                 record_path: str = None, reconnect_delay: float = 1.0,
+                 max_reconnect_delay: float = 60.0):
+        """
+        初始化订阅
+
+        Args:
+            symbols: 交易对列表
+            interval: K线周期，如 "1h"
+            on_closed_kline: 收到已收盘K线时的回调（在连接线程中调用）
+            url: 组合流地址，测试时可指向 KlineReplayServer.url
+            on_reconnect: 断线重连成功后的回调，参数为该连接订阅的交易对
+            record_path: 把收到的已收盘K线原始消息追加写入该文件（JSONL），可供回放
+            reconnect_delay: 首次重连等待时间（秒）
+            max_reconnect_delay: 最长重连等待时间（秒）
+        """
+        self.symbols = list(symbols)
+        self.interval = interval
+        self.on_closed_kline = on_closed_kline
+        self.on_reconnect = on_reconnect
+        self.url = url
+        self.record_path = record_path
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.logger = logging.getLogger("KlineStream")
+
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._apps = []
+        self._record_lock = threading.Lock()
+        self._connected = 0
+        self._lock = threading.Lock()
+
+    def _stream_url(self, symbols: List[str]) -> str:
+        streams = "/".join(f"{symbol.lower()}@kline_{self.interval}" for symbol in symbols)
+        return f"{self.url}?streams={streams}"
+
+    def start(self):
+        """为每组交易对启动一个连接线程"""
+        if websocket is None:
+            raise RuntimeError("推送模式需要安装 websocket-client")
+
+        self._stop.clear()
+        for i in range(0, len(self.symbols), self.STREAMS_PER_CONNECTION):
+            chunk = self.symbols[i:i + self.STREAMS_PER_CONNECTION]
+            thread = threading.Thread(
+                target=self._run_connection, args=(chunk,),
+                name=f"kline-stream-{i // self.STREAMS_PER_CONNECTION}", daemon=True
+            )
+            self._threads.append(thread)
+            thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """关闭所有连接并等待线程退出"""
+        self._stop.set()
+        for app in list(self._apps):
+            app.keep_running = False
+            try:
+                # 只shutdown不close：唤醒阻塞在select上的连接线程，由其自行关闭socket
+                app.sock.sock.shutdown(socket.SHUT_RDWR)
+            except Exception:
+                pass
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads.clear()
+
+        for app in list(self._apps):
+            try:
+                app.close()
+            except Exception:
+                pass
+
+    @property
+    def connected(self) -> int:
+        """当前已建立的连接数"""
+        with self._lock:
+            return self._connected
+
+    def _run_connection(self, symbols: List[str]):
+        url = self._stream_url(symbols)
+        delay = self.reconnect_delay
+        first = True
+
+        while not self._stop.is_set():
+            opened = threading.Event()
+
+            def on_open(app):
+                nonlocal first
+                opened.set()
+                with self._lock:
+                    self._connected += 1
+                self.logger.info(f"K线推送已连接: {len(symbols)} 个交易对")
+                if not first and self.on_reconnect:
+                    self.on_reconnect(symbols)
+                first = False
+
+            app = websocket.WebSocketApp(
+                url,
+                on_open=on_open,
+                on_message=lambda app, message: self._handle_message(message),
+                on_error=lambda app, error: self.logger.warning(f"K线推送连接错误: {error}")
+            )
+            self._apps.append(app)
+            try:
+                app.run_forever()
+            finally:
+                self._apps.remove(app)
+                if opened.is_set():
+                    with self._lock:
+                        self._connected -= 1
+
+            if self._stop.is_set():
+                break
+            if opened.is_set():
+                delay = self.reconnect_delay
+            self.logger.warning(f"K线推送连接断开，{delay:.0f} 秒后重连")
+            self._stop.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _handle_message(self, message: str):
+        try:
+            event = parse_kline_event(message)
+        except (ValueError, KeyError, TypeError) as e:
+            self.logger.warning(f"无法解析K线推送: {str(e)}")
+            return
+        if event is None or not event.closed:
+            return
+
+        if self.record_path:
+            with self._record_lock:
+                with open(self.record_path, 'a', encoding='utf-8') as f:
+                    f.write(message.strip() + "\n")
+
+        try:
+            self.on_closed_kline(event)
+        except Exception as e:
+            self.logger.error(f"{event.symbol} K线推送处理失败: {str(e)}")
+
+
+_WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class KlineReplayServer:
+    """
+    本地K线回放服务
+
+    实现最小的WebSocket服务端：每个连接建立后按顺序推送录制的消息
+    （与币安组合流格式相同），推送完成后保持连接直到客户端关闭。
+    用于在没有外网的环境下驱动推送模式。
+    """
+
+    def __init__(self, messages: List[str], host: str = "127.0.0.1", port: int = 0, interval: float = 0.0):
+        """
+        初始化回放服务
+
+        Args:
+            messages: 待推送的原始消息
+            host: 监听地址
+            port: 监听端口，0表示自动分配
+            interval: 相邻消息的推送间隔（秒）
+        """
+        self.messages = list(messages)
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self._socket = None
+        self._stop = threading.Event()
+        self._clients = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "KlineReplayServer":
+        """从录制的JSONL文件创建回放服务"""
+        with open(path, 'r', encoding='utf-8') as f:
+            messages = [line.strip() for line in f if line.strip()]
+        return cls(messages, **kwargs)
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}/stream"
+
+    def start(self):
+        """开始监听"""
+        self._stop.clear()
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, self.port))
+        self._socket.listen()
+        self.port = self._socket.getsockname()[1]
+        threading.Thread(target=self._accept_loop, name="kline-replay", daemon=True).start()
+
+    def stop(self):
+        """停止服务并断开所有连接"""
+        self._stop.set()
+        if self._socket:
+            # 先shutdown以唤醒阻塞在accept上的线程
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._socket.close()
+        with self._lock:
+            for client in self._clients:
+                try:
+                    client.shutdown(socket.SHUT_RDWR)
+                    client.close()
+                except OSError:
+                    pass
+            self._clients.clear()
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                client, _ = self._socket.accept()
+            except OSError:
+                return
+            with self._lock:
+                self._clients.append(client)
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client: socket.socket):
+        try:
+            if not self._handshake(client):
+                return
+            for message in self.messages:
+                if self._stop.wait(self.interval) if self.interval else self._stop.is_set():
+                    return
+                client.sendall(self._frame(0x1, message.encode('utf-8')))
+
+            # 推送完成后保持连接，响应ping并等待客户端关闭
+            while not self._stop.is_set():
+                opcode, payload = self._read_frame(client)
+                if opcode is None or opcode == 0x8:
+                    client.sendall(self._frame(0x8, payload or b''))
+                    return
+                if opcode == 0x9:
+                    client.sendall(self._frame(0xA, payload))
+        except OSError:
+            pass
+        finally:
+            client.close()
+            with self._lock:
+                if client in self._clients:
+                    self._clients.remove(client)
+
+    @staticmethod
+    def _handshake(client: socket.socket) -> bool:
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = client.recv(4096)
+            if not chunk:
+                return False
+            request += chunk
+
+        key = None
+        for line in request.decode('latin-1').split("\r\n")[1:]:
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "sec-websocket-key":
+                key = value.strip()
+        if key is None:
+            return False
+
+        accept = base64.b64encode(hashlib.sha1((key + _WEBSOCKET_GUID).encode()).digest()).decode()
+        client.sendall((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode())
+        return True
+
+    @staticmethod
+    def _frame(opcode: int, payload: bytes) -> bytes:
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+        return header + payload
+
+    @staticmethod
+    def _read_exact(client: socket.socket, size: int) -> Optional[bytes]:
+        data = b""
+        while len(data) < size:
+            chunk = client.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def _read_frame(self, client: socket.socket):
+        header = self._read_exact(client, 2)
+        if header is None:
+            return None, None
+        opcode = header[0] & 0x0F
+        length = header[1] & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", self._read_exact(client, 2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self._read_exact(client, 8))[0]
+        mask = self._read_exact(client, 4) if header[1] & 0x80 else None
+        payload = self._read_exact(client, length) if length else b""
+        if payload is None:
+            return None, None
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return opcode, payload
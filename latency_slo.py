@@ -0,0 +1,115 @@
+"""
+延迟目标模块 - 记录每个交易对从K线收盘到检测完成、到信号发出的延迟，并按百分位判断是否达标
+
+延迟按交易所服务器时间计算：收盘时间为K线开盘时间加周期长度。最近 window 个样本中
+任一类延迟的 percentile 分位数超过目标时视为未达标，check() 在状态变化时返回一次告警文字。
+"""
+
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+import numpy as np
+
+# 延迟类型：evaluation 为收盘到检测完成（每个交易对每根K线一次），signal 为收盘到信号加入发件箱
+LATENCY_KINDS = ('evaluation', 'signal')
+
+
+class LatencySLO:
+    """
+    收盘延迟统计与目标
+
+    record() 只追加样本；stats() 和 check() 在每轮结束时调用。
+    """
+
+    def __init__(self, target: float, percentile: float = 95, window: int = 500):
+        """
+        初始化延迟统计
+
+        Args:
+            target: 延迟目标（秒）
+            percentile: 判断是否达标的百分位
+            window: 每类延迟保留的最近样本数
+        """
+        self.target = target
+        self.percentile = percentile
+        self.window = window
+        self._samples = {kind: deque(maxlen=window) for kind in LATENCY_KINDS}
+        self._last: Dict[str, Dict[str, float]] = {}
+        self._breaches = {kind: 0 for kind in LATENCY_KINDS}
+        self._breached = False
+        self._lock = threading.Lock()
+
+    def record(self, symbol: str, kind: str, seconds: float):
+        """
+        记录一个样本
+
+        Args:
+            symbol: 交易对
+            kind: 延迟类型，取自 LATENCY_KINDS
+            seconds: 收盘到该事件的秒数
+        """
+        with self._lock:
+            self._samples[kind].append(seconds)
+            self._last.setdefault(symbol, {})[kind] = round(seconds, 3)
+            if seconds > self.target:
+                self._breaches[kind] += 1
+
+    def _summary(self, kind: str) -> Dict:
+        samples = np.fromiter(self._samples[kind], dtype=np.float64)
+        if not len(samples):
+            return {'count': 0, 'p50': None, f'p{self.percentile:g}': None, 'max': None,
+                    'breaches': self._breaches[kind]}
+        return {
+            'count': len(samples),
+            'p50': round(float(np.percentile(samples, 50)), 3),
+            f'p{self.percentile:g}': round(float(np.percentile(samples, self.percentile)), 3),
+            'max': round(float(samples.max()), 3),
+            'breaches': self._breaches[kind]
+        }
+
+    def _is_breached(self) -> bool:
+        return any(len(samples) and np.percentile(np.fromiter(samples, dtype=np.float64), self.percentile) > self.target
+                   for samples in self._samples.values())
+
+    def stats(self) -> Dict:
+        """
+        各类延迟的样本数、中位数、目标百分位、最大值和超标次数，每个交易对最近一次的延迟，
+        以及当前是否未达标
+        """
+        with self._lock:
+            return {
+                'target_seconds': self.target,
+                'percentile': self.percentile,
+                'breached': self._is_breached(),
+                **{kind: self._summary(kind) for kind in LATENCY_KINDS},
+                'symbols': {symbol: dict(last) for symbol, last in self._last.items()}
+            }
+
+    def check(self) -> Optional[str]:
+        """检查是否达标，状态变化（超标或恢复）时返回告警文字，否则返回None"""
+        with self._lock:
+            breached = self._is_breached()
+            if breached == self._breached:
+                return None
+            self._breached = breached
+            parts = []
+            for kind in LATENCY_KINDS:
+                summary = self._summary(kind)
+                value = summary[f'p{self.percentile:g}']
+                if value is not None:
+                    parts.append(f"{kind} p{self.percentile:g}={value:.1f}s")
+        state = "超过" if breached else "恢复到"
+        return f"收盘延迟{state}目标 {self.target:g}s（{'，'.join(parts)}）"
+
+    def format_stats(self) -> str:
+        """格式化延迟统计，用于日志"""
+        stats = self.stats()
+        key = f'p{self.percentile:g}'
+        parts = []
+        for kind, label in (('evaluation', '检测'), ('signal', '信号')):
+            summary = stats[kind]
+            if summary['count']:
+                parts.append(f"{label} p50 {summary['p50']:.1f}s/{key} {summary[key]:.1f}s/最大 {summary['max']:.1f}s")
+        text = "；".join(parts) if parts else "暂无样本"
+        return f"{text}（目标 {self.target:g}s{'，未达标' if stats['breached'] else ''}）"
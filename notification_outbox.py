@@ -0,0 +1,678 @@
+"""
+通知发件箱模块 - 持久化的Telegram发送队列
+
+检测线程只把消息写入SQLite发件箱就返回，后台发送线程按Telegram的限流规则投递：
+每个聊天和全局各一个令牌桶，遇到429按 retry_after 暂停该聊天，5xx和网络错误按指数
+退避重试，同一交易对发往同一聊天的消息严格按入队顺序发送。进程重启后未发送的消息会继续投递。
+
+配置了多个频道时，图片只上传到第一个频道一次，其余频道等上传成功后用返回的 file_id
+引用同一张图片并发发送，每多一个频道只多一次很小的JSON请求。
+
+SignalDigest 把同一轮收盘的多个信号合并为一条汇总消息和若干 sendMediaGroup 媒体组，
+信号集中出现时大幅减少API调用次数。
+"""
+
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from rate_limiter import TokenBucket
+
+logger = logging.getLogger("NotificationOutbox")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    method TEXT NOT NULL,
+    data TEXT NOT NULL,
+    photo BLOB,
+    filename TEXT,
+    created REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    last_error TEXT,
+    parent_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (status, key, id);
+CREATE TABLE IF NOT EXISTS outbox_files (
+    outbox_id INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_files_id ON outbox_files (outbox_id);
+"""
+
+# 429 响应没有给出 retry_after 时的默认等待秒数
+DEFAULT_RETRY_AFTER = 5.0
+
+# sendMediaGroup 每组2到10个媒体，消息正文最多4096个字符
+MEDIA_GROUP_LIMIT = 10
+MESSAGE_LIMIT = 4096
+
+
+class TelegramOutbox:
+    """
+    持久化的Telegram发件箱
+
+    enqueue_message()/enqueue_photo() 只写入数据库并唤醒发送线程。发送线程每次取
+    各交易对（key）在每个聊天中最早的一条待发消息，前一条发送成功或最终失败前同一
+    交易对在该聊天的下一条消息不会发送，因此文字和图表总是按入队顺序到达，不同频道
+    之间互不阻塞。
+
+    未指定 chat_id 时消息发往 bot.channel_ids 中的全部频道。图片只随第一个频道的请求
+    上传，其余频道的副本先以 'waiting' 状态占住队列位置，上传成功后填入返回的 file_id
+    转为待发送；第一个频道最终失败时由下一个副本接手上传。
+    """
+
+    def __init__(self, bot, path: str, workers: int = 2, chat_rate_per_minute: float = 20,
+                 chat_burst: float = 3, global_rate_per_second: float = 30, max_attempts: int = 8,
+                 backoff_base: float = 1.0, backoff_max: float = 300.0):
+        """
+        初始化发件箱
+
+        Args:
+            bot: 提供 api_request(method, data, files) 和 channel_ids 的 TelegramBot
+            path: SQLite数据库文件路径
+            workers: 发送线程数
+            chat_rate_per_minute: 每个聊天每分钟最多发送的消息数（频道和群组为20条）
+            chat_burst: 每个聊天允许的突发消息数
+            global_rate_per_second: 全部聊天合计每秒最多发送的消息数
+            max_attempts: 5xx或网络错误时的最多尝试次数，超过后标记为失败
+            backoff_base: 第一次重试前等待的秒数，之后每次翻倍
+            backoff_max: 重试等待的上限（秒）
+        """
+        self.bot = bot
+        self.path = path
+        self.workers = max(1, workers)
+        self.chat_rate = chat_rate_per_minute / 60
+        self.chat_burst = chat_burst
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")]
+        if 'parent_id' not in columns:
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN parent_id INTEGER")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_parent ON outbox (parent_id)")
+
+        # 数据库连接和调度状态共用一把锁
+        self._cond = threading.Condition()
+        self._repair_orphans()
+        self._in_flight = set()
+        self._paused_until: Dict[str, float] = {}
+        self._chat_buckets: Dict[str, TokenBucket] = {}
+        self._global_bucket = TokenBucket(rate=global_rate_per_second, capacity=global_rate_per_second)
+        self._threads: List[threading.Thread] = []
+        self._stopped = threading.Event()
+
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.throttled = 0
+        self.reused = 0
+        self.lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+
+    @contextmanager
+    def _transaction(self):
+        """在一个事务内执行多条语句（调用方持有锁），已在事务中时直接并入外层事务"""
+        if self._conn.in_transaction:
+            yield
+            return
+        self._conn.execute("BEGIN")
+        try:
+            yield
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _repair_orphans(self):
+        """
+        修复等待中但上传消息已失败或不存在的副本（旧版本在确认和释放副本之间退出时会留下），
+        否则 _claim 永远跳过它们，该交易对在这些频道的队列会一直阻塞
+
+        上传消息已失败时照常交接上传；上传消息已不存在时图片数据已随之删除，只能标记失败
+        """
+        with self._cond, self._transaction():
+            orphans = self._conn.execute(
+                "SELECT w.parent_id, p.status FROM outbox w LEFT JOIN outbox p ON p.id = w.parent_id "
+                "WHERE w.status = 'waiting' AND (p.id IS NULL OR p.status = 'failed') GROUP BY w.parent_id"
+            ).fetchall()
+            for parent_id, status in orphans:
+                if status == 'failed':
+                    self._handover_upload(self._load(parent_id))
+                else:
+                    self._conn.execute(
+                        "UPDATE outbox SET status = 'failed', last_error = ? WHERE parent_id = ? AND status = 'waiting'",
+                        ("上传消息已不存在，无法取得图片", parent_id)
+                    )
+        if orphans:
+            logger.warning(f"修复了 {len(orphans)} 组等待已失败或已删除上传的副本")
+
+    def start(self):
+        """启动发送线程（重启后数据库中未发送的消息会继续投递）"""
+        self._stopped.clear()
+        for index in range(self.workers - len(self._threads)):
+            thread = threading.Thread(target=self._run, name=f"telegram-outbox-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        depth = self.depth()
+        if depth:
+            logger.info(f"发件箱中有 {depth} 条待发送消息，继续投递")
+
+    def stop(self, timeout: float = 5.0):
+        """停止发送线程，未发送的消息留在数据库中"""
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    @property
+    def chat_ids(self) -> List[str]:
+        """未指定 chat_id 时的目标频道，第一个频道负责上传图片"""
+        return [str(chat_id) for chat_id in getattr(self.bot, 'channel_ids', None) or [self.bot.channel_id]]
+
+    def enqueue_message(self, key: str, text: str, parse_mode: str = None, chat_id: str = None,
+                        created: float = None) -> int:
+        """把文字消息加入发件箱（未指定 chat_id 时发往全部频道），返回第一条消息的ID"""
+        data = {'text': text}
+        if parse_mode:
+            data['parse_mode'] = parse_mode
+        ids = [self.enqueue(key, 'sendMessage', data, chat_id=target, created=created)
+               for target in ([chat_id] if chat_id else self.chat_ids)]
+        return ids[0]
+
+    def enqueue_photo(self, key: str, photo: bytes, filename: str, caption: str = "", chat_id: str = None,
+                      created: float = None) -> int:
+        """把图片加入发件箱（未指定 chat_id 时发往全部频道，只上传一次），返回上传消息的ID"""
+        return self._enqueue_upload(key, 'sendPhoto', {'caption': caption}, chat_id, created,
+                                    photo=photo, filename=filename)
+
+    def enqueue_media_group(self, key: str, photos: List[Tuple[bytes, str, str]], chat_id: str = None,
+                            created: float = None) -> int:
+        """
+        把一组图片作为一次 sendMediaGroup 加入发件箱
+
+        Args:
+            photos: (图片数据, 文件名, 说明文字) 列表，最多 MEDIA_GROUP_LIMIT 张；只有一张时改用 sendPhoto
+        """
+        if len(photos) > MEDIA_GROUP_LIMIT:
+            raise ValueError(f"媒体组最多 {MEDIA_GROUP_LIMIT} 张图片: {len(photos)}")
+        if len(photos) == 1:
+            image, filename, caption = photos[0]
+            return self.enqueue_photo(key, image, filename, caption, chat_id=chat_id, created=created)
+
+        media = []
+        attachments = {}
+        for index, (image, filename, caption) in enumerate(photos):
+            field = f"photo{index}"
+            media.append({'type': 'photo', 'media': f"attach://{field}", 'caption': caption[:1024]})
+            attachments[field] = (filename, image)
+        return self._enqueue_upload(key, 'sendMediaGroup', {'media': json.dumps(media, ensure_ascii=False)},
+                                    chat_id, created, attachments=attachments)
+
+    def _enqueue_upload(self, key: str, method: str, data: Dict, chat_id: Optional[str], created: Optional[float],
+                        **upload) -> int:
+        """上传请求发往第一个频道，其余频道各加一条等待 file_id 的副本"""
+        targets = [chat_id] if chat_id else self.chat_ids
+        with self._cond, self._transaction():
+            parent_id = self.enqueue(key, method, data, chat_id=targets[0], created=created, **upload)
+            for target in targets[1:]:
+                self.enqueue(key, method, data, chat_id=target, created=created, parent_id=parent_id)
+        return parent_id
+
+    def enqueue(self, key: str, method: str, data: Dict, photo: bytes = None, filename: str = None,
+                chat_id: str = None, created: float = None,
+                attachments: Dict[str, Tuple[str, bytes]] = None, parent_id: int = None) -> int:
+        """
+        把一次Bot API调用加入发件箱
+
+        Args:
+            key: 排序键（交易对），同一排序键的消息按入队顺序发送
+            method: Bot API方法，如 sendMessage、sendPhoto
+            data: 请求参数（不含 chat_id）
+            photo: 随请求上传的图片数据
+            filename: 图片文件名
+            chat_id: 目标聊天，默认取 bot.channel_id
+            created: 计算投递延迟的起点（时间戳），默认为入队时间
+            attachments: 额外上传的文件 {表单字段: (文件名, 数据)}，如媒体组的 attach:// 引用
+            parent_id: 负责上传的消息ID，设置后本条消息等待其 file_id 再发送
+
+        Returns:
+            int: 消息ID
+        """
+        now = time.time()
+        with self._cond, self._transaction():
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (key, chat_id, method, data, photo, filename, created, next_attempt, status, "
+                "parent_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, str(chat_id or self.chat_ids[0]), method, json.dumps(data, ensure_ascii=False),
+                 photo, filename, created or now, now, 'waiting' if parent_id else 'pending', parent_id)
+            )
+            if attachments:
+                self._conn.executemany(
+                    "INSERT INTO outbox_files (outbox_id, field, filename, data) VALUES (?, ?, ?, ?)",
+                    [(cursor.lastrowid, field, name, content) for field, (name, content) in attachments.items()]
+                )
+            self._cond.notify()
+            return cursor.lastrowid
+
+    def _run(self):
+        while not self._stopped.is_set():
+            item = self._claim()
+            if item is None:
+                continue
+            try:
+                self._deliver(item)
+            except Exception as e:
+                logger.error(f"投递消息 {item['id']} 时出错: {str(e)}")
+            finally:
+                with self._cond:
+                    self._in_flight.discard((item['key'], item['chat_id']))
+                    self._cond.notify_all()
+
+    def _claim(self) -> Optional[Dict]:
+        """
+        取一条可以发送的消息：所在交易对在该聊天没有正在发送或等待 file_id 的更早消息，
+        且已到重试时间、聊天未被暂停
+        """
+        with self._cond:
+            while not self._stopped.is_set():
+                now = time.time()
+                wait = 60.0
+                heads = self._conn.execute(
+                    "SELECT o.id, o.key, o.chat_id, o.next_attempt, o.status FROM outbox o "
+                    "JOIN (SELECT MIN(id) AS id FROM outbox WHERE status IN ('pending', 'waiting') "
+                    "GROUP BY key, chat_id) h ON o.id = h.id ORDER BY o.id"
+                ).fetchall()
+                for item_id, key, chat_id, next_attempt, status in heads:
+                    if status == 'waiting' or (key, chat_id) in self._in_flight:
+                        continue
+                    ready_at = max(next_attempt, self._paused_until.get(chat_id, 0.0))
+                    if ready_at <= now:
+                        self._in_flight.add((key, chat_id))
+                        return self._load(item_id)
+                    wait = min(wait, ready_at - now)
+                self._cond.wait(wait)
+            return None
+
+    def _load(self, item_id: int) -> Dict:
+        row = self._conn.execute(
+            "SELECT id, key, chat_id, method, data, photo, filename, created, attempts FROM outbox WHERE id = ?",
+            (item_id,)
+        ).fetchone()
+        columns = ('id', 'key', 'chat_id', 'method', 'data', 'photo', 'filename', 'created', 'attempts')
+        item = dict(zip(columns, row))
+        item['attachments'] = {
+            field: (name, content) for field, name, content in self._conn.execute(
+                "SELECT field, filename, data FROM outbox_files WHERE outbox_id = ?", (item_id,)
+            )
+        }
+        return item
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        with self._cond:
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = TokenBucket(rate=self.chat_rate, capacity=self.chat_burst)
+                self._chat_buckets[chat_id] = bucket
+            return bucket
+
+    def _deliver(self, item: Dict):
+        """发送一条消息并根据结果确认、重新排期或标记失败"""
+        self._chat_bucket(item['chat_id']).acquire()
+        self._global_bucket.acquire()
+
+        data = json.loads(item['data'])
+        data['chat_id'] = item['chat_id']
+        files = dict(item['attachments'])
+        if item['photo'] is not None:
+            files['photo'] = (item['filename'] or 'chart.png', item['photo'])
+
+        try:
+            status, body = self.bot.api_request(item['method'], data, files or None)
+        except Exception as e:
+            self._retry(item, f"网络错误: {str(e)}")
+            return
+
+        if status == 200 and body.get('ok'):
+            self._complete(item, body.get('result'))
+        elif status == 429:
+            retry_after = float((body.get('parameters') or {}).get('retry_after', DEFAULT_RETRY_AFTER))
+            self._throttle(item, retry_after)
+        elif status is None or status >= 500:
+            self._retry(item, f"HTTP {status}: {body.get('description', '')}")
+        else:
+            self._fail(item, f"HTTP {status}: {body.get('description', '')}")
+
+    def _complete(self, item: Dict, result=None):
+        lag = max(0.0, time.time() - item['created'])
+        with self._cond:
+            # 删除和释放副本在同一事务内，中途出错时副本不会留在等待一条已删除消息的状态
+            with self._transaction():
+                self._conn.execute("DELETE FROM outbox WHERE id = ?", (item['id'],))
+                self._conn.execute("DELETE FROM outbox_files WHERE outbox_id = ?", (item['id'],))
+                self._release_copies(item, _photo_file_ids(result))
+            self.sent += 1
+            if item['photo'] is None and not item['attachments'] and item['method'] != 'sendMessage':
+                self.reused += 1
+            self.lag_seconds += lag
+            self.max_lag_seconds = max(self.max_lag_seconds, lag)
+        logger.info(f"{item['key']} {item['method']} 已发送，投递延迟 {lag:.2f} 秒")
+
+    def _throttle(self, item: Dict, retry_after: float):
+        """429：暂停该聊天 retry_after 秒，消息保持在队首，不计入尝试次数"""
+        resume_at = time.time() + retry_after
+        with self._cond:
+            self._paused_until[item['chat_id']] = max(self._paused_until.get(item['chat_id'], 0.0), resume_at)
+            self._conn.execute("UPDATE outbox SET next_attempt = ?, last_error = ? WHERE id = ?",
+                               (resume_at, f"429 retry_after={retry_after}", item['id']))
+            self.throttled += 1
+        logger.warning(f"Telegram限流，聊天 {item['chat_id']} 暂停 {retry_after:.0f} 秒")
+
+    def _retry(self, item: Dict, error: str):
+        """5xx或网络错误：指数退避（带随机抖动）后重试，超过最多尝试次数则标记失败"""
+        attempts = item['attempts'] + 1
+        if attempts >= self.max_attempts:
+            self._fail(item, error, attempts)
+            return
+
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+        with self._cond:
+            self._conn.execute("UPDATE outbox SET attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                               (attempts, time.time() + delay, error, item['id']))
+            self.retried += 1
+        logger.warning(f"{item['key']} {item['method']} 发送失败（{error}），{delay:.1f} 秒后第 {attempts + 1} 次尝试")
+
+    def _fail(self, item: Dict, error: str, attempts: int = None):
+        """不可重试的错误：标记失败并保留在数据库中，后面的消息继续发送；等待其上传的副本改由下一个频道上传"""
+        with self._cond:
+            with self._transaction():
+                self._conn.execute("UPDATE outbox SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                                   (attempts or item['attempts'] + 1, error, item['id']))
+                self._handover_upload(item)
+            self.failed += 1
+        logger.error(f"{item['key']} {item['method']} 发送失败，已放弃: {error}")
+
+    def _release_copies(self, item: Dict, file_ids: List[str]):
+        """上传成功后把 file_id 填入等待中的副本，转为待发送（调用方持有锁）"""
+        copies = self._conn.execute("SELECT id, data FROM outbox WHERE parent_id = ? AND status = 'waiting'",
+                                    (item['id'],)).fetchall()
+        if not copies:
+            return
+        if len(file_ids) < max(1, len(item['attachments'])):
+            # 响应中没有可引用的图片时改为各自上传
+            self._handover_upload(item)
+            return
+
+        now = time.time()
+        for copy_id, data in copies:
+            data = json.loads(data)
+            if item['method'] == 'sendMediaGroup':
+                media = json.loads(data['media'])
+                for entry, file_id in zip(media, file_ids):
+                    entry['media'] = file_id
+                data['media'] = media
+            else:
+                data['photo'] = file_ids[0]
+            self._conn.execute(
+                "UPDATE outbox SET data = ?, status = 'pending', next_attempt = ?, parent_id = NULL WHERE id = ?",
+                (json.dumps(data, ensure_ascii=False), now, copy_id)
+            )
+        self._cond.notify_all()
+
+    def _handover_upload(self, item: Dict):
+        """把图片数据交给第一个等待中的副本，由它上传，其余副本改为等待它（调用方持有锁）"""
+        copies = [row[0] for row in self._conn.execute(
+            "SELECT id FROM outbox WHERE parent_id = ? AND status = 'waiting' ORDER BY id", (item['id'],)
+        )]
+        if not copies:
+            return
+        heir = copies[0]
+        self._conn.execute(
+            "UPDATE outbox SET photo = ?, filename = ?, status = 'pending', next_attempt = ?, parent_id = NULL "
+            "WHERE id = ?", (item['photo'], item['filename'], time.time(), heir)
+        )
+        self._conn.executemany(
+            "INSERT INTO outbox_files (outbox_id, field, filename, data) VALUES (?, ?, ?, ?)",
+            [(heir, field, name, content) for field, (name, content) in item['attachments'].items()]
+        )
+        self._conn.executemany("UPDATE outbox SET parent_id = ? WHERE id = ?", [(heir, copy) for copy in copies[1:]])
+        self._cond.notify_all()
+
+    def depth(self) -> int:
+        """待发送的消息数（含等待 file_id 的副本）"""
+        with self._cond:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'waiting')"
+            ).fetchone()[0]
+
+    def flush(self, timeout: float = None) -> bool:
+        """等待发件箱清空，超时返回False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.depth():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+    def stats(self) -> Dict:
+        """返回队列深度、最早待发消息的等待时间和累计投递统计"""
+        with self._cond:
+            depth, oldest = self._conn.execute(
+                "SELECT COUNT(*), MIN(created) FROM outbox WHERE status IN ('pending', 'waiting')"
+            ).fetchone()
+            dead = self._conn.execute("SELECT COUNT(*) FROM outbox WHERE status = 'failed'").fetchone()[0]
+            return {
+                'depth': depth,
+                'in_flight': len(self._in_flight),
+                'oldest_pending_seconds': time.time() - oldest if oldest else 0.0,
+                'sent': self.sent,
+                'retried': self.retried,
+                'throttled': self.throttled,
+                'reused_uploads': self.reused,
+                'failed': self.failed,
+                'dead_letters': dead,
+                'avg_lag_seconds': self.lag_seconds / self.sent if self.sent else 0.0,
+                'max_lag_seconds': self.max_lag_seconds
+            }
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        return (f"待发 {stats['depth']}（最早 {stats['oldest_pending_seconds']:.0f} 秒前），"
+                f"发送中 {stats['in_flight']}，已发 {stats['sent']}，重试 {stats['retried']}，"
+                f"限流 {stats['throttled']}，复用上传 {stats['reused_uploads']}，失败 {stats['failed']}，"
+                f"平均延迟 {stats['avg_lag_seconds']:.2f} 秒，最长 {stats['max_lag_seconds']:.2f} 秒")
+
+
+def _photo_file_ids(result) -> List[str]:
+    """从 sendPhoto（单条消息）或 sendMediaGroup（消息列表）的响应中取每张图片最大尺寸的 file_id"""
+    messages = result if isinstance(result, list) else [result]
+    return [message['photo'][-1]['file_id'] for message in messages
+            if isinstance(message, dict) and message.get('photo')]
+
+
+class SignalDigest:
+    """
+    信号汇总
+
+    同一轮收盘检测到的信号先在 window 秒内收集，窗口结束且图表都已渲染完成（最多等待
+    max_wait 秒）后，合并为一条汇总消息和若干 sendMediaGroup 媒体组写入发件箱。
+    汇总消息和媒体组使用同一个排序键，汇总总在图片之前送达。
+    """
+
+    def __init__(self, outbox: TelegramOutbox, window: float = 5.0, max_wait: float = 30.0,
+                 group_size: int = MEDIA_GROUP_LIMIT, max_signals: int = 50, key: str = "digest"):
+        """
+        初始化信号汇总
+
+        Args:
+            outbox: 写入的发件箱，消息格式取自 outbox.bot
+            window: 从一批的第一个信号起收集信号的秒数
+            max_wait: 等待图表渲染的最长秒数，超时后先发送已有的图表，之后完成的图表单独发送
+            group_size: 每个媒体组的图片数（2到10）
+            max_signals: 一批信号数达到该值且图表都已完成时不等窗口结束立即发送
+            key: 发件箱排序键
+        """
+        self.outbox = outbox
+        self.bot = outbox.bot
+        self.window = window
+        self.max_wait = max(window, max_wait)
+        self.group_size = min(MEDIA_GROUP_LIMIT, max(2, group_size))
+        self.max_signals = max(1, max_signals)
+        self.key = key
+
+        self._cond = threading.Condition()
+        self._batch: List[Dict] = []
+        self._opened = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+        self.batches = 0
+        self.signals = 0
+        self.api_calls = 0
+
+    def start(self):
+        """启动汇总线程"""
+        self._stopped.clear()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="telegram-digest", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """停止汇总线程，未发送的信号立即写入发件箱"""
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        with self._cond:
+            batch = self._take()
+        if batch:
+            self._send(batch)
+
+    def add(self, signal_info: Dict, expect_chart: bool = True, created: float = None) -> Dict:
+        """
+        加入一个信号
+
+        Args:
+            signal_info: 信号信息
+            expect_chart: 是否有图表正在渲染（渲染完成后调用 attach_chart）
+            created: 计算投递延迟的起点（时间戳）
+
+        Returns:
+            Dict: 信号条目，传给 attach_chart
+        """
+        entry = {
+            'signal': signal_info,
+            'created': created or time.time(),
+            'image': None,
+            'filename': None,
+            'resolved': not expect_chart,
+            'flushed': False
+        }
+        with self._cond:
+            if not self._batch:
+                self._opened = time.monotonic()
+            self._batch.append(entry)
+            self._cond.notify_all()
+        return entry
+
+    def attach_chart(self, entry: Dict, image: bytes = None, filename: str = None):
+        """图表渲染结束（image 为None表示渲染失败）；所在批次已发送时单独发送该图表"""
+        with self._cond:
+            entry['image'] = image
+            entry['filename'] = filename
+            entry['resolved'] = True
+            flushed = entry['flushed']
+            self._cond.notify_all()
+        if flushed and image is not None:
+            self.outbox.enqueue_photo(self.key, image, filename, self.bot.format_chart_caption(entry['signal']),
+                                      created=entry['created'])
+            with self._cond:
+                self.api_calls += 1
+
+    def _run(self):
+        while not self._stopped.is_set():
+            with self._cond:
+                batch = None
+                while batch is None and not self._stopped.is_set():
+                    if not self._batch:
+                        self._cond.wait()
+                        continue
+                    age = time.monotonic() - self._opened
+                    resolved = all(entry['resolved'] for entry in self._batch)
+                    if (resolved and (age >= self.window or len(self._batch) >= self.max_signals)) \
+                            or age >= self.max_wait:
+                        batch = self._take()
+                    else:
+                        self._cond.wait((self.window if age < self.window else self.max_wait) - age)
+            if batch:
+                try:
+                    self._send(batch)
+                except Exception as e:
+                    logger.error(f"写入信号汇总时出错: {str(e)}")
+
+    def _take(self) -> List[Dict]:
+        batch = self._batch
+        self._batch = []
+        for entry in batch:
+            entry['flushed'] = True
+        return batch
+
+    def _send(self, batch: List[Dict]):
+        """汇总消息按 MESSAGE_LIMIT 分段，图表按 group_size 分组"""
+        created = min(entry['created'] for entry in batch)
+        calls = 0
+        for text in self.bot.format_digest_summary([entry['signal'] for entry in batch], MESSAGE_LIMIT):
+            self.outbox.enqueue_message(self.key, text, created=created)
+            calls += 1
+
+        photos = [(entry['image'], entry['filename'], self.bot.format_signal_line(entry['signal']))
+                  for entry in batch if entry['image'] is not None]
+        for start in range(0, len(photos), self.group_size):
+            self.outbox.enqueue_media_group(self.key, photos[start:start + self.group_size], created=created)
+            calls += 1
+
+        with self._cond:
+            self.batches += 1
+            self.signals += len(batch)
+            self.api_calls += calls
+        logger.info(f"信号汇总: {len(batch)} 个信号、{len(photos)} 张图表合并为 {calls} 次API调用")
+
+    def stats(self) -> Dict:
+        """返回累计汇总批次、信号数和API调用次数（逐条发送时每个信号需要2次）"""
+        with self._cond:
+            return {
+                'pending': len(self._batch),
+                'batches': self.batches,
+                'signals': self.signals,
+                'api_calls': self.api_calls,
+                'saved_calls': 2 * self.signals - self.api_calls
+            }
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        return (f"待汇总 {stats['pending']}，已汇总 {stats['batches']} 批 {stats['signals']} 个信号，"
+                f"API调用 {stats['api_calls']} 次（节省 {stats['saved_calls']} 次）")
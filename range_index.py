@@ -0,0 +1,175 @@
+"""
+区间极值索引模块 - 按K线增量维护的稀疏表，O(1) 查询任意区间的最高价/最低价及其位置
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class _SparseTable:
+    """
+    单列数据的区间最值稀疏表
+
+    位置使用自开始以来的绝对序号，各层以 capacity 为长度的环形数组存放，
+    第 k 层位置 p 保存 [p, p + 2^k) 内最值的绝对序号。追加一个值只需
+    补齐以它结尾的各层区间（O(log capacity)），淘汰最旧的值不需要任何操作。
+    并列时取最早出现的位置，与 np.argmax / np.argmin 一致。
+    """
+
+    def __init__(self, capacity: int, maximum: bool):
+        self.capacity = capacity
+        self.maximum = maximum
+        self.levels = max(1, capacity.bit_length())
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.table = np.zeros((self.levels, capacity), dtype=np.int64)
+
+    def _better(self, left: int, right: int) -> int:
+        """返回两个位置中取值更优的一个，相等时取 left（较早的位置）"""
+        a = self.values[left % self.capacity]
+        b = self.values[right % self.capacity]
+        if self.maximum:
+            return left if a >= b else right
+        return left if a <= b else right
+
+    def append(self, position: int, value: float, oldest: int):
+        cap = self.capacity
+        self.values[position % cap] = value
+        self.table[0, position % cap] = position
+        for k in range(1, self.levels):
+            start = position - (1 << k) + 1
+            if start < oldest:
+                break
+            half = start + (1 << (k - 1))
+            self.table[k, start % cap] = self._better(int(self.table[k - 1, start % cap]),
+                                                      int(self.table[k - 1, half % cap]))
+
+    def build(self, values: np.ndarray):
+        """从位置0开始批量构建"""
+        n = len(values)
+        self.values[:n] = values
+        self.table[0, :n] = np.arange(n)
+        compare = np.greater_equal if self.maximum else np.less_equal
+        for k in range(1, self.levels):
+            span = 1 << k
+            if span > n:
+                break
+            half = span >> 1
+            left = self.table[k - 1, :n - span + 1]
+            right = self.table[k - 1, half:half + n - span + 1]
+            self.table[k, :n - span + 1] = np.where(compare(values[left], values[right]), left, right)
+
+    def query(self, first: int, last: int) -> int:
+        """闭区间 [first, last]（绝对序号）内最值的位置"""
+        k = (last - first + 1).bit_length() - 1
+        cap = self.capacity
+        return self._better(int(self.table[k, first % cap]),
+                            int(self.table[k, (last - (1 << k) + 1) % cap]))
+
+
+class RangeExtrema:
+    """
+    单个交易对的滑动区间极值索引
+
+    与 KlineBuffer 保持同步（容量相同），以缓冲区内索引回答“[i, j] 内最高价/
+    最低价及其位置”，每次查询 O(1)，不随区间长度变化，因此A点窗口、
+    C点区间可以在运行时任意调整而不增加开销。
+    """
+
+    def __init__(self, capacity: int):
+        """
+        初始化索引
+
+        Args:
+            capacity: 与K线缓冲区相同的容量
+        """
+        if capacity <= 0:
+            raise ValueError("capacity必须大于0")
+
+        self.capacity = capacity
+        self._highs = _SparseTable(capacity, maximum=True)
+        self._lows = _SparseTable(capacity, maximum=False)
+        self._count = 0
+        self._length = 0
+        self.last_timestamp: Optional[int] = None
+        self.rebuilds = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def reset(self):
+        """清空索引，下次同步时从缓冲区重建"""
+        self._count = 0
+        self._length = 0
+        self.last_timestamp = None
+
+    def append(self, timestamp: int, high: float, low: float):
+        """追加一根K线"""
+        position = self._count
+        self._count += 1
+        self._length = min(self._length + 1, self.capacity)
+        oldest = self._count - self._length
+        self._highs.append(position, high, oldest)
+        self._lows.append(position, low, oldest)
+        self.last_timestamp = timestamp
+
+    def sync(self, klines) -> int:
+        """
+        与K线缓冲区同步：只追加新收盘的K线，缓冲区被重新初始化或回退时整体重建
+
+        Args:
+            klines: KlineBuffer
+
+        Returns:
+            int: 本次追加的K线数量
+        """
+        timestamps = klines.timestamp
+        n = len(timestamps)
+        if n == 0:
+            self.reset()
+            return 0
+
+        start = 0
+        if self.last_timestamp is not None:
+            start = int(np.searchsorted(timestamps, self.last_timestamp, side='right'))
+            if start == 0 or timestamps[start - 1] != self.last_timestamp:
+                start = 0
+
+        if start > 0:
+            highs = klines.high
+            lows = klines.low
+            for i in range(start, n):
+                self.append(int(timestamps[i]), float(highs[i]), float(lows[i]))
+            if self._length == n:
+                return n - start
+
+        # 首次同步、缓冲区回退或长度对不上时整体重建
+        self.rebuilds += 1
+        self._highs.build(klines.high)
+        self._lows.build(klines.low)
+        self._count = self._length = n
+        self.last_timestamp = int(timestamps[-1])
+        return n
+
+    def _absolute(self, index: int) -> int:
+        return self._count - self._length + index
+
+    def max_high(self, start: int, end: int) -> Tuple[float, int]:
+        """
+        缓冲区索引闭区间 [start, end] 内的最高价及其索引（并列时取最早的）
+
+        Returns:
+            Tuple[float, int]: (最高价, 缓冲区索引)
+        """
+        position = self._highs.query(self._absolute(start), self._absolute(end))
+        return float(self._highs.values[position % self.capacity]), position - self._count + self._length
+
+    def min_low(self, start: int, end: int) -> Tuple[float, int]:
+        """
+        缓冲区索引闭区间 [start, end] 内的最低价及其索引（并列时取最早的）
+
+        Returns:
+            Tuple[float, int]: (最低价, 缓冲区索引)
+        """
+        position = self._lows.query(self._absolute(start), self._absolute(end))
+        return float(self._lows.values[position % self.capacity]), position - self._count + self._length
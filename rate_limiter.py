@@ -0,0 +1,277 @@
+"""
+限流模块 - 多线程共享的令牌桶，以及按交易所返回的已用权重自适应并发的请求调度器
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Mapping, Optional
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶
+
+    令牌以 rate 个/秒的速度补充，最多累积 capacity 个；每个请求按其
+    权重消耗令牌，令牌不足时阻塞等待，从而保证任意时间窗口内的总权重
+    不超过交易所预算。
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        初始化令牌桶
+
+        Args:
+            rate: 每秒补充的令牌数
+            capacity: 令牌桶容量（允许的突发权重）
+        """
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("rate和capacity必须大于0")
+
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """尝试立即获取令牌，不足时返回False"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """
+        获取令牌，不足时阻塞等待
+
+        Args:
+            tokens: 需要的令牌数（请求权重）
+            timeout: 最长等待时间（秒），None表示一直等待
+
+        Returns:
+            bool: 是否获取成功
+        """
+        if tokens > self.capacity:
+            raise ValueError(f"请求权重 {tokens} 超过令牌桶容量 {self.capacity}")
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    @property
+    def available(self) -> float:
+        """当前可用令牌数"""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+class RequestScheduler:
+    """
+    按交易所返回的已用权重自适应调整并发的请求调度器
+
+    权重按固定时间窗口（币安为每分钟，窗口在整分钟重置）计算：发送前按本地估计
+    累加，响应后用响应头中的已用权重（如 X-MBX-USED-WEIGHT-1M）校正，因此同一IP下
+    其他程序消耗的权重也会被计入。已用权重加上本次请求会超过 limit * safety 时，
+    请求等待到下一个窗口，在被限流之前主动退避。窗口边界按 clock 对齐，传入交易所
+    服务器时间时与交易所的重置时刻一致，本地时钟偏差不会让预算提前或推迟重置。
+
+    并发数按加性增、乘性减调整：已用比例低于 low_watermark 时每个响应加1（不超过
+    max_concurrency），高于 high_watermark 时减半；收到429/418时按 Retry-After
+    暂停全部请求，并发降到 min_concurrency。
+    """
+
+    def __init__(self, limit: float, window: float = 60, safety: float = 0.8, max_concurrency: int = 8,
+                 min_concurrency: int = 1, low_watermark: float = 0.5, high_watermark: float = 0.7,
+                 used_header: Optional[str] = None, clock: Callable[[], float] = None):
+        """
+        初始化调度器
+
+        Args:
+            limit: 每个窗口的权重上限（交易所公布的值）
+            window: 窗口长度（秒）
+            safety: 最多使用上限的比例
+            max_concurrency: 最大并发请求数
+            min_concurrency: 最小并发请求数，也是初始并发数
+            low_watermark: 已用比例低于该值时增加并发
+            high_watermark: 已用比例高于该值时减半并发
+            used_header: 交易所返回的已用权重响应头，None表示只按本地估计
+            clock: 返回当前时间（秒）的函数，用于对齐窗口和计算限流暂停，None表示本地时间；
+                调用时才取值，可以引用调度器之后创建的对象
+        """
+        if limit <= 0 or window <= 0:
+            raise ValueError("limit和window必须大于0")
+
+        self.limit = limit
+        self.window = window
+        self.safety = safety
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.used_header = used_header.lower() if used_header else None
+        self.clock = clock or time.time
+
+        self.concurrency = self.min_concurrency
+        self._used = 0.0
+        self._window_start: Optional[float] = None  # 第一次使用时按 clock 确定
+        self._in_flight = 0
+        self._banned_until = 0.0
+        self._condition = threading.Condition()
+
+        self.requests = 0
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+        self.bans = 0
+        self.peak_usage = 0.0
+
+    def _current_window(self) -> float:
+        return self.clock() // self.window * self.window
+
+    def _roll_window(self):
+        window_start = self._current_window()
+        if window_start != self._window_start:
+            self._window_start = window_start
+            self._used = 0.0
+
+    def acquire(self, weight: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """
+        获取发送一个请求的许可，并发已满、窗口预算不足或被限流时阻塞等待；
+        获取成功后必须调用 release()
+
+        Args:
+            weight: 请求权重
+            timeout: 最长等待时间（秒），None表示一直等待
+
+        Returns:
+            bool: 是否获取成功
+        """
+        if weight > self.limit * self.safety:
+            raise ValueError(f"请求权重 {weight} 超过窗口预算 {self.limit * self.safety}")
+
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        throttled = False
+        with self._condition:
+            while True:
+                self._roll_window()
+                now = self.clock()
+                if now < self._banned_until:
+                    wait = self._banned_until - now
+                elif self._used + weight > self.limit * self.safety:
+                    wait = self._window_start + self.window - now
+                elif self._in_flight >= self.concurrency:
+                    wait = None  # 等待 release() 通知
+                else:
+                    break
+
+                if wait is not None:
+                    throttled = True
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._condition.wait(None if wait is None else max(wait, 0.001))
+
+            self._in_flight += 1
+            self._used += weight
+            self.requests += 1
+            if throttled:
+                self.throttled += 1
+                self.throttled_seconds += time.monotonic() - started
+            return True
+
+    def release(self, headers: Optional[Mapping[str, str]] = None, status_code: Optional[int] = None):
+        """
+        请求结束（无论成功与否）时调用，用响应头校正已用权重并调整并发
+
+        Args:
+            headers: 响应头，请求异常时为None
+            status_code: HTTP状态码
+        """
+        with self._condition:
+            self._in_flight -= 1
+            self._roll_window()
+
+            if headers is not None and self.used_header:
+                for name, value in headers.items():
+                    if name.lower() == self.used_header:
+                        try:
+                            self._used = max(self._used, float(value))
+                        except ValueError:
+                            pass
+                        break
+
+            if status_code in (418, 429):
+                retry_after = None
+                if headers is not None:
+                    for name, value in headers.items():
+                        if name.lower() == 'retry-after':
+                            try:
+                                retry_after = float(value)
+                            except ValueError:
+                                pass
+                            break
+                if retry_after is None:
+                    retry_after = self._window_start + self.window - self.clock()
+                self._banned_until = max(self._banned_until, self.clock() + retry_after)
+                self.concurrency = self.min_concurrency
+                self.bans += 1
+            elif status_code is not None:
+                usage = self._used / self.limit
+                if usage > self.high_watermark:
+                    self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+                elif usage < self.low_watermark:
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+
+            self.peak_usage = max(self.peak_usage, self._used / self.limit)
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, float]:
+        """当前窗口的已用权重、使用比例、并发数，以及累计请求、等待和限流次数"""
+        with self._condition:
+            self._roll_window()
+            return {
+                'used': self._used,
+                'limit': self.limit,
+                'usage': round(self._used / self.limit, 4),
+                'peak_usage': round(self.peak_usage, 4),
+                'concurrency': self.concurrency,
+                'in_flight': self._in_flight,
+                'requests': self.requests,
+                'throttled': self.throttled,
+                'throttled_seconds': round(self.throttled_seconds, 3),
+                'bans': self.bans,
+                'banned_for': round(max(0.0, self._banned_until - self.clock()), 3)
+            }
+
+    def format_stats(self) -> str:
+        """格式化调度统计，用于日志"""
+        stats = self.stats()
+        text = (f"权重 {stats['used']:.0f}/{stats['limit']:.0f}（{stats['usage']:.0%}，峰值 {stats['peak_usage']:.0%}），"
+                f"并发 {stats['concurrency']}，请求 {stats['requests']} 次，等待 {stats['throttled']} 次")
+        if stats['bans']:
+            text += f"，限流 {stats['bans']} 次"
+        if stats['banned_for']:
+            text += f"，暂停中（剩余 {stats['banned_for']:.0f} 秒）"
+        return text
@@ -0,0 +1,190 @@
+"""
+K线重采样模块 - 把已收盘的1小时K线聚合为4小时、12小时和日线
+
+周期边界按UTC对齐（与币安一致，开盘时间为周期长度的整数倍），周期内最后一根
+1小时K线收盘时对应的高周期K线随之收盘，不需要额外请求交易所。
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+
+from kline_store import KlineBuffer
+
+HOUR_MS = 3600000
+
+# 支持的周期及其毫秒长度
+TIMEFRAME_MS: Dict[str, int] = {
+    '1h': HOUR_MS,
+    '4h': 4 * HOUR_MS,
+    '12h': 12 * HOUR_MS,
+    '1d': 24 * HOUR_MS,
+}
+
+
+def resample_klines(klines: np.ndarray, timeframe_ms: int, base_ms: int = HOUR_MS,
+                    offset_ms: int = 0) -> np.ndarray:
+    """
+    把按时间升序排列的基础周期K线一次性聚合为高周期K线（向量化）
+
+    第一组如果不是从周期边界开始则丢弃（开盘价不完整）；最后一组只有在包含
+    周期内最后一根基础K线时才视为已收盘。
+
+    Args:
+        klines: 形状为 (n, 6) 的基础周期K线，列顺序见 KLINE_COLUMNS
+        timeframe_ms: 目标周期长度（毫秒）
+        base_ms: 基础周期长度（毫秒）
+        offset_ms: 周期边界相对UTC的偏移（毫秒），例如按UTC+8对齐日线时为 -8小时
+
+    Returns:
+        np.ndarray: 已收盘的高周期K线，形状为 (m, 6)
+    """
+    if klines is None or len(klines) == 0:
+        return np.empty((0, 6))
+
+    timestamps = klines[:, 0].astype(np.int64)
+    buckets = timestamps - (timestamps - offset_ms) % timeframe_ms
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    ends = np.concatenate((starts[1:], [len(klines)]))
+
+    bars = np.column_stack([
+        buckets[starts].astype(np.float64),
+        klines[starts, 1],
+        np.maximum.reduceat(klines[:, 2], starts),
+        np.minimum.reduceat(klines[:, 3], starts),
+        klines[ends - 1, 4],
+        np.add.reduceat(klines[:, 5], starts),
+    ])
+
+    keep = np.ones(len(bars), dtype=bool)
+    keep[0] = timestamps[0] == buckets[0]
+    keep[-1] &= timestamps[-1] + base_ms == buckets[-1] + timeframe_ms
+    return bars[keep]
+
+
+class KlineResampler:
+    """
+    单个交易对、单个周期的增量重采样器
+
+    已收盘的高周期K线保存在自己的 KlineBuffer 中，与1小时缓存的列式结构相同，
+    可以直接交给批量信号引擎；正在形成的K线只保存一行聚合值，每根新的1小时K线
+    只做常数次比较和累加。
+    """
+
+    def __init__(self, timeframe: str, capacity: int, base_ms: int = HOUR_MS, offset_ms: int = 0):
+        """
+        初始化重采样器
+
+        Args:
+            timeframe: 目标周期，取自 TIMEFRAME_MS
+            capacity: 保留的高周期K线数量
+            base_ms: 基础周期长度（毫秒）
+            offset_ms: 周期边界相对UTC的偏移（毫秒）
+        """
+        if timeframe not in TIMEFRAME_MS:
+            raise ValueError(f"不支持的周期: {timeframe}")
+        self.timeframe = timeframe
+        self.timeframe_ms = TIMEFRAME_MS[timeframe]
+        self.base_ms = base_ms
+        self.offset_ms = offset_ms
+        self.ratio = self.timeframe_ms // base_ms
+        self.klines = KlineBuffer(capacity)
+        self.source_timestamp: Optional[int] = None  # 最后一根已聚合的基础K线
+        self.last_evaluated: Optional[int] = None    # 最后检测过的高周期K线
+        self._partial: Optional[list] = None         # 正在形成的K线 [开盘时间, 开, 高, 低, 收, 量]
+
+    def __len__(self) -> int:
+        return len(self.klines)
+
+    def _bucket(self, timestamp: int) -> int:
+        return timestamp - (timestamp - self.offset_ms) % self.timeframe_ms
+
+    def seed(self, klines: np.ndarray):
+        """
+        用一段基础周期K线重建（初始化或缓存重建时调用）
+
+        Args:
+            klines: 形状为 (n, 6) 的基础周期K线，通常取自磁盘K线历史
+        """
+        self.klines.clear()
+        self._partial = None
+        self.source_timestamp = None
+        if klines is None or len(klines) == 0:
+            return
+
+        self.klines.extend(resample_klines(klines, self.timeframe_ms, self.base_ms, self.offset_ms))
+        # 最后一个未收盘的周期保留为正在形成的K线
+        last_closed = self.klines.last_timestamp
+        start = 0
+        if last_closed is not None:
+            start = int(np.searchsorted(klines[:, 0], last_closed + self.timeframe_ms))
+        self.update(klines[start:])
+        self.source_timestamp = int(klines[-1, 0])
+
+    def update(self, klines: np.ndarray) -> int:
+        """
+        聚合比 source_timestamp 更新的基础周期K线
+
+        周期内最后一根基础K线到达时该周期收盘；中间缺少基础K线时，在下一个周期的
+        K线到达时按已有数据收盘。
+
+        Returns:
+            int: 新收盘的高周期K线数量
+        """
+        closed = 0
+        for row in klines:
+            timestamp = int(row[0])
+            if self.source_timestamp is not None and timestamp <= self.source_timestamp:
+                continue
+            self.source_timestamp = timestamp
+
+            bucket = self._bucket(timestamp)
+            if self._partial is not None and self._partial[0] != bucket:
+                closed += self._close_partial()
+            if self._partial is None:
+                if timestamp != bucket and not len(self.klines):
+                    continue  # 第一个周期不完整，等下一个周期边界
+                self._partial = [bucket, row[1], row[2], row[3], row[4], row[5]]
+            else:
+                partial = self._partial
+                partial[2] = max(partial[2], row[2])
+                partial[3] = min(partial[3], row[3])
+                partial[4] = row[4]
+                partial[5] += row[5]
+
+            if timestamp + self.base_ms == bucket + self.timeframe_ms:
+                closed += self._close_partial()
+        return closed
+
+    def _close_partial(self) -> int:
+        partial, self._partial = self._partial, None
+        self.klines.append(*partial)
+        return 1
+
+    def sync(self, buffer: KlineBuffer) -> int:
+        """
+        从基础周期缓冲区聚合新收盘的K线
+
+        缓冲区中最早的K线比 source_timestamp 还新（中间断档）时按缺口处理：
+        正在形成的K线照常收盘，之后的K线从新的周期开始。
+
+        Returns:
+            int: 新收盘的高周期K线数量
+        """
+        if not len(buffer):
+            return 0
+        start = 0
+        if self.source_timestamp is not None:
+            start = int(np.searchsorted(buffer.timestamp, self.source_timestamp, side='right'))
+        if start >= len(buffer):
+            return 0
+        return self.update(buffer.to_array(start))
+
+    @property
+    def pending(self) -> int:
+        """尚未检测的已收盘高周期K线数量"""
+        if not len(self.klines):
+            return 0
+        if self.last_evaluated is None:
+            return 1
+        return int(len(self.klines) - np.searchsorted(self.klines.timestamp, self.last_evaluated, side='right'))
@@ -0,0 +1,149 @@
+"""
+信号日志模块 - 按天分段的只追加JSONL信号日志
+
+每个信号在检测到时序列化为一行追加到当天的分段文件（signals_YYYYMMDD.jsonl），
+每轮只写入新信号，写入量与运行时长无关；fsync 按条数或时间间隔批量执行。
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger("SignalJournal")
+
+
+class SignalJournal:
+    """
+    只追加的信号日志
+
+    append() 只把一行写入进程内缓冲；flush() 在每轮结束时把缓冲写入操作系统，
+    距上次 fsync 超过 fsync_interval 秒或累计 fsync_batch 条未落盘记录时才调用 fsync。
+    日期变化时关闭当前分段并打开新的一天的分段。
+    """
+
+    def __init__(self, directory: str, prefix: str = "signals", fsync_interval: float = 60.0,
+                 fsync_batch: int = 100):
+        """
+        初始化信号日志
+
+        Args:
+            directory: 分段文件所在目录
+            prefix: 分段文件名前缀
+            fsync_interval: 两次 fsync 之间的最长秒数
+            fsync_batch: 未 fsync 的记录达到该条数时立即 fsync
+        """
+        self.directory = directory
+        self.prefix = prefix
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = max(1, fsync_batch)
+
+        self._file = None
+        self._day: Optional[str] = None
+        self._unflushed = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        self.records = 0
+        self.bytes_written = 0
+        self.syncs = 0
+
+    def segment_path(self, day: str) -> str:
+        """某一天（YYYYMMDD）的分段文件路径"""
+        return os.path.join(self.directory, f"{self.prefix}_{day}.jsonl")
+
+    def _open_segment(self, day: str):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self._file = open(self.segment_path(day), 'a', encoding='utf-8')
+        self._day = day
+        logger.info(f"信号日志分段: {self.segment_path(day)}")
+
+    def append(self, signal_info: Dict):
+        """追加一个信号（写入缓冲，flush 后才对其他进程可见）"""
+        day = datetime.now().strftime('%Y%m%d')
+        if day != self._day:
+            self._open_segment(day)
+
+        line = json.dumps(signal_info, ensure_ascii=False, separators=(',', ':')) + "\n"
+        self._file.write(line)
+        self._unflushed += 1
+        self._unsynced += 1
+        self.records += 1
+        self.bytes_written += len(line.encode('utf-8'))
+
+    def flush(self, sync: bool = False) -> int:
+        """
+        把缓冲中的新信号写入文件，按批次条件执行 fsync
+
+        Args:
+            sync: 为True时无论批次条件都执行 fsync
+
+        Returns:
+            int: 本次写入的记录数
+        """
+        if self._file is None or not self._unflushed:
+            if sync:
+                self._sync()
+            return 0
+
+        written = self._unflushed
+        self._file.flush()
+        self._unflushed = 0
+        if sync or self._unsynced >= self.fsync_batch or \
+                time.monotonic() - self._last_sync >= self.fsync_interval:
+            self._sync()
+        return written
+
+    def _sync(self):
+        if self._file is None or not self._unsynced:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.syncs += 1
+
+    def close(self):
+        """写入并 fsync 全部记录后关闭当前分段"""
+        if self._file is not None:
+            self.flush(sync=True)
+            self._file.close()
+            self._file = None
+            self._day = None
+
+    def segments(self) -> List[str]:
+        """已有分段的日期（YYYYMMDD），按时间排序"""
+        if not os.path.isdir(self.directory):
+            return []
+        head, tail = f"{self.prefix}_", ".jsonl"
+        return sorted(name[len(head):-len(tail)] for name in os.listdir(self.directory)
+                      if name.startswith(head) and name.endswith(tail))
+
+    def read(self, day: str) -> Iterator[Dict]:
+        """逐条读取某一天的信号；进程中断时可能留下不完整的最后一行，读取时跳过"""
+        path = self.segment_path(day)
+        if day == self._day and self._unflushed:
+            self._file.flush()
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning(f"跳过损坏的信号记录: {path}")
+
+    def stats(self) -> Dict:
+        """返回累计写入的记录数、字节数和 fsync 次数"""
+        return {
+            'segment': self._day,
+            'records': self.records,
+            'bytes': self.bytes_written,
+            'syncs': self.syncs,
+            'unsynced': self._unsynced
+        }
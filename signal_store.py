@@ -0,0 +1,260 @@
+"""
+信号库模块 - 以SQLite保存全部历史信号，按 (交易对, 信号类型, 周期, K线时间) 建索引
+
+信号在每轮结束时以一个事务批量写入（WAL模式），支持按交易对、信号类型和K线时间
+筛选以及按维度聚合统计，数百万条记录下的点查和区间查询仍在毫秒级。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+logger = logging.getLogger("SignalStore")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS signals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    symbol TEXT NOT NULL,
+    type TEXT NOT NULL,
+    timeframe TEXT NOT NULL DEFAULT '1h',
+    bar_time INTEGER NOT NULL,
+    detected_at TEXT,
+    price REAL,
+    late INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+"""
+
+# 建在 timeframe 列上的索引需要在旧库补列之后创建
+_INDEXES = """
+DROP INDEX IF EXISTS signals_symbol_type_bar;
+CREATE UNIQUE INDEX IF NOT EXISTS signals_symbol_type_timeframe_bar ON signals (symbol, type, timeframe, bar_time);
+CREATE INDEX IF NOT EXISTS signals_type_bar ON signals (type, bar_time);
+CREATE INDEX IF NOT EXISTS signals_bar ON signals (bar_time);
+"""
+
+# 可用于聚合分组的列
+GROUP_COLUMNS = ('symbol', 'type', 'timeframe', 'late')
+
+TimeLike = Union[int, float, datetime, str, None]
+
+
+def _to_ms(value: TimeLike) -> Optional[int]:
+    """把 datetime、ISO时间字符串或毫秒时间戳统一为毫秒时间戳"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    return int(value)
+
+
+def _bar_time(signal_info: Dict) -> int:
+    """信号所在K线的开盘时间（毫秒），旧记录没有 kline_timestamp 时由 kline_time 换算"""
+    if signal_info.get('kline_timestamp') is not None:
+        return int(signal_info['kline_timestamp'])
+    return _to_ms(signal_info.get('kline_time') or signal_info['timestamp'])
+
+
+class SignalStore:
+    """
+    SQLite信号库
+
+    add() 只把信号放入待写列表，flush() 在一个事务内批量插入；同一交易对、
+    信号类型、周期和K线时间的信号只保存一次，重复导入不会产生重复记录。
+    """
+
+    def __init__(self, path: str):
+        """
+        初始化信号库
+
+        Args:
+            path: SQLite数据库文件路径
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(signals)")}
+        if 'timeframe' not in columns:
+            self._conn.execute("ALTER TABLE signals ADD COLUMN timeframe TEXT NOT NULL DEFAULT '1h'")
+        self._conn.executescript(_INDEXES)
+        self._lock = threading.Lock()
+        self._pending: List[tuple] = []
+
+    def add(self, signal_info: Dict):
+        """加入一个待写入的信号"""
+        row = (
+            signal_info['symbol'],
+            signal_info['type'],
+            signal_info.get('timeframe', '1h'),
+            _bar_time(signal_info),
+            signal_info.get('timestamp'),
+            signal_info.get('price'),
+            1 if signal_info.get('late') else 0,
+            json.dumps(signal_info, ensure_ascii=False, separators=(',', ':'))
+        )
+        with self._lock:
+            self._pending.append(row)
+
+    def flush(self) -> int:
+        """在一个事务内写入全部待写信号，返回新插入的条数"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            rows, self._pending = self._pending, []
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO signals (symbol, type, timeframe, bar_time, detected_at, price, late, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                self._pending = rows + self._pending
+                raise
+            return self._conn.total_changes - before
+
+    def extend(self, signals: Iterable[Dict]) -> int:
+        """批量写入一组信号（用于导入），返回新插入的条数"""
+        for signal_info in signals:
+            self.add(signal_info)
+        return self.flush()
+
+    @staticmethod
+    def _where(symbol: Optional[str], signal_type: Optional[str], start: TimeLike, end: TimeLike,
+               late: Optional[bool], timeframe: Optional[str] = None) -> tuple:
+        clauses, params = [], []
+        if symbol is not None:
+            clauses.append("symbol = ?")
+            params.append(symbol)
+        if signal_type is not None:
+            clauses.append("type = ?")
+            params.append(signal_type)
+        if timeframe is not None:
+            clauses.append("timeframe = ?")
+            params.append(timeframe)
+        if start is not None:
+            clauses.append("bar_time >= ?")
+            params.append(_to_ms(start))
+        if end is not None:
+            clauses.append("bar_time < ?")
+            params.append(_to_ms(end))
+        if late is not None:
+            clauses.append("late = ?")
+            params.append(1 if late else 0)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, symbol: str = None, signal_type: str = None, start: TimeLike = None, end: TimeLike = None,
+              late: bool = None, limit: int = None, newest_first: bool = True, timeframe: str = None) -> List[Dict]:
+        """
+        按条件查询信号
+
+        Args:
+            symbol: 交易对
+            signal_type: 信号类型，如 double_bottom
+            start: K线时间下限（含），datetime、ISO字符串或毫秒时间戳
+            end: K线时间上限（不含）
+            late: 只查补检信号（True）或实时信号（False）
+            limit: 最多返回的条数
+            newest_first: 按K线时间倒序返回
+            timeframe: K线周期，如 1h、4h
+
+        Returns:
+            List[Dict]: 信号信息（与检测时的 signal_info 相同）
+        """
+        where, params = self._where(symbol, signal_type, start, end, late, timeframe)
+        sql = f"SELECT data FROM signals{where} ORDER BY bar_time {'DESC' if newest_first else 'ASC'}, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def count(self, symbol: str = None, signal_type: str = None, start: TimeLike = None, end: TimeLike = None,
+              late: bool = None, timeframe: str = None) -> int:
+        """按条件统计信号数"""
+        where, params = self._where(symbol, signal_type, start, end, late, timeframe)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM signals{where}", params).fetchone()[0]
+
+    def aggregate(self, group_by: Sequence[str] = ('symbol', 'type'), symbol: str = None, signal_type: str = None,
+                  start: TimeLike = None, end: TimeLike = None, late: bool = None,
+                  timeframe: str = None) -> List[Dict]:
+        """
+        按维度聚合统计
+
+        Args:
+            group_by: 分组列，取自 GROUP_COLUMNS
+            其余参数同 query()
+
+        Returns:
+            List[Dict]: 每组的信号数、首次和最近一次的K线时间（毫秒）、平均价格，按信号数降序
+        """
+        columns = list(group_by)
+        unknown = [column for column in columns if column not in GROUP_COLUMNS]
+        if unknown:
+            raise ValueError(f"不支持的分组列: {unknown}")
+
+        where, params = self._where(symbol, signal_type, start, end, late, timeframe)
+        select = ", ".join(columns + ["COUNT(*)", "MIN(bar_time)", "MAX(bar_time)", "AVG(price)"])
+        sql = f"SELECT {select} FROM signals{where}"
+        if columns:
+            sql += f" GROUP BY {', '.join(columns)}"
+        sql += " ORDER BY COUNT(*) DESC"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        keys = columns + ['count', 'first_bar_time', 'last_bar_time', 'avg_price']
+        return [dict(zip(keys, row)) for row in rows if row[len(columns)]]
+
+    def import_directory(self, directory: str, prefix: str = "signals") -> int:
+        """
+        导入目录中的信号文件：信号日志分段（prefix_YYYYMMDD.jsonl）和旧版每日JSON文件
+        （prefix_YYYYMMDD.json，格式为 {"signals": {交易对: [信号, ...]}}）
+
+        Returns:
+            int: 新插入的条数
+        """
+        if not os.path.isdir(directory):
+            return 0
+        imported = 0
+        for name in sorted(os.listdir(directory)):
+            if not name.startswith(f"{prefix}_"):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    if name.endswith(".jsonl"):
+                        signals = []
+                        for line in f:
+                            try:
+                                signals.append(json.loads(line))
+                            except ValueError:
+                                logger.warning(f"跳过损坏的信号记录: {path}")
+                    elif name.endswith(".json"):
+                        signals = [signal_info for history in json.load(f).get('signals', {}).values()
+                                   for signal_info in history]
+                    else:
+                        continue
+                imported += self.extend(signals)
+            except (ValueError, KeyError) as e:
+                logger.warning(f"导入信号文件失败 {path}: {str(e)}")
+        return imported
+
+    def close(self):
+        """写入待写信号后关闭数据库"""
+        self.flush()
+        with self._lock:
+            self._conn.close()
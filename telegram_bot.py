@@ -2,29 +2,48 @@
 Telegram Bot模块 - 发送交易信号到Telegram频道
 """
 
-import requests
 import json
 import logging
-from typing import Optional, Dict, Any
+from contextlib import nullcontext
+from typing import Optional, Dict, Any, List, Union, Tuple
 from datetime import datetime
 import os
 from config import Config
+from http_client import HttpClient
 
 class TelegramBot:
     """Telegram Bot类，负责发送消息和图片到频道"""
     
-    def __init__(self, bot_token: str = None, channel_id: str = None):
+    # 信号类型映射
+    SIGNAL_NAMES = {
+        'double_top': '🔴 双顶形态',
+        'double_bottom': '🟢 双底形态',
+        'uptrend': '📈 上升趋势',
+        'downtrend': '📉 下降趋势'
+    }
+    
+    def __init__(self, bot_token: str = None, channel_id: str = None, http_client: HttpClient = None,
+                 extra_channel_ids: List[str] = None):
         """
         初始化Telegram Bot
         
         Args:
             bot_token: Telegram Bot Token
             channel_id: Telegram频道ID
+            http_client: 共享的连接池HTTP客户端（可选）
+            extra_channel_ids: 同时接收通知的其他频道（发件箱按 file_id 转发图片）
         """
         self.bot_token = bot_token or Config.TELEGRAM_BOT_TOKEN
         self.channel_id = channel_id or Config.TELEGRAM_CHANNEL_ID
+        extra = Config.TELEGRAM_EXTRA_CHANNEL_IDS if extra_channel_ids is None else extra_channel_ids
+        self.channel_ids = [self.channel_id] + [channel for channel in extra if channel != self.channel_id]
         self.base_url = f"https://api.telegram.org/bot{self.bot_token}"
         self.logger = logging.getLogger("TelegramBot")
+        self.http = http_client or HttpClient(
+            pool_size=Config.HTTP_POOL_SIZE,
+            timeout=Config.REQUEST_TIMEOUT,
+            keep_alive=Config.HTTP_KEEP_ALIVE
+        )
         
         # 验证配置
         if not self.bot_token or not self.channel_id:
@@ -51,7 +70,7 @@ class TelegramBot:
         }
         
         try:
-            response = requests.post(url, json=payload, timeout=Config.REQUEST_TIMEOUT)
+            response = self.http.post(url, json=payload)
             
             if response.status_code == 200:
                 result = response.json()
@@ -69,24 +88,30 @@ class TelegramBot:
             self.logger.error(f"发送消息异常: {str(e)}")
             return False
     
-    def send_photo(self, photo_path: str, caption: str = "", parse_mode: str = "Markdown") -> bool:
+    def send_photo(self, photo: Union[str, bytes], caption: str = "", parse_mode: str = "Markdown",
+                   filename: str = "chart.png") -> bool:
         """
         发送图片到频道
         
         Args:
-            photo_path: 图片文件路径
+            photo: 图片文件路径，或内存中的图片数据（不经过磁盘直接上传）
             caption: 图片说明
             parse_mode: 解析模式
+            filename: 上传图片数据时使用的文件名
             
         Returns:
             bool: 发送是否成功
         """
-        if not os.path.exists(photo_path):
-            self.logger.error(f"图片文件不存在: {photo_path}")
-            return False
+        if isinstance(photo, str):
+            if not os.path.exists(photo):
+                self.logger.error(f"图片文件不存在: {photo}")
+                return False
+            file_size = os.path.getsize(photo)
+            filename = os.path.basename(photo)
+        else:
+            file_size = len(photo)
         
         # 检查文件大小（Telegram限制50MB）
-        file_size = os.path.getsize(photo_path)
         if file_size > 50 * 1024 * 1024:  # 50MB
             self.logger.error(f"图片文件过大: {file_size} bytes")
             return False
@@ -94,21 +119,21 @@ class TelegramBot:
         url = f"{self.base_url}/sendPhoto"
         
         try:
-            with open(photo_path, 'rb') as photo_file:
-                files = {'photo': photo_file}
+            with (open(photo, 'rb') if isinstance(photo, str) else nullcontext(photo)) as photo_file:
+                files = {'photo': (filename, photo_file)}
                 data = {
                     'chat_id': self.channel_id,
                     'caption': caption[:1024] if caption else "",  # Telegram限制1024字符
                     'parse_mode': parse_mode
                 }
                 
-                self.logger.info(f"发送图片: {photo_path}, 大小: {file_size} bytes")
-                response = requests.post(url, files=files, data=data, timeout=30)
+                self.logger.info(f"发送图片: {filename}, 大小: {file_size} bytes")
+                response = self.http.post(url, files=files, data=data, timeout=Config.UPLOAD_TIMEOUT)
                 
                 if response.status_code == 200:
                     result = response.json()
                     if result.get("ok"):
-                        self.logger.info(f"图片发送成功: {photo_path}")
+                        self.logger.info(f"图片发送成功: {filename}")
                         return True
                     else:
                         error_desc = result.get('description', 'Unknown error')
@@ -132,26 +157,67 @@ class TelegramBot:
         
         Args:
             signal_info: 信号信息字典
-            chart_path: 图表文件路径（可选）
+            chart_path: 图表文件路径或图片数据（可选）
             
         Returns:
             bool: 发送是否成功
         """
         # 构建消息文本
-        message = self._format_signal_message(signal_info)
+        message = self.format_signal_message(signal_info)
         
         # 先发送文本消息
         text_sent = self.send_message(message)
         
         # 如果有图表，发送图表
         photo_sent = True
-        if chart_path and os.path.exists(chart_path):
-            caption = f"📊 {signal_info['symbol']} - {signal_info['type']} 信号图表"
-            photo_sent = self.send_photo(chart_path, caption)
+        if chart_path:
+            photo_sent = self.send_signal_chart(signal_info, chart_path)
         
         return text_sent and photo_sent
     
-    def _format_signal_message(self, signal_info: Dict[str, Any]) -> str:
+    def send_signal_chart(self, signal_info: Dict[str, Any], chart: Union[str, bytes],
+                          filename: str = "chart.png") -> bool:
+        """
+        发送信号图表（图表在渲染进程池中完成后单独发送）
+        
+        Args:
+            signal_info: 信号信息字典
+            chart: 图表文件路径或内存中的图片数据
+            filename: 上传图片数据时使用的文件名
+            
+        Returns:
+            bool: 发送是否成功
+        """
+        return self.send_photo(chart, self.format_chart_caption(signal_info), filename=filename)
+    
+    def format_chart_caption(self, signal_info: Dict[str, Any]) -> str:
+        """信号图表的说明文字"""
+        return f"📊 {signal_info['symbol']} {signal_info.get('timeframe', '1h')} - {signal_info['type']} 信号图表"
+    
+    def api_request(self, method: str, data: Dict[str, Any], files: Dict = None) -> Tuple[int, Dict]:
+        """
+        调用一次Bot API（供发件箱使用，不做重试）
+        
+        Args:
+            method: API方法名，如 sendMessage、sendPhoto
+            data: 请求参数
+            files: 上传的文件（可选）
+            
+        Returns:
+            Tuple[int, Dict]: (HTTP状态码, 响应JSON)；网络异常直接抛出
+        """
+        url = f"{self.base_url}/{method}"
+        if files:
+            response = self.http.post(url, data=data, files=files, timeout=Config.UPLOAD_TIMEOUT)
+        else:
+            response = self.http.post(url, json=data)
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        return response.status_code, body
+    
+    def format_signal_message(self, signal_info: Dict[str, Any]) -> str:
         """
         格式化信号消息
         
@@ -166,15 +232,8 @@ class TelegramBot:
         price = signal_info.get('price', 0)
         timestamp = signal_info.get('timestamp', datetime.now())
         
-        # 信号类型映射
-        signal_names = {
-            'double_top': '🔴 双顶形态',
-            'double_bottom': '🟢 双底形态',
-            'uptrend': '📈 上升趋势',
-            'downtrend': '📉 下降趋势'
-        }
-        
-        signal_name = signal_names.get(signal_type, signal_type)
+        signal_name = self.SIGNAL_NAMES.get(signal_type, signal_type)
+        timeframe = signal_info.get('timeframe', '1h')
         
         # 格式化时间
         if isinstance(timestamp, str):
@@ -182,15 +241,21 @@ class TelegramBot:
         else:
             time_str = timestamp.strftime('%Y-%m-%d %H:%M:%S')
         
+        # 补检信号注明信号所在K线的时间
+        late_line = ""
+        if signal_info.get('late'):
+            late_line = f"\n**K线时间**: `{signal_info['kline_time'].replace('T', ' ')}`（补检）"
+        
         message = f"""
 🚨 **交易信号警报** 🚨
 
 **交易对**: `{symbol}`
 **信号类型**: {signal_name}
+**周期**: `{timeframe}`
 **当前价格**: `${price:.4f}`
-**检测时间**: `{time_str}`
+**检测时间**: `{time_str}`{late_line}
 
-**技术指标**:
+**技术指标**（{timeframe}）:
 • EMA21: `{signal_info.get('ema21', 0):.4f}`
 • EMA55: `{signal_info.get('ema55', 0):.4f}`
 • ATR: `{signal_info.get('atr', 0):.4f}`
@@ -200,12 +265,88 @@ class TelegramBot:
         
         return message
     
+    def format_signal_line(self, signal_info: Dict[str, Any]) -> str:
+        """
+        单行信号摘要，用于汇总消息和媒体组图片说明
+        
+        Args:
+            signal_info: 信号信息
+            
+        Returns:
+            str: 信号摘要
+        """
+        signal_type = signal_info.get('type', 'Unknown')
+        symbol = signal_info.get('symbol', 'Unknown')
+        if signal_info.get('timeframe', '1h') != '1h':
+            symbol += f" {signal_info['timeframe']}"
+        line = (f"{symbol} {self.SIGNAL_NAMES.get(signal_type, signal_type)} "
+                f"${signal_info.get('price', 0):.4f}")
+        if signal_info.get('late'):
+            line += f"（补检，K线时间 {signal_info['kline_time'].replace('T', ' ')}）"
+        return line
+    
+    def format_digest_summary(self, signal_infos: List[Dict[str, Any]], limit: int = 4096) -> List[str]:
+        """
+        格式化一批信号的汇总消息
+        
+        Args:
+            signal_infos: 同一轮检测到的信号
+            limit: 单条消息的最大字符数，超过时拆成多条
+            
+        Returns:
+            List[str]: 汇总消息
+        """
+        header = f"🚨 **信号汇总**（{len(signal_infos)}个）`{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}`"
+        messages = []
+        text = header
+        for signal_info in signal_infos:
+            line = f"• {self.format_signal_line(signal_info)}"
+            if len(text) + 1 + len(line) > limit:
+                messages.append(text)
+                text = f"🚨 **信号汇总（续）**\n{line}"
+            else:
+                text += f"\n{line}"
+        messages.append(text)
+        return messages
+    
+    def send_media_group(self, photos: List[Tuple[bytes, str, str]]) -> bool:
+        """
+        一次发送一组图片（2到10张）
+        
+        Args:
+            photos: (图片数据, 文件名, 说明文字) 列表
+            
+        Returns:
+            bool: 发送是否成功
+        """
+        media = []
+        files = {}
+        for index, (image, filename, caption) in enumerate(photos):
+            field = f"photo{index}"
+            media.append({'type': 'photo', 'media': f"attach://{field}", 'caption': caption[:1024]})
+            files[field] = (filename, image)
+        
+        try:
+            status, result = self.api_request('sendMediaGroup', {
+                'chat_id': self.channel_id,
+                'media': json.dumps(media, ensure_ascii=False)
+            }, files)
+            if status == 200 and result.get("ok"):
+                self.logger.info(f"媒体组发送成功: {len(photos)} 张图片")
+                return True
+            self.logger.error(f"媒体组发送失败: HTTP {status}, {result.get('description')}")
+            return False
+            
+        except Exception as e:
+            self.logger.error(f"发送媒体组异常: {str(e)}")
+            return False
+    
     def send_system_status(self, status: str, details: str = "") -> bool:
         """
         发送系统状态消息
         
         Args:
-            status: 状态类型 (started/stopped/error)
+            status: 状态类型 (started/stopped/error/warning/recovered/info)
             details: 详细信息
             
         Returns:
@@ -214,7 +355,9 @@ class TelegramBot:
         status_icons = {
             'started': '🟢',
             'stopped': '🔴',
-            'error': '⚠️',
+            'error': '❌',
+            'warning': '⚠️',
+            'recovered': '✅',
             'info': 'ℹ️'
         }
         
@@ -241,7 +384,7 @@ class TelegramBot:
         url = f"{self.base_url}/getMe"
         
         try:
-            response = requests.get(url, timeout=Config.REQUEST_TIMEOUT)
+            response = self.http.get(url)
             
             if response.status_code == 200:
                 result = response.json()
@@ -274,7 +417,7 @@ class TelegramBot:
         }
         
         try:
-            response = requests.post(url, json=payload, timeout=Config.REQUEST_TIMEOUT)
+            response = self.http.post(url, json=payload)
             
             if response.status_code == 200:
                 result = response.json()
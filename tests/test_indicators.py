@@ -0,0 +1,109 @@
+"""
+增量指标状态与批量指标函数的一致性测试
+
+IndicatorState 逐根推进的 EMA/ATR/RSI/MACD 和EMA收敛度，在连续追加、出现K线缺口
+（自动重建）和手动 reset 之后，都应与对缓冲区全部K线运行批量函数的结果一致。
+"""
+
+import numpy as np
+import pytest
+
+from indicators import IndicatorState, atr_latest, ema_series, macd_series, rsi_series
+from kline_store import KlineBuffer
+
+HOUR = 3600000
+# 增量与批量的浮点运算顺序不同（求和、种子），只允许舍入误差
+RTOL = 1e-9
+
+
+def make_klines(count: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    closes = 100 + np.cumsum(rng.normal(0, 1, count))
+    opens = np.r_[closes[0], closes[:-1]]
+    highs = np.maximum(opens, closes) + rng.random(count)
+    lows = np.minimum(opens, closes) - rng.random(count)
+    timestamps = 1700000000000 // HOUR * HOUR + HOUR * np.arange(count)
+    return np.column_stack([timestamps, opens, highs, lows, closes, rng.random(count) * 1000])
+
+
+def assert_matches_batch(state: IndicatorState, buffer: KlineBuffer):
+    highs, lows, closes = buffer.high, buffer.low, buffer.close
+    for period in (21, 55, 144):
+        expected = ema_series(closes, period)
+        assert state.ema_value(period) == pytest.approx(expected[-1], rel=RTOL)
+        assert state.prev_ema_value(period) == pytest.approx(expected[-2], rel=RTOL)
+
+    assert state.atr.value == pytest.approx(float(atr_latest(highs, lows, closes, 14)), rel=RTOL)
+    assert state.rsi.value == pytest.approx(rsi_series(closes, 14)[-1], rel=RTOL)
+
+    macd_line, _, histogram = macd_series(closes, 12, 26, 9)
+    assert state.macd.macd == pytest.approx(macd_line[-1], rel=RTOL)
+    assert state.macd.histogram == pytest.approx(histogram[-1], rel=RTOL)
+
+    # 收敛度：最近21根K线的EMA宽度均值 / ATR
+    atr = state.atr.value
+    emas = np.vstack([ema_series(closes, period)[-21:] for period in (21, 55, 144)])
+    expected_ratio = float((emas.max(axis=0) - emas.min(axis=0)).mean() / atr)
+    assert state.ema_convergence(atr) == pytest.approx(expected_ratio, rel=RTOL)
+
+
+def test_incremental_matches_batch():
+    klines = make_klines(600)
+    buffer = KlineBuffer(1000)
+    state = IndicatorState()
+
+    buffer.extend(klines[:300])
+    assert state.sync(buffer) == 300
+    assert_matches_batch(state, buffer)
+
+    # 逐根追加只推进新K线
+    for i in range(300, 600):
+        buffer.extend(klines[i:i + 1])
+        assert state.sync(buffer) == 1
+    assert state.rebuilds == 1
+    assert_matches_batch(state, buffer)
+
+
+def test_rebuild_after_gap():
+    klines = make_klines(600, seed=1)
+    buffer = KlineBuffer(1000)
+    state = IndicatorState()
+    buffer.extend(klines[:300])
+    state.sync(buffer)
+
+    # 缺少第300根K线：不连续，应按缓冲区全部K线重建
+    buffer.extend(klines[301:])
+    assert state.sync(buffer) == len(buffer)
+    assert state.rebuilds == 2
+    assert_matches_batch(state, buffer)
+
+
+def test_rebuild_after_reset():
+    klines = make_klines(400, seed=2)
+    buffer = KlineBuffer(1000)
+    state = IndicatorState()
+    buffer.extend(klines)
+    state.sync(buffer)
+
+    state.reset()
+    assert state.ema_convergence(1.0) == 1.0
+    assert state.sync(buffer) == len(buffer)
+    assert_matches_batch(state, buffer)
+
+    # 缓冲区被重新填充（例如重新初始化）后同样从头重建
+    buffer.clear()
+    buffer.extend(make_klines(300, seed=3))
+    assert state.sync(buffer) == len(buffer)
+    assert_matches_batch(state, buffer)
+
+
+def test_convergence_not_ready():
+    buffer = KlineBuffer(1000)
+    state = IndicatorState()
+    buffer.extend(make_klines(143))
+    state.sync(buffer)
+    # EMA144 尚无值
+    assert state.ema_convergence(1.0) == 1.0
+    buffer.extend(make_klines(144)[-1:])
+    state.sync(buffer)
+    assert state.ema_convergence(0.0) == 1.0
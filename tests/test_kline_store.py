@@ -0,0 +1,221 @@
+"""
+K线存储测试
+
+KlineBuffer 的逐根/批量追加、2 倍容量搬移、同一时间戳覆盖和超出容量截断与普通列表
+实现的参照结果一致；KlineHistory 打开时按最短的列截齐异常退出留下的列文件，追加写入
+失败时把已写入的列截回原长度，之后的追加仍与时间戳对齐。
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+import kline_store
+from kline_store import KLINE_COLUMNS, KlineBuffer, KlineHistory
+
+HOUR = 3600000
+
+
+def make_klines(count: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    closes = 100 + np.cumsum(rng.normal(0, 1, count))
+    opens = np.r_[closes[0], closes[:-1]]
+    highs = np.maximum(opens, closes) + rng.random(count)
+    lows = np.minimum(opens, closes) - rng.random(count)
+    timestamps = 1700000000000 // HOUR * HOUR + HOUR * np.arange(count)
+    return np.column_stack([timestamps, opens, highs, lows, closes, rng.random(count) * 1000])
+
+
+def column_lengths(history: KlineHistory):
+    return {name: os.path.getsize(history._column_path(name)) // np.dtype(history.DTYPES[name]).itemsize
+            for name in KLINE_COLUMNS}
+
+
+def test_recover_trims_to_shortest_column(tmp_path):
+    klines = make_klines(10)
+    history = KlineHistory(str(tmp_path), "AAAUSDT")
+    assert history.append(klines) == 10
+
+    # 模拟写入中途退出：close 列只写到第7根，volume 列多出半根的残留字节
+    os.truncate(history._column_path('close'), 7 * 8)
+    with open(history._column_path('volume'), 'ab') as f:
+        f.write(b"\x00" * 4)
+
+    history = KlineHistory(str(tmp_path), "AAAUSDT")
+    assert len(history) == 7
+    assert column_lengths(history) == {name: 7 for name in KLINE_COLUMNS}
+    assert np.array_equal(history.load(), klines[:7])
+
+    # 截齐后继续追加，时间戳之后的K线重新写入
+    assert history.append(klines) == 3
+    assert np.array_equal(history.load(), klines)
+
+
+def test_recover_missing_column_file(tmp_path):
+    history = KlineHistory(str(tmp_path), "AAAUSDT")
+    history.append(make_klines(5))
+    os.remove(history._column_path('high'))
+
+    history = KlineHistory(str(tmp_path), "AAAUSDT")
+    assert len(history) == 0
+    assert column_lengths(history) == {name: 0 for name in KLINE_COLUMNS}
+    assert history.last_timestamp is None
+
+
+def failing_open(fail_name: str):
+    """只让指定列文件的追加写入抛出 OSError"""
+    def open_(path, mode='r', *args, **kwargs):
+        if 'a' in mode and os.path.basename(path) == f"{fail_name}.bin":
+            raise OSError(28, "No space left on device")
+        return open(path, mode, *args, **kwargs)
+    return open_
+
+
+def test_append_rolls_back_on_write_error(tmp_path, monkeypatch):
+    klines = make_klines(20)
+    history = KlineHistory(str(tmp_path), "AAAUSDT")
+    history.append(klines[:10])
+
+    # 时间戳列最后写入：close 失败时 open/high/low 已多写了10根
+    monkeypatch.setattr(kline_store, "open", failing_open('close'), raising=False)
+    with pytest.raises(OSError):
+        history.append(klines[10:])
+    assert len(history) == 10
+    assert history.last_timestamp == int(klines[9, 0])
+    assert column_lengths(history) == {name: 10 for name in KLINE_COLUMNS}
+    assert not history._dirty
+
+    monkeypatch.undo()
+    assert history.append(klines[10:]) == 10
+    assert np.array_equal(history.load(), klines)
+    assert np.array_equal(KlineHistory(str(tmp_path), "AAAUSDT").load(), klines)
+
+
+def test_append_retries_failed_truncate(tmp_path, monkeypatch):
+    klines = make_klines(20)
+    history = KlineHistory(str(tmp_path), "AAAUSDT")
+    history.append(klines[:10])
+
+    def failing_truncate(path, length):
+        raise OSError(5, "Input/output error")
+
+    # 写入和截齐都失败：保持待截齐状态，下一次追加前先截齐
+    monkeypatch.setattr(kline_store, "open", failing_open('volume'), raising=False)
+    monkeypatch.setattr(kline_store.os, "truncate", failing_truncate)
+    with pytest.raises(OSError):
+        history.append(klines[10:])
+    assert history._dirty
+    assert len(history) == 10
+    assert column_lengths(history)['open'] == 20
+
+    monkeypatch.undo()
+    assert history.append(klines[10:]) == 10
+    assert not history._dirty
+    assert column_lengths(history) == {name: 20 for name in KLINE_COLUMNS}
+    assert np.array_equal(history.load(), klines)
+
+
+class ListBuffer:
+    """用普通列表实现的参照缓冲区：只保留最近 capacity 根，同一时间戳覆盖，更早的忽略"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.rows = []
+
+    def append(self, row) -> bool:
+        row = list(row)
+        if self.rows and row[0] <= self.rows[-1][0]:
+            if row[0] == self.rows[-1][0]:
+                self.rows[-1] = row
+            return False
+        self.rows.append(row)
+        del self.rows[:-self.capacity]
+        return True
+
+    def to_array(self) -> np.ndarray:
+        return np.array(self.rows, dtype=np.float64).reshape(-1, 6)
+
+
+def assert_same(buffer: KlineBuffer, reference: ListBuffer):
+    expected = reference.to_array()
+    assert len(buffer) == len(expected)
+    assert np.array_equal(buffer.to_array(), expected)
+    assert buffer.timestamp.dtype == np.int64
+    assert buffer.last_timestamp == (int(expected[-1, 0]) if len(expected) else None)
+    for i, name in enumerate(KLINE_COLUMNS):
+        assert np.array_equal(getattr(buffer, name), expected[:, i])
+
+
+def test_buffer_append_compacts_at_twice_capacity():
+    klines = make_klines(100)
+    buffer = KlineBuffer(10)
+    reference = ListBuffer(10)
+    for row in klines:
+        assert buffer.append(int(row[0]), *row[1:]) == reference.append(row)
+        # 底层数组写满 2 倍容量时才搬移，视图始终是最近 capacity 根
+        assert buffer._end <= 2 * buffer.capacity
+        assert_same(buffer, reference)
+
+
+def test_buffer_same_timestamp_overwrites():
+    klines = make_klines(30)
+    buffer = KlineBuffer(20)
+    buffer.extend(klines[:25])
+
+    # append：同一时间戳覆盖最新一根，更早的K线忽略
+    updated = klines[24].copy()
+    updated[4] += 1.5
+    assert not buffer.append(int(updated[0]), *updated[1:])
+    assert buffer.close[-1] == updated[4]
+    assert not buffer.append(int(klines[10, 0]), *klines[10, 1:])
+    assert len(buffer) == 20
+
+    # extend：与最新一根同时间戳的行覆盖写入，其后的新K线追加
+    rows = klines[23:30].copy()
+    rows[1, 4] += 2.5
+    assert buffer.extend(rows) == 5
+    assert buffer.to_array()[-6, 4] == rows[1, 4]
+    assert np.array_equal(buffer.to_array()[-5:], klines[25:30])
+    # 更早的K线（klines[23]）不受影响
+    assert buffer.to_array()[-7, 4] == klines[23, 4]
+
+
+def test_buffer_extend_truncates_to_capacity():
+    klines = make_klines(50)
+    buffer = KlineBuffer(8)
+    buffer.extend(klines[:3])
+    assert buffer.extend(klines[3:50]) == 8
+    assert np.array_equal(buffer.to_array(), klines[-8:])
+
+    buffer.clear()
+    assert buffer.last_timestamp is None
+    assert buffer.extend(klines) == 8
+    assert np.array_equal(buffer.to_array(), klines[-8:])
+
+
+@pytest.mark.parametrize("capacity", [1, 7, 64])
+def test_buffer_matches_list_after_random_writes(capacity):
+    rng = np.random.default_rng(capacity)
+    klines = make_klines(3000, seed=capacity)
+    buffer = KlineBuffer(capacity)
+    reference = ListBuffer(capacity)
+    position = 0
+    while position < len(klines):
+        # 随机混合单根追加、批量追加（含重叠的旧K线和超过容量的批次）
+        count = int(rng.integers(1, 3 * capacity + 2))
+        start = max(0, position - int(rng.integers(0, 3)))
+        rows = klines[start:position + count].copy()
+        rows[:, 4] += rng.normal(0, 0.01, len(rows))
+        if rng.random() < 0.5:
+            for row in rows:
+                buffer.append(int(row[0]), *row[1:])
+                reference.append(row)
+        else:
+            last = reference.rows[-1][0] if reference.rows else None
+            newer = len(rows) if last is None else int(np.sum(rows[:, 0] > last))
+            assert buffer.extend(rows) == min(capacity, newer)
+            for row in rows:
+                reference.append(row)
+        position += count
+        assert_same(buffer, reference)
@@ -0,0 +1,115 @@
+"""
+K线推送订阅测试
+
+用本地 KlineReplayServer 回放组合流消息：只有已收盘（x=true）的K线回调
+on_closed_kline，服务端断开后客户端自动重连并回调 on_reconnect。
+"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from kline_stream import BinanceKlineStream, KlineReplayServer
+
+pytest.importorskip("websocket")
+
+HOUR = 3600000
+START = 1700000000000 // HOUR * HOUR
+
+
+def kline_message(symbol: str, timestamp: int, closed: bool, close: float = 100.0) -> str:
+    return json.dumps({
+        "stream": f"{symbol.lower()}@kline_1h",
+        "data": {
+            "e": "kline", "E": timestamp + HOUR, "s": symbol,
+            "k": {
+                "t": timestamp, "T": timestamp + HOUR - 1, "s": symbol, "i": "1h",
+                "o": str(close), "h": str(close + 1), "l": str(close - 1), "c": str(close),
+                "v": "10", "x": closed
+            }
+        }
+    })
+
+
+def wait_until(condition, timeout: float = 5.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def replay():
+    servers = []
+
+    def start(messages):
+        server = KlineReplayServer(messages)
+        server.start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def test_only_closed_klines_reach_callback(replay):
+    messages = [
+        kline_message("AAAUSDT", START, False, close=100.0),
+        kline_message("AAAUSDT", START, True, close=101.0),
+        kline_message("BBBUSDT", START, False),
+        json.dumps({"result": None, "id": 1}),  # 非K线消息
+        kline_message("AAAUSDT", START + HOUR, False),
+        kline_message("BBBUSDT", START, True),
+        kline_message("AAAUSDT", START + HOUR, True, close=102.0),
+    ]
+    server = replay(messages)
+    events = []
+    stream = BinanceKlineStream(["AAAUSDT", "BBBUSDT"], "1h", events.append, url=server.url)
+    stream.start()
+    try:
+        assert wait_until(lambda: len(events) == 3)
+        time.sleep(0.1)
+    finally:
+        stream.stop()
+
+    assert [(event.symbol, int(event.row[0])) for event in events] == [
+        ("AAAUSDT", START), ("BBBUSDT", START), ("AAAUSDT", START + HOUR)
+    ]
+    assert all(event.closed for event in events)
+    assert events[0].row[4] == 101.0
+    assert events[0].close_time == START + HOUR - 1
+
+
+def test_reconnect_calls_on_reconnect(replay):
+    server = replay([kline_message("AAAUSDT", START, True)])
+    events = []
+    reconnected = []
+    reconnect_event = threading.Event()
+
+    def on_reconnect(symbols):
+        reconnected.append(symbols)
+        reconnect_event.set()
+
+    stream = BinanceKlineStream(["AAAUSDT"], "1h", events.append, url=server.url,
+                                on_reconnect=on_reconnect, reconnect_delay=0.05)
+    stream.start()
+    try:
+        assert wait_until(lambda: len(events) == 1 and stream.connected == 1)
+        # 首次连接不算重连
+        assert reconnected == []
+
+        # 服务端断开所有连接后在同一端口恢复，客户端应重连并重新收到回放的K线
+        server.stop()
+        server.start()
+        assert reconnect_event.wait(5)
+        assert wait_until(lambda: len(events) == 2)
+    finally:
+        stream.stop()
+
+    assert reconnected == [["AAAUSDT"]]
+    assert stream.connected == 0
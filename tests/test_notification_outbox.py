@@ -0,0 +1,279 @@
+"""
+通知发件箱测试
+
+用记录请求的桩 bot 代替Telegram：同一交易对在同一聊天按入队顺序发送，429只暂停
+对应聊天，5xx重试到 max_attempts 后标记失败，重启后继续投递数据库中未发送的消息。
+多频道时图片只上传一次，其余频道引用返回的 file_id；上传失败或响应中没有 file_id 时
+由下一个频道接手上传，启动时修复等待已失败或已删除上传的副本。
+"""
+
+import json
+import random
+import threading
+import time
+
+import pytest
+
+from notification_outbox import TelegramOutbox
+
+
+class StubBot:
+    """记录每次 api_request，respond(method, data, files) 返回 (状态码, 响应JSON)"""
+
+    def __init__(self, channel_ids=("c1",), respond=None, delay: float = 0.0):
+        self.channel_ids = list(channel_ids)
+        self.channel_id = self.channel_ids[0]
+        self.respond = respond or (lambda method, data, files: (200, {'ok': True, 'result': {}}))
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def api_request(self, method, data, files=None):
+        if self.delay:
+            time.sleep(random.uniform(0, self.delay))
+        with self._lock:
+            self.calls.append({'method': method, 'data': data, 'files': files, 'time': time.monotonic()})
+        return self.respond(method, data, files)
+
+    def texts(self, chat_id):
+        return [call['data']['text'] for call in self.calls if call['data']['chat_id'] == chat_id]
+
+
+@pytest.fixture
+def make_outbox(tmp_path):
+    outboxes = []
+
+    def make(bot, **kwargs):
+        options = {'workers': 4, 'chat_rate_per_minute': 60000, 'chat_burst': 100,
+                   'global_rate_per_second': 1000, 'backoff_base': 0.01}
+        options.update(kwargs)
+        outbox = TelegramOutbox(bot, str(tmp_path / "outbox.db"), **options)
+        outboxes.append(outbox)
+        return outbox
+
+    yield make
+    for outbox in outboxes:
+        outbox.stop()
+
+
+def wait_until(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_order_per_key_and_chat(make_outbox):
+    bot = StubBot(channel_ids=("c1", "c2"), delay=0.005)
+    outbox = make_outbox(bot)
+    expected = {}
+    for i in range(20):
+        for key in ("AAAUSDT", "BBBUSDT", "CCCUSDT"):
+            outbox.enqueue_message(key, f"{key} {i}")
+            expected.setdefault(key, []).append(f"{key} {i}")
+
+    outbox.start()
+    assert outbox.flush(timeout=10)
+
+    assert len(bot.calls) == 2 * 3 * 20
+    for chat_id in ("c1", "c2"):
+        texts = bot.texts(chat_id)
+        for key, sequence in expected.items():
+            assert [text for text in texts if text.startswith(key)] == sequence
+
+
+def test_429_pauses_only_that_chat(make_outbox):
+    throttled = []
+
+    def respond(method, data, files):
+        if data['chat_id'] == "c1" and not throttled:
+            throttled.append(time.monotonic())
+            return 429, {'ok': False, 'parameters': {'retry_after': 1}}
+        return 200, {'ok': True, 'result': {}}
+
+    bot = StubBot(channel_ids=("c1", "c2"), respond=respond)
+    # 单个发送线程：c1 的第二条消息只可能在429之后才被取出
+    outbox = make_outbox(bot, workers=1)
+    outbox.enqueue_message("AAAUSDT", "c1 first", chat_id="c1")
+    outbox.enqueue_message("BBBUSDT", "c1 other key", chat_id="c1")
+    for i in range(5):
+        outbox.enqueue_message("AAAUSDT", f"c2 {i}", chat_id="c2")
+    outbox.start()
+
+    # c2 不受影响，c1 暂停期间同一聊天的其他交易对也不发送
+    assert wait_until(lambda: len(bot.texts("c2")) == 5, timeout=0.8)
+    assert bot.texts("c1") == ["c1 first"]
+    assert outbox.flush(timeout=5)
+
+    resumed = [call['time'] for call in bot.calls if call['data']['chat_id'] == "c1"][1:]
+    assert len(resumed) == 2
+    assert min(resumed) - throttled[0] >= 0.9
+    assert outbox.stats()['throttled'] == 1
+    # 429 不计入尝试次数
+    assert outbox.stats()['retried'] == 0 and outbox.stats()['failed'] == 0
+
+
+def test_5xx_retries_until_max_attempts(make_outbox):
+    def respond(method, data, files):
+        if data['text'] == "broken":
+            return 502, {'ok': False, 'description': "Bad Gateway"}
+        return 200, {'ok': True, 'result': {}}
+
+    bot = StubBot(respond=respond)
+    outbox = make_outbox(bot, max_attempts=4)
+    outbox.enqueue_message("AAAUSDT", "broken")
+    outbox.enqueue_message("AAAUSDT", "next")
+    outbox.start()
+    assert outbox.flush(timeout=5)
+
+    # 前一条最终失败后同一交易对的下一条继续发送
+    assert bot.texts("c1") == ["broken"] * 4 + ["next"]
+    stats = outbox.stats()
+    assert stats['retried'] == 3
+    assert stats['failed'] == 1
+    assert stats['dead_letters'] == 1
+    attempts, error = outbox._conn.execute(
+        "SELECT attempts, last_error FROM outbox WHERE status = 'failed'"
+    ).fetchone()
+    assert attempts == 4
+    assert "502" in error
+
+
+def test_restart_resumes_pending(make_outbox):
+    first = make_outbox(StubBot())
+    for i in range(3):
+        first.enqueue_message("AAAUSDT", f"message {i}")
+    first.enqueue_message("BBBUSDT", "other")
+    assert first.depth() == 4
+    first.stop()
+
+    # 未启动发送线程就退出：新进程打开同一个数据库后继续投递
+    bot = StubBot()
+    second = make_outbox(bot)
+    assert second.depth() == 4
+    second.start()
+    assert second.flush(timeout=5)
+
+    texts = bot.texts("c1")
+    assert [text for text in texts if text.startswith("message")] == ["message 0", "message 1", "message 2"]
+    assert "other" in texts
+    assert second.stats()['sent'] == 4
+
+
+def photo_result(method, files, prefix="file"):
+    """模拟 sendPhoto/sendMediaGroup 的响应：每张上传的图片返回两个尺寸，最后一个最大"""
+    if method == 'sendMediaGroup':
+        fields = sorted(field for field in files if field != 'photo')
+        return [{'photo': [{'file_id': f"{prefix}-{field}-small"}, {'file_id': f"{prefix}-{field}"}]}
+                for field in fields]
+    return {'photo': [{'file_id': f"{prefix}-small"}, {'file_id': prefix}]}
+
+
+def upload_bot(fail_chats=(), empty_chats=()):
+    """上传到 fail_chats 返回400，上传到 empty_chats 成功但响应中没有图片，其余返回 file_id"""
+    def respond(method, data, files):
+        if files and data['chat_id'] in fail_chats:
+            return 400, {'ok': False, 'description': "Bad Request"}
+        if files and data['chat_id'] not in empty_chats:
+            return 200, {'ok': True, 'result': photo_result(method, files, prefix=f"id-{data['chat_id']}")}
+        return 200, {'ok': True, 'result': {}}
+
+    return StubBot(channel_ids=("c1", "c2", "c3"), respond=respond)
+
+
+def calls_by_chat(bot):
+    return {call['data']['chat_id']: call for call in bot.calls}
+
+
+def json_media(call):
+    media = call['data']['media']
+    return json.loads(media) if isinstance(media, str) else media
+
+
+def test_photo_uploaded_once_and_file_id_fanned_out(make_outbox):
+    bot = upload_bot()
+    outbox = make_outbox(bot)
+    outbox.enqueue_photo("AAAUSDT", b"png-bytes", "chart.png", caption="AAAUSDT chart")
+    outbox.start()
+    assert outbox.flush(timeout=5)
+
+    calls = calls_by_chat(bot)
+    assert len(bot.calls) == 3
+    assert calls["c1"]['files'] == {'photo': ("chart.png", b"png-bytes")}
+    for chat_id in ("c2", "c3"):
+        assert calls[chat_id]['files'] is None
+        assert calls[chat_id]['data']['photo'] == "id-c1"
+        assert calls[chat_id]['data']['caption'] == "AAAUSDT chart"
+    assert calls["c1"]['time'] < min(calls["c2"]['time'], calls["c3"]['time'])
+    assert outbox.stats()['reused_uploads'] == 2
+
+
+def test_media_group_copies_reference_file_ids(make_outbox):
+    bot = upload_bot()
+    outbox = make_outbox(bot)
+    outbox.enqueue_media_group("digest", [(b"one", "a.png", "first"), (b"two", "b.png", "second")])
+    outbox.start()
+    assert outbox.flush(timeout=5)
+
+    calls = calls_by_chat(bot)
+    assert set(calls["c1"]['files']) == {"photo0", "photo1"}
+    assert [entry['media'] for entry in json_media(calls["c1"])] == ["attach://photo0", "attach://photo1"]
+    for chat_id in ("c2", "c3"):
+        assert calls[chat_id]['files'] is None
+        media = json_media(calls[chat_id])
+        assert [entry['media'] for entry in media] == ["id-c1-photo0", "id-c1-photo1"]
+        assert [entry['caption'] for entry in media] == ["first", "second"]
+
+
+@pytest.mark.parametrize("failure", ["rejected", "no_file_id"])
+def test_failed_upload_handed_over_to_next_channel(make_outbox, failure):
+    if failure == "rejected":
+        bot = upload_bot(fail_chats=("c1",))
+    else:
+        bot = upload_bot(empty_chats=("c1",))
+    outbox = make_outbox(bot)
+    outbox.enqueue_photo("AAAUSDT", b"png-bytes", "chart.png")
+    outbox.enqueue_message("AAAUSDT", "after the chart")
+    outbox.start()
+    assert outbox.flush(timeout=5)
+
+    photos = {call['data']['chat_id']: call for call in bot.calls if call['method'] == 'sendPhoto'}
+    # c2 接手上传图片，c3 引用 c2 上传得到的 file_id
+    assert photos["c2"]['files'] == {'photo': ("chart.png", b"png-bytes")}
+    assert photos["c3"]['files'] is None
+    assert photos["c3"]['data']['photo'] == "id-c2"
+    assert photos["c2"]['time'] < photos["c3"]['time']
+    # 各频道的后续消息仍在图片之后发送
+    for chat_id in ("c1", "c2", "c3"):
+        methods = [call['method'] for call in bot.calls if call['data']['chat_id'] == chat_id]
+        assert methods == ['sendPhoto', 'sendMessage']
+    assert outbox.stats()['failed'] == (1 if failure == "rejected" else 0)
+
+
+def test_orphaned_copies_repaired_on_start(make_outbox):
+    first = make_outbox(upload_bot())
+    failed_parent = first.enqueue_photo("AAAUSDT", b"one", "a.png")
+    missing_parent = first.enqueue_photo("BBBUSDT", b"two", "b.png")
+    # 模拟旧版本在上传消息状态变化后、处理副本前退出
+    first._conn.execute("UPDATE outbox SET status = 'failed' WHERE id = ?", (failed_parent,))
+    first._conn.execute("DELETE FROM outbox WHERE id = ?", (missing_parent,))
+    first.stop()
+
+    bot = upload_bot()
+    second = make_outbox(bot)
+    rows = second._conn.execute(
+        "SELECT key, chat_id, status, photo IS NOT NULL FROM outbox WHERE id != ? ORDER BY id", (failed_parent,)
+    ).fetchall()
+    assert rows == [
+        ("AAAUSDT", "c2", "pending", 1), ("AAAUSDT", "c3", "waiting", 0),
+        ("BBBUSDT", "c2", "failed", 0), ("BBBUSDT", "c3", "failed", 0),
+    ]
+    second.start()
+    assert second.flush(timeout=5)
+
+    photos = {call['data']['chat_id']: call for call in bot.calls}
+    assert set(photos) == {"c2", "c3"}
+    assert photos["c2"]['files'] == {'photo': ("a.png", b"one")}
+    assert photos["c3"]['data']['photo'] == "id-c2"
@@ -0,0 +1,81 @@
+"""
+区间极值索引测试
+
+RangeExtrema 对任意区间返回的最高价/最低价及其位置，在批量构建、逐根追加（环形数组
+回绕）和缓冲区重新填充之后，都应与对 KlineBuffer 切片直接求 np.max/np.min
+（位置取 np.argmax/np.argmin，并列时取最早的）一致。
+"""
+
+import numpy as np
+import pytest
+
+from kline_store import KlineBuffer
+from range_index import RangeExtrema
+
+HOUR = 3600000
+
+
+def make_klines(count: int, seed: int = 0, start: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    # 价格取整到0.5，制造大量并列的最高价/最低价
+    closes = np.round(100 + np.cumsum(rng.normal(0, 1, count)) * 2) / 2
+    opens = np.r_[closes[0], closes[:-1]]
+    highs = np.maximum(opens, closes) + np.round(rng.random(count) * 2) / 2
+    lows = np.minimum(opens, closes) - np.round(rng.random(count) * 2) / 2
+    timestamps = 1700000000000 // HOUR * HOUR + HOUR * (start + np.arange(count))
+    return np.column_stack([timestamps, opens, highs, lows, closes, rng.random(count) * 1000])
+
+
+def assert_random_windows(index: RangeExtrema, buffer: KlineBuffer, rng, count: int = 50):
+    n = len(buffer)
+    assert len(index) == n
+    highs, lows = buffer.high, buffer.low
+    windows = [(0, n - 1), (n - 1, n - 1)] + [tuple(sorted(rng.integers(0, n, 2))) for _ in range(count)]
+    for start, end in windows:
+        start, end = int(start), int(end)
+        assert index.max_high(start, end) == (np.max(highs[start:end + 1]),
+                                              start + int(np.argmax(highs[start:end + 1])))
+        assert index.min_low(start, end) == (np.min(lows[start:end + 1]),
+                                             start + int(np.argmin(lows[start:end + 1])))
+
+
+@pytest.mark.parametrize("capacity", [2, 5, 64, 1000])
+def test_matches_numpy_over_random_windows(capacity):
+    rng = np.random.default_rng(capacity)
+    klines = make_klines(3 * capacity + 200, seed=capacity)
+    buffer = KlineBuffer(capacity)
+    index = RangeExtrema(capacity)
+
+    # 首次同步批量构建
+    buffer.extend(klines[:capacity // 2 + 1])
+    index.sync(buffer)
+    assert_random_windows(index, buffer, rng)
+
+    # 逐根和小批量追加（上次同步的最新K线仍在缓冲区内），越过容量后环形数组回绕
+    position = capacity // 2 + 1
+    while position < len(klines):
+        step = int(rng.integers(1, min(3, capacity - 1) + 1))
+        buffer.extend(klines[position:position + step])
+        assert index.sync(buffer) == min(step, len(klines) - position)
+        position += step
+        assert_random_windows(index, buffer, rng, count=10)
+    assert index.rebuilds == 1
+
+
+def test_rebuild_after_refill():
+    rng = np.random.default_rng(7)
+    buffer = KlineBuffer(300)
+    index = RangeExtrema(300)
+    buffer.extend(make_klines(500, seed=1))
+    index.sync(buffer)
+
+    # 缓冲区重新初始化为另一段K线（时间戳回退）时整体重建
+    buffer.clear()
+    buffer.extend(make_klines(200, seed=2, start=-1000))
+    assert index.sync(buffer) == 200
+    assert index.rebuilds == 2
+    assert_random_windows(index, buffer, rng, count=200)
+
+    buffer.clear()
+    assert index.sync(buffer) == 0
+    assert len(index) == 0